@@ -26,6 +26,7 @@ from rest_framework.serializers import ValidationError
 from stackdio.api.blueprints import serializers, filters, models, mixins
 from stackdio.api.formulas.models import FormulaVersion
 from stackdio.api.formulas.serializers import FormulaVersionSerializer
+from stackdio.core.mixins import ConditionalRetrieveMixin
 from stackdio.core.permissions import StackdioModelPermissions, StackdioObjectPermissions
 from stackdio.core.serializers import ObjectPropertiesSerializer
 from stackdio.core.viewsets import (
@@ -42,7 +43,8 @@ class BlueprintListAPIView(generics.ListCreateAPIView):
     """
     Displays a list of all blueprints visible to you.
     """
-    queryset = models.Blueprint.objects.all()
+    # Look up the cached fields for the whole page at once
+    queryset = models.Blueprint.objects.prefetch_cached('stack_count', 'get_cached_label_list')
     permission_classes = (StackdioModelPermissions,)
     filter_backends = (DjangoObjectPermissionsFilter, DjangoFilterBackend)
     filter_class = filters.BlueprintFilter
@@ -68,7 +70,7 @@ class BlueprintListAPIView(generics.ListCreateAPIView):
                 blueprint.formula_versions.create(formula=formula, version=formula.default_version)
 
 
-class BlueprintDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class BlueprintDetailAPIView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = models.Blueprint.objects.all()
     serializer_class = serializers.BlueprintSerializer
     permission_classes = (StackdioObjectPermissions,)
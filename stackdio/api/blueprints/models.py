@@ -22,17 +22,18 @@ import logging
 import six
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
-from django.core.cache import cache
 from django.db import models
+from django.db.models import Count
 from django.dispatch import receiver
 from django_extensions.db.models import (
     TimeStampedModel,
     TitleDescriptionModel,
     TitleSlugDescriptionModel,
 )
+from stackdio.core.caching import delete_cached
 from stackdio.core.decorators import django_cache
 from stackdio.core.fields import JSONField
-from stackdio.core.models import SearchQuerySet
+from stackdio.core.models import SearchQuerySet, get_label_lists
 from stackdio.core.notifications.decorators import add_subscribed_channels
 
 PROTOCOL_CHOICES = [
@@ -59,6 +60,17 @@ DEVICE_ID_CHOICES = [
 logger = logging.getLogger(__name__)
 
 
+def count_stacks(blueprints):
+    # Import here to not cause circular imports
+    from stackdio.api.stacks.models import Stack
+
+    counts = dict((blueprint.id, 0) for blueprint in blueprints)
+    rows = Stack.objects.filter(blueprint__in=blueprints).values('blueprint')
+    for row in rows.order_by().annotate(count=Count('id')):
+        counts[row['blueprint']] = row['count']
+    return counts
+
+
 class BlueprintQuerySet(SearchQuerySet):
     searchable_fields = ('title', 'description')
 
@@ -113,14 +125,26 @@ class Blueprint(TimeStampedModel, TitleSlugDescriptionModel):
     def host_definition_count(self):
         return self.host_definitions.count()
 
-    @django_cache('{ctype}-{id}-label-list')
+    @django_cache('{ctype}-{id}-label-list', many=get_label_lists)
     def get_cached_label_list(self):
         return self.labels.all()
 
-    @django_cache('blueprint-{id}-stack-count')
+    @django_cache('blueprint-{id}-stack-count', many=count_stacks)
     def stack_count(self):
         return self.stacks.count()
 
+    def get_version_stamp(self):
+        """
+        A cheap string that changes whenever the serialized blueprint would.
+        """
+        labels = ','.join('{0}:{1}'.format(l.key, l.value) for l in self.get_cached_label_list())
+        return '{0}-{1}-{2}-{3}'.format(
+            self.id,
+            self.modified.isoformat(),
+            self.stack_count(),
+            labels,
+        )
+
     def get_formulas(self):
         formulas = set()
         for host_definition in self.host_definitions.all():
@@ -277,4 +301,4 @@ def blueprint_post_delete(sender, **kwargs):
         'blueprint-{}-stack-count'.format(blueprint.id),
         '{}-{}-label-list'.format(ctype.pk, blueprint.id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
@@ -60,6 +60,9 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_ROUTE53_TTL = 30
 
+# The most values EC2 allows in a single DescribeInstances filter
+DESCRIBE_FILTER_MAX_VALUES = 200
+
 
 class Route53Domain(object):
     def __init__(self, access_key, secret_key, domain):
@@ -883,6 +886,53 @@ class AWSCloudProvider(BaseCloudProvider):
 
             ec2.create_tags(resource_ids, tags)
 
+    @staticmethod
+    def _get_instance_info(instance):
+        """
+        Convert a boto instance into the same dict a salt-cloud query returns
+        """
+        info = {
+            'state': instance.state,
+            'instanceId': instance.id,
+            'dnsName': instance.public_dns_name or None,
+            'privateDnsName': instance.private_dns_name or None,
+            'ipAddress': instance.ip_address or None,
+            'privateIpAddress': instance.private_ip_address or None,
+            'blockDeviceMapping': {
+                'item': [{'deviceName': device, 'ebs': {'volumeId': bdt.volume_id}}
+                         for device, bdt in (instance.block_device_mapping or {}).items()],
+            },
+        }
+
+        if instance.spot_instance_request_id:
+            info['spotInstanceRequestId'] = instance.spot_instance_request_id
+
+        return info
+
+    def describe_hosts(self, hosts):
+        ec2 = self.connect_ec2()
+
+        hostnames = [h.hostname for h in hosts]
+
+        result = {}
+        for i in range(0, len(hostnames), DESCRIBE_FILTER_MAX_VALUES):
+            batch = hostnames[i:i + DESCRIBE_FILTER_MAX_VALUES]
+
+            # salt-cloud keys hosts by their Name tag, so we look them up the same way
+            for reservation in ec2.get_all_instances(filters={'tag:Name': batch}):
+                for instance in reservation.instances:
+                    name = instance.tags.get('Name')
+                    info = self._get_instance_info(instance)
+
+                    # A terminated instance can hang around with the same name for a while,
+                    # don't let it hide the live one
+                    if name in result and info['state'] in ('terminated', 'shutting-down'):
+                        continue
+
+                    result[name] = info
+
+        return result
+
     def get_ec2_instances(self, hosts):
         ec2 = self.connect_ec2()
 
@@ -202,6 +202,16 @@ class BaseCloudProvider(object):
         """
         raise NotImplementedError()
 
+    def describe_hosts(self, hosts):
+        """
+        Given a list of 'stacks.Host' objects, look up just those hosts
+        on the cloud provider (ideally in as few API calls as possible).
+        Should return a dict of hostname -> host info in the same format
+        a salt-cloud query returns.  Hosts the provider doesn't know about
+        should be left out.
+        """
+        raise NotImplementedError()
+
     @classmethod
     def register_dns(cls, hosts):
         """
@@ -20,12 +20,21 @@ from __future__ import unicode_literals
 import importlib
 import logging
 import re
+import time
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
+from django.core.cache import cache
 from stackdio.core.config import StackdioConfigException
+from stackdio.salt.utils.cloud import StackdioSaltCloudClient
+from stackdio.salt.utils.logging import inherit_run_context
 
 logger = logging.getLogger(__name__)
 
+INVENTORY_KEY = 'cloud-account-{0}-inventory'
+INVENTORY_LOCK_KEY = 'cloud-account-{0}-inventory-lock'
+INVENTORY_GENERATION_KEY = 'cloud-account-{0}-inventory-generation'
+
 
 def get_provider_driver_class(provider):
     provider_classes = get_cloud_providers()
@@ -81,3 +90,165 @@ def find_roles(filename, pattern):
                 recording = not recording
             elif recording:
                 yield line
+
+
+def get_account_cloud_client(account_slug):
+    """
+    Get a salt-cloud client that only knows about a single cloud account
+    """
+    salt_cloud = StackdioSaltCloudClient(settings.STACKDIO_CONFIG.salt_cloud_config)
+    salt_cloud.restrict_to_provider(account_slug)
+    return salt_cloud
+
+
+def run_per_account(func, account_args):
+    """
+    Run func concurrently, once for each cloud account.  func must NOT touch the database,
+    since it runs on a separate thread.
+    :param func: called as func(account_slug, args)
+    :param account_args: a dict of account slug -> args
+    :return: a dict of account slug -> result.  The first exception raised is re-raised.
+    """
+    if not account_args:
+        return {}
+
+    items = list(account_args.items())
+
+    if len(items) == 1:
+        # No need for any threads
+        return {items[0][0]: func(*items[0])}
+
+    # Make sure the worker threads log to the same run as we do
+    run_func = inherit_run_context(func)
+
+    pool = ThreadPool(len(items))
+    try:
+        results = pool.map(lambda item: run_func(*item), items)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict(zip([slug for slug, _ in items], results))
+
+
+def get_inventory_generation(account_slug):
+    return cache.get(INVENTORY_GENERATION_KEY.format(account_slug), 0)
+
+
+def invalidate_provider_inventory(account_slugs):
+    """
+    Mark the cached inventory for the given accounts as stale.  Call this after anything
+    that changes what's running on the provider (launching, destroying, re-tagging).
+    Bumping a generation counter (rather than deleting the entry) means a query that was
+    already in flight can't put stale data back.
+    """
+    for account_slug in account_slugs:
+        key = INVENTORY_GENERATION_KEY.format(account_slug)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The key got evicted in between, nothing cached can match a new counter
+            cache.set(key, 1, None)
+
+
+def _inventory_is_usable(entry, generation, version, oldest_allowed):
+    if not entry or entry['generation'] != generation:
+        return False
+
+    if version is not None and version in entry['versions']:
+        return True
+
+    return entry['queried_at'] >= oldest_allowed
+
+
+def get_provider_inventory(account_slug, version=None, max_age=None):
+    """
+    Get the salt-cloud `full_query` result for a single cloud account.
+
+    Results are cached per account.  A cached result is reused if it was tagged with the
+    given snapshot `version` (so every task in one workflow shares one query), or if it is
+    no older than `max_age` seconds.  Concurrent callers are coalesced - only one of them
+    actually queries the provider, the rest wait for that result.
+
+    This doesn't touch the database, so it's safe to call from a worker thread.
+
+    :param account_slug: the slug of the cloud account
+    :param version: the snapshot version to tag (and look up) the result with
+    :param max_age: how old (in seconds) a cached result may be.  Defaults to the
+                    `provider_query_max_age` config option when no version is given,
+                    or 0 (only a result tagged with the version) when one is.
+    :return: a dict of provider driver -> {hostname: details}
+    """
+    if max_age is None:
+        if version is None:
+            max_age = settings.STACKDIO_CONFIG.get('provider_query_max_age', 60)
+        else:
+            max_age = 0
+
+    lock_timeout = settings.STACKDIO_CONFIG.get('provider_query_lock_timeout', 300)
+    cache_timeout = settings.STACKDIO_CONFIG.get('provider_query_cache_timeout', 3600)
+
+    key = INVENTORY_KEY.format(account_slug)
+    lock_key = INVENTORY_LOCK_KEY.format(account_slug)
+
+    oldest_allowed = time.time() - max_age
+    give_up_at = time.time() + lock_timeout
+
+    have_lock = False
+
+    while True:
+        generation = get_inventory_generation(account_slug)
+        entry = cache.get(key)
+
+        if _inventory_is_usable(entry, generation, version, oldest_allowed):
+            logger.debug('Using cached provider inventory for {0}'.format(account_slug))
+            if version is not None and version not in entry['versions']:
+                entry['versions'].append(version)
+                cache.set(key, entry, cache_timeout)
+            return entry['result']
+
+        if cache.add(lock_key, True, lock_timeout):
+            have_lock = True
+            break
+
+        if time.time() >= give_up_at:
+            # Whoever held the lock is taking way too long, just do it ourselves
+            logger.warning('Timed out waiting on the provider inventory for '
+                           '{0}'.format(account_slug))
+            break
+
+        # Someone else is already querying this account, wait for their result
+        time.sleep(1)
+
+    try:
+        logger.debug('Querying provider inventory for {0}'.format(account_slug))
+        queried_at = time.time()
+        generation = get_inventory_generation(account_slug)
+
+        salt_cloud = get_account_cloud_client(account_slug)
+        result = salt_cloud.full_query().get(account_slug, {})
+
+        cache.set(key, {
+            'result': result,
+            'generation': generation,
+            'queried_at': queried_at,
+            'versions': [version] if version is not None else [],
+        }, cache_timeout)
+
+        return result
+    finally:
+        if have_lock:
+            cache.delete(lock_key)
+
+
+def get_provider_inventories(account_slugs, version=None, max_age=None):
+    """
+    Get the inventory for several accounts at once.  Each account is queried concurrently.
+    :return: a dict of account slug -> inventory, in the same format as a salt-cloud
+             full_query()
+    """
+    return run_per_account(
+        lambda account_slug, _: get_provider_inventory(account_slug, version, max_age),
+        dict((account_slug, None) for account_slug in set(account_slugs)),
+    )
@@ -28,7 +28,7 @@ from rest_framework.filters import DjangoFilterBackend, DjangoObjectPermissionsF
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.serializers import ValidationError
-from stackdio.api.environments import filters, mixins, models, serializers, utils
+from stackdio.api.environments import filters, mixins, models, serializers, tasks, utils
 from stackdio.api.formulas.serializers import FormulaVersionSerializer
 from stackdio.core.constants import Activity
 from stackdio.core.permissions import StackdioModelPermissions, StackdioObjectPermissions
@@ -84,8 +84,28 @@ class EnvironmentHostListAPIView(mixins.EnvironmentRelatedMixin, generics.ListAP
     serializer_class = serializers.EnvironmentHostSerializer
 
     def get_queryset(self):
+        return self.inventory['hosts']
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serve the cached host inventory rather than asking every minion for its grains.
+        A stale inventory (or passing `refresh=true`) kicks off a background refresh.
+        """
         environment = self.get_environment()
-        return sorted(environment.get_current_hosts(), key=lambda x: x['id'])
+        self.inventory = environment.get_host_inventory()
+
+        stale = environment.host_inventory_is_stale(self.inventory)
+
+        if stale or request.query_params.get('refresh') in ('true', 'True', '1'):
+            tasks.schedule_host_inventory_refresh(environment)
+
+        response = super(EnvironmentHostListAPIView, self).list(request, *args, **kwargs)
+
+        if isinstance(response.data, dict):
+            response.data['last_refreshed'] = self.inventory['last_refreshed']
+            response.data['stale'] = stale
+
+        return response
 
 
 class EnvironmentLabelListAPIView(mixins.EnvironmentRelatedMixin, generics.ListCreateAPIView):
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-10 10:37
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('environments', '0001_0_8_initial'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='componentmetadata',
+            index_together=set([('environment', 'sls_path', 'host')]),
+        ),
+    ]
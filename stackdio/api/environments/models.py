@@ -21,13 +21,21 @@ import logging
 import os
 
 import salt.client
+import salt.config
+import salt.runner
 import six
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from guardian.shortcuts import get_users_with_perms
+from stackdio.core.caching import delete_cached
 from stackdio.core.constants import Activity, ComponentStatus, Health
+from stackdio.core.decorators import django_cache
 from stackdio.core.fields import JSONField
 from stackdio.core.utils import recursive_update
 
@@ -110,9 +118,10 @@ class Environment(TimeStampedModel):
         return six.text_type('Environment {}'.format(self.name))
 
     @property
+    @django_cache('environment-{id}-health')
     def health(self):
         """
-        Calculates the health of this stack from its hosts
+        Calculates the health of this environment from its components
         """
         healths = []
 
@@ -190,10 +199,25 @@ class Environment(TimeStampedModel):
 
         return pillar_props
 
+    def get_latest_component_metadatas(self):
+        """
+        Get only the latest metadata for each (sls_path, host) pair, rather than the entire
+        history.  Metadata rows are only ever appended, so the latest one has the highest id.
+        """
+        # Clear the default ordering, otherwise it ends up in the GROUP BY
+        latest_ids = self.component_metadatas.order_by().values(
+            'sls_path', 'host',
+        ).annotate(
+            latest_id=Max('id'),
+        ).values_list('latest_id', flat=True)
+
+        return self.component_metadatas.filter(id__in=list(latest_ids))
+
+    @django_cache('environment-{id}-components')
     def get_components(self):
         component_map = {}
 
-        for metadata in self.component_metadatas.order_by('-modified'):
+        for metadata in self.get_latest_component_metadatas():
             if metadata.sls_path not in component_map:
                 component_map[metadata.sls_path] = EnvironmentComponent(self, metadata.sls_path)
 
@@ -202,9 +226,10 @@ class Environment(TimeStampedModel):
         return sorted(component_map.values(), key=lambda x: x.sls_path)
 
     def get_current_component_metadata(self, sls_path, host):
+        # Same rule as get_latest_component_metadatas - the latest row has the highest id
         return self.component_metadatas.filter(
             sls_path=sls_path, host=host
-        ).order_by('-modified').first()
+        ).order_by('-id').first()
 
     def set_component_status(self, sls_path, status, host_list):
         for host in host_list:
@@ -216,6 +241,10 @@ class Environment(TimeStampedModel):
                                             current_health=current_health)
 
     def get_current_hosts(self):
+        """
+        Ask every minion in the environment for its grains.  This broadcasts to the
+        minions and waits on them, so the API uses the cached host inventory instead.
+        """
         client = salt.client.LocalClient(settings.STACKDIO_CONFIG.salt_master_config)
 
         result = client.cmd_iter('env:environments.{}'.format(self.name),
@@ -230,6 +259,51 @@ class Environment(TimeStampedModel):
 
         return ret
 
+    def get_host_inventory_cache_key(self):
+        return 'environment-{}-host-inventory'.format(self.id)
+
+    def get_host_inventory_lock_key(self):
+        # Held while a refresh is queued / running so we don't queue up duplicates
+        return 'environment-{}-host-inventory-refreshing'.format(self.id)
+
+    def refresh_host_inventory(self):
+        """
+        Rebuild the host inventory from the grains in the master's minion data cache.
+        This doesn't talk to the minions at all.
+        """
+        opts = salt.config.client_config(settings.STACKDIO_CONFIG.salt_master_config)
+        runner = salt.runner.RunnerClient(opts)
+
+        grains = runner.cmd('cache.grains',
+                            ['env:environments.{}'.format(self.name)],
+                            kwarg={'expr_form': 'grain'})
+
+        inventory = {
+            'hosts': sorted((g for g in (grains or {}).values() if g), key=lambda g: g['id']),
+            'last_refreshed': timezone.now(),
+        }
+
+        cache.set(self.get_host_inventory_cache_key(), inventory, None)
+
+        return inventory
+
+    def get_host_inventory(self):
+        """
+        Get the cached host inventory.  `last_refreshed` is None if it has never been built.
+        """
+        return cache.get(self.get_host_inventory_cache_key()) or {
+            'hosts': [],
+            'last_refreshed': None,
+        }
+
+    @staticmethod
+    def host_inventory_is_stale(inventory):
+        max_age = settings.STACKDIO_CONFIG.get('environment_inventory_max_age', 300)
+        last_refreshed = inventory['last_refreshed']
+        if last_refreshed is None:
+            return True
+        return (timezone.now() - last_refreshed).total_seconds() > max_age
+
 
 class ComponentMetadataQuerySet(models.QuerySet):
 
@@ -246,6 +320,11 @@ class ComponentMetadataQuerySet(models.QuerySet):
 @six.python_2_unicode_compatible
 class ComponentMetadata(TimeStampedModel):
 
+    class Meta(TimeStampedModel.Meta):
+        index_together = [
+            ('environment', 'sls_path', 'host'),
+        ]
+
     # Limited health map - since we don't know what the components are,
     # we can't know if they're queued / running.
     HEALTH_MAP = {
@@ -297,3 +376,30 @@ class ComponentMetadata(TimeStampedModel):
             self.health = new_health
 
         self.save()
+
+
+@receiver([models.signals.post_save, models.signals.post_delete], sender=ComponentMetadata)
+def metadata_post_save(sender, **kwargs):
+    """
+    Catch the post_save / post_delete signals for all ComponentMetadata objects
+    and clear the cached components & health for the environment
+    """
+    metadata = kwargs.pop('instance')
+
+    cache_keys = [
+        'environment-{}-components'.format(metadata.environment_id),
+        'environment-{}-health'.format(metadata.environment_id),
+    ]
+    delete_cached(cache_keys)
+
+
+@receiver(models.signals.post_delete, sender=Environment)
+def environment_post_delete(sender, **kwargs):
+    environment = kwargs.pop('instance')
+
+    cache_keys = [
+        'environment-{}-components'.format(environment.id),
+        'environment-{}-health'.format(environment.id),
+        environment.get_host_inventory_cache_key(),
+    ]
+    delete_cached(cache_keys)
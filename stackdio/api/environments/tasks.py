@@ -24,6 +24,7 @@ import salt.client
 import six
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
 from stackdio.api.environments import utils
 from stackdio.api.environments.exceptions import EnvironmentTaskException
 from stackdio.api.environments.models import Environment
@@ -80,6 +81,36 @@ def environment_task(*args, **kwargs):
     return wrapped
 
 
+def schedule_host_inventory_refresh(environment):
+    """
+    Queue a background refresh of an environment's host inventory, unless one is
+    already queued.
+    """
+    lock_key = environment.get_host_inventory_lock_key()
+    if cache.add(lock_key, True, 60):
+        refresh_host_inventory.si(environment.name).apply_async()
+
+
+@shared_task(name='environments.refresh_host_inventory')
+def refresh_host_inventory(environment_name=None):
+    """
+    Refresh the cached host inventory for one environment, or all of them.
+    """
+    environments = Environment.objects.all()
+
+    if environment_name is not None:
+        environments = environments.filter(name=environment_name)
+
+    for environment in environments:
+        try:
+            environment.refresh_host_inventory()
+        except Exception:
+            logger.exception('Failed to refresh the host inventory '
+                             'for {0!r}'.format(environment))
+        finally:
+            cache.delete(environment.get_host_inventory_lock_key())
+
+
 @environment_task(name='environments.sync_all')
 def sync_all(environment):
     logger.info('Syncing all salt systems for environment: {0!r}'.format(environment))
@@ -312,3 +343,6 @@ def finish_environment(environment):
     # Update activity
     environment.activity = Activity.IDLE
     environment.save()
+
+    # The minions may have changed, so rebuild the host inventory
+    schedule_host_inventory_refresh(environment)
@@ -20,17 +20,19 @@ from __future__ import print_function, unicode_literals
 import logging
 
 from stackdio.core.constants import Action, ComponentStatus
+from stackdio.core.permissions import get_permission_resolver
 
 logger = logging.getLogger(__name__)
 
 
 def filter_actions(user, stack, actions):
+    resolver = get_permission_resolver(user)
     ret = []
     for action in actions:
         the_action = action
         if action == Action.PROPAGATE_SSH:
             the_action = 'admin'
-        if user.has_perm('stacks.{0}_stack'.format(the_action.lower()), stack):
+        if resolver.has_perm('stacks.{0}_stack'.format(the_action.lower()), stack):
             ret.append(action)
 
     return ret
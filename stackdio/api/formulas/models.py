@@ -223,6 +223,22 @@ class Formula(TimeStampedModel, TitleSlugDescriptionModel):
         gitfs = self.get_gitfs()
         return gitfs.envs()
 
+    def get_version_hash(self, version=None):
+        """
+        Get the git tree hash of the given version from the local clone.  It changes
+        whenever anything in that version changes.
+        """
+        gitfs = self.get_gitfs()
+
+        version = version or self.default_version
+
+        for repo in gitfs.remotes:
+            tree = repo.get_tree(version)
+            if tree is not None:
+                return tree.hexsha
+
+        return None
+
     @property
     def default_version(self):
         return 'base'
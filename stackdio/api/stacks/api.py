@@ -17,32 +17,34 @@
 
 from __future__ import unicode_literals
 
+import io
 import logging
 import os
-import zipfile
 from collections import OrderedDict
 
 import envoy
 from actstream import action
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
+from django.http import FileResponse, Http404
 from guardian.shortcuts import assign_perm
 from rest_framework import generics, status
 from rest_framework.filters import DjangoFilterBackend, DjangoObjectPermissionsFilter
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.serializers import ValidationError
-from six import StringIO
 from stackdio.api.cloud.filters import SecurityGroupFilter
 from stackdio.api.formulas.models import FormulaVersion
 from stackdio.api.formulas.serializers import FormulaVersionSerializer
 from stackdio.api.stacks import filters, mixins, models, serializers, utils, workflows
 from stackdio.api.volumes.serializers import VolumeSerializer
 from stackdio.core.constants import Activity
+from stackdio.core.mixins import ConditionalRetrieveMixin
 from stackdio.core.notifications.serializers import (
     UserSubscriberNotificationChannelSerializer,
     GroupSubscriberNotificationChannelSerializer,
 )
+from stackdio.core.pagination import StackdioCursorPagination
 from stackdio.core.permissions import StackdioModelPermissions, StackdioObjectPermissions
 from stackdio.core.renderers import PlainTextRenderer, ZipRenderer
 from stackdio.core.serializers import ObjectPropertiesSerializer
@@ -60,7 +62,9 @@ class StackListAPIView(generics.ListCreateAPIView):
     """
     Displays a list of all stacks visible to you.
     """
-    queryset = models.Stack.objects.all()
+    # Look up the cached fields for the whole page at once
+    queryset = models.Stack.objects.prefetch_cached('health', 'host_count', 'volume_count',
+                                                    'get_cached_label_list')
     permission_classes = (StackdioModelPermissions,)
     filter_backends = (DjangoObjectPermissionsFilter, DjangoFilterBackend)
     filter_class = filters.StackFilter
@@ -89,7 +93,7 @@ class StackListAPIView(generics.ListCreateAPIView):
                                               version=formula_version.version)
 
 
-class StackDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class StackDetailAPIView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = models.Stack.objects.all()
     serializer_class = serializers.StackSerializer
     permission_classes = (StackdioObjectPermissions,)
@@ -134,12 +138,47 @@ class StackPropertiesAPIView(generics.RetrieveUpdateAPIView):
 
 class StackHistoryAPIView(mixins.StackRelatedMixin, generics.ListAPIView):
     serializer_class = serializers.StackHistorySerializer
+    pagination_class = StackdioCursorPagination
 
     def get_queryset(self):
         stack = self.get_stack()
         return stack.history.all()
 
 
+class StackTimingListAPIView(mixins.StackRelatedMixin, generics.ListAPIView):
+    """
+    Displays how long every state took on every host during the stack's
+    provisioning and orchestration runs, slowest first.
+    """
+    serializer_class = serializers.StateTimingSerializer
+    filter_backends = (DjangoFilterBackend,)
+    filter_class = filters.StateTimingFilter
+
+    def get_queryset(self):
+        stack = self.get_stack()
+        return stack.state_timings.all()
+
+
+class StackTimingSummaryAPIView(StackTimingListAPIView):
+    """
+    Displays the slowest states, orchestration stages, and hosts across the stack's
+    provisioning and orchestration runs.  Accepts the same filters as the timings
+    list, plus `limit` for the number of entries in each list.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            if limit < 1:
+                raise ValueError()
+        except ValueError:
+            raise ValidationError({'limit': ['Must be a positive integer.']})
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        return Response(queryset.summary(limit))
+
+
 class StackActionAPIView(mixins.StackRelatedMixin, generics.GenericAPIView):
     serializer_class = serializers.StackActionSerializer
 
@@ -200,26 +239,40 @@ class StackCommandZipAPIView(mixins.StackRelatedMixin, generics.GenericAPIView):
 
         filename = 'command_output_' + command.submit_time.strftime('%Y%m%d_%H%M%S')
 
-        file_buffer = StringIO.StringIO()
-        with zipfile.ZipFile(file_buffer, 'w') as command_zip:
-            # Write out all the contents
-            command_zip.writestr(
-                str('{0}/__command'.format(filename)),
-                str(command.command)
-            )
-
-            for output in command.std_out:
-                command_zip.writestr(
-                    str('{0}/{1}.txt'.format(filename, output['host'])),
-                    str(output['output'])
-                )
+        zip_file = command.get_zip_file_path()
+
+        # Only re-use the zip once the command is done, otherwise the output may still change
+        if command.status != models.StackCommand.FINISHED or not os.path.isfile(zip_file):
+            zip_file = command.generate_zip_file()
+
+        # Stream the zip off disk instead of building it in memory
+        response = FileResponse(io.open(zip_file, 'rb'), content_type=ZipRenderer.media_type)
 
         # Give browsers a reasonable filename to save this as
-        headers = {
-            'Content-Disposition': 'attachment; filename={0}.zip'.format(filename)
-        }
+        response['Content-Disposition'] = 'attachment; filename={0}.zip'.format(filename)
+
+        return response
+
+
+class StackCommandOutputAPIView(mixins.StackRelatedMixin, generics.GenericAPIView):
+    renderer_classes = (PlainTextRenderer,)
+
+    def get_queryset(self):
+        stack = self.get_stack()
+        return stack.commands.all()
 
-        return Response(file_buffer.getvalue(), headers=headers)
+    def get(self, request, *args, **kwargs):
+        command = self.get_object()
+        host = kwargs['host']
+
+        output_file = command.get_output_file_path(host)
+
+        if host not in command.std_out_index or not os.path.isfile(output_file):
+            raise Http404()
+
+        # Stream the output off disk, it can be big
+        return FileResponse(io.open(output_file, 'rb'),
+                            content_type='{0}; charset=utf-8'.format(PlainTextRenderer.media_type))
 
 
 class StackLabelListAPIView(mixins.StackRelatedMixin, generics.ListCreateAPIView):
@@ -333,7 +386,7 @@ class StackHostListAPIView(mixins.StackRelatedMixin, generics.ListCreateAPIView)
 
     def get_queryset(self):
         stack = self.get_stack()
-        return stack.hosts.all()
+        return stack.hosts.prefetch_cached('health', 'formula_components')
 
     def get_serializer_context(self):
         """
@@ -344,7 +397,9 @@ class StackHostListAPIView(mixins.StackRelatedMixin, generics.ListCreateAPIView)
         return context
 
 
-class StackHostDetailAPIView(mixins.StackRelatedMixin, generics.RetrieveDestroyAPIView):
+class StackHostDetailAPIView(mixins.StackRelatedMixin,
+                             ConditionalRetrieveMixin,
+                             generics.RetrieveDestroyAPIView):
     serializer_class = serializers.HostSerializer
 
     def get_queryset(self):
@@ -18,6 +18,7 @@
 from __future__ import unicode_literals
 
 import django_filters
+from django.db.models import Q
 from stackdio.api.stacks import models
 from stackdio.core.filters import OrFieldsFilter, LabelFilterMixin
 
@@ -41,6 +42,7 @@ class StackFilter(django_filters.FilterSet, LabelFilterMixin):
 
 class HostFilter(django_filters.FilterSet):
     hostname = django_filters.CharFilter(lookup_type='icontains')
+    activity = django_filters.MethodFilter(action='filter_activity')
     q = OrFieldsFilter(field_names=('hostname', 'instance_id', 'provider_private_ip'),
                        lookup_type='icontains')
 
@@ -51,3 +53,22 @@ class HostFilter(django_filters.FilterSet):
             'activity',
             'q',
         )
+
+    def filter_activity(self, queryset, value):
+        # Hosts without their own activity follow the stack's
+        return queryset.filter(Q(activity=value) | Q(activity=None, stack__activity=value))
+
+
+class StateTimingFilter(django_filters.FilterSet):
+
+    class Meta:
+        model = models.StateTiming
+        fields = (
+            'run_id',
+            'run_type',
+            'stage',
+            'host',
+            'sls',
+            'state_id',
+            'result',
+        )
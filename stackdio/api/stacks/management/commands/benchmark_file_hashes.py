@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from stackdio.api.stacks.models import Stack
+from stackdio.salt.utils.hash_index import FileHashIndex
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the fileserver file hash index against the salt files of every '
+            'stack, using a throwaway index.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--passes', type=int, default=3,
+                            help='How many times to hash every file')
+        parser.add_argument('--hash-type', default='sha256',
+                            help='The hash type to use (the master\'s hash_type)')
+
+    def handle(self, *args, **options):
+        paths = []
+        for stack in Stack.objects.all():
+            salt_dir = stack.get_stackdio_dir()
+            for root, _, files in os.walk(salt_dir):
+                paths.extend(os.path.join(root, fname) for fname in files)
+
+        if not paths:
+            self.stdout.write('No stack salt files to hash.')
+            return
+
+        index_dir = tempfile.mkdtemp()
+        index_path = os.path.join(index_dir, 'hash_index')
+
+        try:
+            self.stdout.write('Hashing {0} files...'.format(len(paths)))
+
+            index = FileHashIndex(index_path)
+            for i in range(options['passes']):
+                self.run_pass(index, paths, options['hash_type'], 'pass {0}'.format(i + 1))
+
+            # A fresh index is what another master worker process would see
+            index = FileHashIndex(index_path)
+            self.run_pass(index, paths, options['hash_type'], 'new process')
+        finally:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+    def run_pass(self, index, paths, hash_type, name):
+        index.stats.clear()
+
+        start = time.time()
+        for path in paths:
+            index.get_hash(path, hash_type)
+        elapsed = time.time() - start
+
+        self.stdout.write('{0}: {1:.3f}s, hit rate {2:.1%} ({3})'.format(
+            name,
+            elapsed,
+            index.hit_rate,
+            ', '.join('{0}={1}'.format(k, v) for k, v in sorted(index.stats.items())),
+        ))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-02 14:21
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+
+import six
+from django.conf import settings
+from django.db import migrations
+
+import stackdio.core.fields
+
+
+STACKS_DIRECTORY = os.path.join(settings.FILE_STORAGE_DIRECTORY, 'stacks')
+
+
+def get_output_directory(command):
+    output_dir = os.path.join(STACKS_DIRECTORY,
+                              six.text_type(command.stack_id),
+                              'commands',
+                              six.text_type(command.id))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    return output_dir
+
+
+def storage_to_files(apps, schema_migration):
+    """
+    Forwards migration
+    """
+    StackCommand = apps.get_model('stacks', 'StackCommand')
+
+    # Move the json blob of output out of the database and into per-host files
+    for command in StackCommand.objects.exclude(std_out_storage=''):
+        output_dir = get_output_directory(command)
+        index = {}
+
+        for output in json.loads(command.std_out_storage):
+            host_output = output['output']
+            if not isinstance(host_output, six.string_types):
+                host_output = six.text_type(json.dumps(host_output, indent=2))
+
+            output_file = os.path.join(output_dir, '{0}.txt'.format(output['host']))
+
+            with io.open(output_file, 'wt', encoding='utf-8') as f:
+                f.write(host_output)
+
+            index[output['host']] = os.path.getsize(output_file)
+
+        command.std_out_index = index
+        command.save(update_fields=['std_out_index'])
+
+
+def files_to_storage(apps, schema_migration):
+    """
+    Reverse migration
+    """
+    StackCommand = apps.get_model('stacks', 'StackCommand')
+
+    for command in StackCommand.objects.all():
+        output_dir = get_output_directory(command)
+        std_out = []
+
+        for host in sorted(command.std_out_index):
+            output_file = os.path.join(output_dir, '{0}.txt'.format(host))
+
+            if os.path.isfile(output_file):
+                with io.open(output_file, 'rt', encoding='utf-8') as f:
+                    std_out.append({'host': host, 'output': f.read()})
+
+        command.std_out_storage = json.dumps(std_out)
+        command.save(update_fields=['std_out_storage'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0009_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stackcommand',
+            name='std_out_index',
+            field=stackdio.core.fields.JSONField(default={}, verbose_name='Output Index'),
+        ),
+        migrations.RunPython(storage_to_files, files_to_storage),
+        migrations.RemoveField(
+            model_name='stackcommand',
+            name='std_out_storage',
+        ),
+    ]
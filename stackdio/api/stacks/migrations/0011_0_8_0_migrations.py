@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-04 09:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0010_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stackcommand',
+            name='batch_size',
+            field=models.CharField(blank=True, max_length=8, verbose_name='Batch Size'),
+        ),
+        migrations.AddField(
+            model_name='stackcommand',
+            name='timeout',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True, verbose_name='Timeout'),
+        ),
+    ]
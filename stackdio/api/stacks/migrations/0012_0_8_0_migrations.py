@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-05 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0011_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='stackhistory',
+            index_together=set([('stack', 'created', 'id')]),
+        ),
+    ]
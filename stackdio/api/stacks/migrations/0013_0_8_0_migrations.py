@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-09 09:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0012_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateTiming',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.UUIDField(db_index=True, verbose_name='Run ID')),
+                ('run_type', models.CharField(max_length=64, verbose_name='Run Type')),
+                ('stage', models.CharField(blank=True, max_length=255, verbose_name='Stage')),
+                ('host', models.CharField(max_length=255, verbose_name='Host')),
+                ('sls', models.CharField(blank=True, max_length=255, verbose_name='SLS')),
+                ('state_id', models.CharField(max_length=255, verbose_name='State ID')),
+                ('function', models.CharField(max_length=128, verbose_name='Function')),
+                ('name', models.CharField(blank=True, max_length=255, verbose_name='Name')),
+                ('start_time', models.TimeField(blank=True, null=True, verbose_name='Start Time')),
+                ('duration', models.FloatField(verbose_name='Duration')),
+                ('result', models.BooleanField(default=False, verbose_name='Result')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('stack', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='state_timings', to='stacks.Stack')),
+            ],
+            options={
+                'ordering': ['-duration'],
+                'default_permissions': (),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='statetiming',
+            index_together=set([('stack', 'run_type', 'run_id')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-10 15:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0013_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='sync_fingerprint',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Sync Fingerprint'),
+        ),
+    ]
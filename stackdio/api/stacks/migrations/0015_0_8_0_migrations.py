@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-24 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def inherit_stack_activity(apps, schema_editor):
+    Stack = apps.get_model('stacks', 'Stack')
+    Host = apps.get_model('stacks', 'Host')
+
+    # Hosts that match their stack just follow the stack from now on
+    for stack in Stack.objects.all():
+        Host.objects.filter(stack=stack, activity=stack.activity).update(activity=None)
+
+
+def copy_stack_activity(apps, schema_editor):
+    Stack = apps.get_model('stacks', 'Stack')
+    Host = apps.get_model('stacks', 'Host')
+
+    for stack in Stack.objects.all():
+        Host.objects.filter(stack=stack, activity=None).update(activity=stack.activity)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stacks', '0014_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='host',
+            name='activity',
+            field=models.CharField(blank=True, choices=[('unknown', 'unknown'), ('queued', 'queued'), ('launching', 'launching'), ('provisioning', 'provisioning'), ('orchestrating', 'orchestrating'), ('', ''), ('pausing', 'pausing'), ('paused', 'paused'), ('resuming', 'resuming'), ('terminating', 'terminating'), ('terminated', 'terminated'), ('executing', 'executing'), ('dead', 'dead')], default=None, max_length=32, null=True, verbose_name='Activity'),
+        ),
+        migrations.RunPython(inherit_stack_activity, copy_stack_activity),
+    ]
@@ -20,13 +20,18 @@
 from __future__ import unicode_literals
 
 import collections
+import hashlib
+import io
 import json
 import logging
 import os
 import re
 import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime
 
-import salt.cloud
 import six
 import yaml
 from django.conf import settings
@@ -34,6 +39,7 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.db import models, transaction
+from django.db.models import Avg, Count, Max, Sum
 from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 from django.utils.timezone import now
@@ -44,13 +50,16 @@ from model_utils.models import StatusModel
 from rest_framework.exceptions import APIException
 from stackdio.api.cloud.models import SecurityGroup
 from stackdio.api.cloud.providers.base import GroupExistsException
+from stackdio.api.cloud.utils import get_provider_inventories
 from stackdio.api.volumes.models import Volume
+from stackdio.core.caching import delete_cached
 from stackdio.core.constants import Health, ComponentStatus, Activity
 from stackdio.core.decorators import django_cache
 from stackdio.core.fields import JSONField
-from stackdio.core.models import SearchQuerySet
+from stackdio.core.models import SearchQuerySet, get_label_lists
+from stackdio.core.queryset_transform import TransformQuerySet
 from stackdio.core.notifications.decorators import add_subscribed_channels
-from stackdio.core.utils import recursive_update
+from stackdio.core.utils import recursive_update, write_file_if_changed
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +93,22 @@ def get_hostnames_from_hostdefs(hostdefs, username='', namespace=''):
     return hostnames
 
 
+def count_hosts(stacks):
+    counts = dict((stack.id, 0) for stack in stacks)
+    rows = Host.objects.filter(stack__in=stacks).values('stack')
+    for row in rows.order_by().annotate(count=Count('id')):
+        counts[row['stack']] = row['count']
+    return counts
+
+
+def count_volumes(stacks):
+    counts = dict((stack.id, 0) for stack in stacks)
+    rows = Volume.objects.filter(host__stack__in=stacks).values('host__stack')
+    for row in rows.order_by().annotate(count=Count('id')):
+        counts[row['host__stack']] = row['count']
+    return counts
+
+
 class StackCreationException(Exception):
     def __init__(self, errors, *args, **kwargs):
         self.errors = errors
@@ -199,24 +224,91 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
         # Create a history
         self.history.create(message=message)
 
+    def record_state_timings(self, run_type, timings):
+        """
+        Save the timing profile of a provisioning / orchestration run.  Only the most
+        recent `state_timing_max_runs` runs of each type are kept.
+        :param run_type: the type of run (provisioning, orchestration, etc)
+        :param timings: the list of timing dicts from the salt client result
+        :return: the id of the new run, or None if there was nothing to record
+        """
+        if not timings:
+            return None
+
+        run_id = uuid.uuid4()
+
+        StateTiming.objects.bulk_create(
+            [StateTiming.from_timing(self, run_id, run_type, timing) for timing in timings],
+            batch_size=500,
+        )
+
+        max_runs = settings.STACKDIO_CONFIG.get('state_timing_max_runs', 10)
+
+        runs = self.state_timings.filter(run_type=run_type).values('run_id').annotate(
+            finished=Max('created'),
+        ).order_by('-finished')
+
+        old_run_ids = [run['run_id'] for run in runs[max_runs:]]
+
+        if old_run_ids:
+            self.state_timings.filter(run_id__in=old_run_ids).delete()
+
+        return run_id
+
     def set_activity(self, activity, host_ids=None):
         """
-        Set the activity on all hosts in the stack
+        Set the activity on the stack.  Hosts follow the stack's activity unless it has been
+        overridden on the host, so this is a couple of update() queries no matter how many
+        hosts there are.
         :param activity: the activity to set
-        :param host_ids: the hosts to set the activity on
+        :param host_ids: the hosts to set the activity on (all of them by default).  The
+                         rest of the hosts keep the activity they have now.
         """
         # Make sure all host activities are saved atomically
         with transaction.atomic(using=Stack.objects.db):
+            old_activity = Stack.objects.select_for_update().filter(
+                id=self.id,
+            ).values_list('activity', flat=True).get()
+
+            hosts = self.hosts.all()
+
+            if host_ids is not None:
+                if old_activity != activity:
+                    # Pin the activity on the hosts we're leaving alone
+                    hosts.exclude(id__in=host_ids).filter(activity=None).update(
+                        activity=old_activity,
+                    )
+                hosts = hosts.filter(id__in=host_ids)
+
+            hosts.exclude(activity=None).update(activity=None)
+
+            Stack.objects.filter(id=self.id).update(activity=activity)
             self.activity = activity
-            self.save(update_fields=['activity'])
-            for host in self.get_hosts(host_ids):
-                host.set_activity(activity)
+
+        self.refresh_activity_cache()
+
+    def refresh_activity_cache(self):
+        """
+        Activity changes are made with update(), which doesn't send post_save, so refresh
+        everything that depends on the activity once here.
+        """
+        cache_keys = [
+            'stack-{}-hosts'.format(self.id),
+            'stack-{}-health'.format(self.id),
+        ]
+        host_ids = self.hosts.values_list('id', flat=True)
+        cache_keys.extend('host-{}-health'.format(host_id) for host_id in host_ids)
+        delete_cached(cache_keys)
+
+        # Pre-cache these by accessing them
+        self.get_cached_hosts()
+        self.health
 
     @property
     def volumes(self):
         return Volume.objects.filter(host__in=self.hosts.all())
 
-    @django_cache('{ctype}-{id}-label-list')
+    @django_cache('{ctype}-{id}-label-list', many=get_label_lists)
     def get_cached_label_list(self):
         return self.labels.all()
 
@@ -250,14 +342,30 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
     def get_cached_hosts(self):
         return self.hosts.all()
 
-    @django_cache('stack-{id}-host-count')
+    @django_cache('stack-{id}-host-count', many=count_hosts)
     def host_count(self):
         return self.hosts.count()
 
-    @django_cache('stack-{id}-volume-count')
+    @django_cache('stack-{id}-volume-count', many=count_volumes)
     def volume_count(self):
         return self.volumes.count()
 
+    def get_version_stamp(self):
+        """
+        A cheap string that changes whenever the serialized stack would.  Activity changes
+        don't touch `modified`, so the activity & (cached) health / counts are included too.
+        """
+        labels = ','.join('{0}:{1}'.format(l.key, l.value) for l in self.get_cached_label_list())
+        return '{0}-{1}-{2}-{3}-{4}-{5}-{6}'.format(
+            self.id,
+            self.modified.isoformat(),
+            self.activity,
+            self.health,
+            self.host_count(),
+            self.volume_count(),
+            labels,
+        )
+
     def get_hosts(self, host_ids=None):
         """
         Quick way of getting all hosts or a subset for this stack.
@@ -296,7 +404,7 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
 
         for host in self.get_cached_hosts():
             healths.append(host.health)
-            activities.add(host.activity)
+            activities.add(self.activity if host.activity is None else host.activity)
 
         if Activity.DEAD in activities:
             return Health.UNKNOWN if len(activities) == 1 else Health.UNHEALTHY
@@ -744,8 +852,7 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
 
         yaml_data = yaml.safe_dump(orchestrate, default_flow_style=False)
 
-        with open(self.get_orchestrate_file_path(), 'w') as f:
-            f.write(yaml_data)
+        return write_file_if_changed(self.get_orchestrate_file_path(), yaml_data)
 
     def get_global_orchestrate_file_path(self):
         return os.path.join(self.get_stackdio_dir(), 'global_orchestrate.sls')
@@ -786,8 +893,43 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
 
         yaml_data = yaml.safe_dump(orchestrate, default_flow_style=False)
 
-        with open(self.get_global_orchestrate_file_path(), 'w') as f:
-            f.write(yaml_data)
+        return write_file_if_changed(self.get_global_orchestrate_file_path(), yaml_data)
+
+    def get_sync_fingerprint(self):
+        """
+        A hash of everything saltutil.sync_all could push out to the stack's minions - the
+        core custom modules, and the exact contents of every formula version the stack uses.
+        A host whose sync_fingerprint matches this doesn't need to be synced again.
+        """
+        # Import here to not cause circular imports
+        from stackdio.api.stacks.utils import get_core_modules_hash
+
+        versions = dict((v.formula_id, v.version) for v in self.formula_versions.all())
+
+        hosts = self.hosts.select_related(
+            'blueprint_host_definition__cloud_image__account',
+        ).prefetch_related(
+            'blueprint_host_definition__formula_components__formula',
+            'blueprint_host_definition__cloud_image__account__formula_components__formula',
+        )
+
+        formulas = set()
+        for host in hosts:
+            # All prefetched above, so this is a constant number of queries for any stack size
+            host_definition = host.blueprint_host_definition
+            account = host_definition.cloud_image.account
+            formulas.update(c.formula for c in host_definition.formula_components.all())
+            formulas.update(c.formula for c in account.formula_components.all())
+
+        parts = [get_core_modules_hash()]
+
+        for formula in sorted(formulas, key=lambda x: x.pk):
+            version = versions.get(formula.pk, formula.default_version)
+            parts.append('{0}:{1}:{2}'.format(formula.uri,
+                                              version,
+                                              formula.get_version_hash(version)))
+
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
 
     def get_pillar_file_path(self):
         return os.path.join(self.get_root_directory(), 'stack.pillar')
@@ -907,46 +1049,53 @@ class Stack(TimeStampedModel, TitleSlugDescriptionModel):
         with open(self.get_global_pillar_file_path(), 'w') as f:
             f.write(pillar_file_yaml)
 
-    def query_hosts(self, force=False):
+    def query_hosts(self, force=False, query_version=None):
         """
-        Uses salt-cloud to query all the hosts for the given stack id.
+        Uses salt-cloud to query all the hosts for the given stack id.  Each cloud account
+        the stack uses is queried (concurrently) through the per-account inventory cache.
+        :param force: ignore any cached inventory that wasn't tagged with query_version
+        :param query_version: the workflow's query snapshot version, so every task in one
+                              workflow can share a single query per account
         """
-        CACHE_KEY = 'salt-cloud-full-query'
-
-        cached_result = cache.get(CACHE_KEY)
+        logger.info('get_hosts_info: {0!r}'.format(self))
 
-        if cached_result and not force:
-            logger.debug('salt-cloud query result cached')
-            result = cached_result
-        else:
-            logger.debug('salt-cloud query result not cached, retrieving')
-            logger.info('get_hosts_info: {0!r}'.format(self))
-
-            salt_cloud = salt.cloud.CloudClient(settings.STACKDIO_CONFIG.salt_cloud_config)
-            result = salt_cloud.full_query()
+        hosts = list(self.hosts.select_related(
+            'blueprint_host_definition__cloud_image__account__provider'
+        ))
 
-            # Cache the result for a minute
-            cache.set(CACHE_KEY, result, 60)
+        inventories = get_provider_inventories(
+            [host.blueprint_host_definition.cloud_image.account.slug for host in hosts],
+            version=query_version,
+            max_age=0 if force else None,
+        )
 
-        # yaml_result contains all host information in the stack, but
+        # Each inventory has the hosts buried in a cloud provider type dict,
         # we have to dig a bit to get individual host metadata out
-        # of account and provider type dictionaries
         host_result = {}
-        for host in self.hosts.all():
-            account = host.cloud_account
-            provider = host.cloud_provider
-
-            # each host is buried in a cloud provider type dict that's
-            # inside a cloud account name dict
+        for host in hosts:
+            account = host.blueprint_host_definition.cloud_image.account
 
             # Grab the list of hosts
-            host_map = result.get(account.slug, {}).get(provider.name, {})
+            host_map = inventories.get(account.slug, {}).get(account.provider.name, {})
 
             # Grab the individual host
             host_result[host.hostname] = host_map.get(host.hostname, None)
 
         return host_result
 
+    def describe_hosts(self, host_ids=None):
+        """
+        Look up only this stack's hosts (rather than everything in the cloud accounts)
+        using each provider driver's batched describe call.
+        :raises NotImplementedError: if a driver can't describe hosts
+        :return: a dict of hostname -> host info in the same format as query_hosts
+        """
+        host_result = {}
+        for driver, hosts in self.get_driver_hosts_map(host_ids).items():
+            host_result.update(driver.describe_hosts(hosts))
+
+        return host_result
+
     def get_root_directory(self):
         return os.path.join(settings.FILE_STORAGE_DIRECTORY,
                             'stacks',
@@ -997,6 +1146,10 @@ class StackHistory(TimeStampedModel):
         verbose_name_plural = 'stack history'
         ordering = ['-created', '-id']
 
+        index_together = [
+            ('stack', 'created', 'id'),
+        ]
+
         default_permissions = ()
 
     stack = models.ForeignKey('Stack', related_name='history')
@@ -1007,6 +1160,123 @@ class StackHistory(TimeStampedModel):
         return six.text_type('{} on {}'.format(self.message, self.stack))
 
 
+class StateTimingQuerySet(models.QuerySet):
+
+    def summary(self, limit=10):
+        """
+        Find the slowest states, stages, and hosts across all the runs in this queryset
+        """
+        runs = self.values('run_id', 'run_type').annotate(
+            finished=Max('created'),
+            num_states=Count('id'),
+            num_hosts=Count('host', distinct=True),
+        ).order_by('-finished')
+
+        slowest_states = self.values('sls', 'state_id', 'function').annotate(
+            runs=Count('run_id', distinct=True),
+            hosts=Count('host', distinct=True),
+            avg_duration=Avg('duration'),
+            max_duration=Max('duration'),
+        ).order_by('-max_duration')[:limit]
+
+        slowest_stages = self.exclude(stage='').values('stage').annotate(
+            runs=Count('run_id', distinct=True),
+            max_duration=Max('duration'),
+            total_duration=Sum('duration'),
+        ).order_by('-total_duration')[:limit]
+
+        slowest_hosts = self.values('host').annotate(
+            runs=Count('run_id', distinct=True),
+            max_duration=Max('duration'),
+            total_duration=Sum('duration'),
+        ).order_by('-total_duration')[:limit]
+
+        return collections.OrderedDict((
+            ('runs', list(runs)),
+            ('slowest_states', list(slowest_states)),
+            ('slowest_stages', list(slowest_stages)),
+            ('slowest_hosts', list(slowest_hosts)),
+        ))
+
+
+@six.python_2_unicode_compatible
+class StateTiming(models.Model):
+    """
+    How long a single state took on a single host during a provisioning / orchestration run
+    """
+
+    class Meta:
+        ordering = ['-duration']
+
+        index_together = [
+            ('stack', 'run_type', 'run_id'),
+        ]
+
+        default_permissions = ()
+
+    objects = StateTimingQuerySet.as_manager()
+
+    stack = models.ForeignKey('Stack', related_name='state_timings')
+
+    # All the timings from a single run share a run_id
+    run_id = models.UUIDField('Run ID', db_index=True)
+
+    run_type = models.CharField('Run Type', max_length=64)
+
+    # The orchestration stage - empty for highstate runs
+    stage = models.CharField('Stage', max_length=255, blank=True)
+
+    host = models.CharField('Host', max_length=255)
+
+    sls = models.CharField('SLS', max_length=255, blank=True)
+
+    state_id = models.CharField('State ID', max_length=255)
+
+    function = models.CharField('Function', max_length=128)
+
+    name = models.CharField('Name', max_length=255, blank=True)
+
+    start_time = models.TimeField('Start Time', null=True, blank=True)
+
+    # In milliseconds
+    duration = models.FloatField('Duration')
+
+    result = models.BooleanField('Result', default=False)
+
+    created = models.DateTimeField('Created', auto_now_add=True)
+
+    def __str__(self):
+        return six.text_type('{} on {} ({} ms)'.format(self.state_id, self.host, self.duration))
+
+    @classmethod
+    def from_timing(cls, stack, run_id, run_type, timing):
+        """
+        Build (but don't save) a StateTiming from a timing dict from the salt client
+        """
+        try:
+            start_time = datetime.strptime(timing['start_time'], '%H:%M:%S.%f').time()
+        except (TypeError, ValueError):
+            start_time = None
+
+        def truncate(field_name, value):
+            return value[:cls._meta.get_field(field_name).max_length]
+
+        return cls(
+            stack=stack,
+            run_id=run_id,
+            run_type=run_type,
+            stage=truncate('stage', timing['stage']),
+            host=truncate('host', timing['host']),
+            sls=truncate('sls', timing['sls']),
+            state_id=truncate('state_id', timing['state_id']),
+            function=truncate('function', timing['function']),
+            name=truncate('name', timing['name']),
+            start_time=start_time,
+            duration=timing['duration'],
+            result=timing['result'],
+        )
+
+
 @six.python_2_unicode_compatible
 class StackCommand(TimeStampedModel, StatusModel):
     WAITING = 'waiting'
@@ -1031,8 +1301,16 @@ class StackCommand(TimeStampedModel, StatusModel):
     # The command to be run (for custom actions)
     command = models.TextField('Command')
 
-    # The output from the action
-    std_out_storage = models.TextField()
+    # How many hosts to run the command on at once.  Either a number of hosts or a
+    # percentage (e.g. `10%`), just like salt's --batch option.  Blank runs on all hosts at once.
+    batch_size = models.CharField('Batch Size', max_length=8, blank=True)
+
+    # How long (in seconds) the command may run on a host before it is given up on
+    timeout = models.PositiveIntegerField('Timeout', blank=True, null=True, default=None)
+
+    # A map of host -> output size (in bytes).  The output itself is streamed to
+    # files in the stack's directory, so we only keep the index in the database.
+    std_out_index = JSONField('Output Index')
 
     # The error output from the action
     std_err_storage = models.TextField()
@@ -1040,12 +1318,84 @@ class StackCommand(TimeStampedModel, StatusModel):
     def __str__(self):
         return six.text_type('{} on {}'.format(self.command, self.host_target))
 
+    def get_output_directory(self):
+        output_dir = os.path.join(self.stack.get_root_directory(),
+                                  'commands',
+                                  six.text_type(self.pk))
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        return output_dir
+
+    def get_output_file_path(self, host):
+        return os.path.join(self.get_output_directory(), '{0}.txt'.format(host))
+
+    def get_zip_file_path(self):
+        return os.path.join(self.get_output_directory(), 'output.zip')
+
+    def write_output(self, host, output):
+        """
+        Write the output for a single host out to disk and record its size in the index.
+        This *DOES NOT* save the command.
+        :param host: the name of the host the output came from
+        :param output: the output returned by salt for the host
+        """
+        if isinstance(output, six.binary_type):
+            output = output.decode('utf-8', 'replace')
+        elif not isinstance(output, six.string_types):
+            # Salt may hand us back something other than a string (on errors, for example)
+            output = six.text_type(json.dumps(output, indent=2))
+
+        output_file = self.get_output_file_path(host)
+
+        with io.open(output_file, 'wt', encoding='utf-8') as f:
+            f.write(output)
+
+        self.std_out_index[host] = os.path.getsize(output_file)
+
+    def generate_zip_file(self):
+        """
+        Build the zip file for the command output from the files on disk.  The zip is written
+        to a temporary file and moved into place, so readers never see a partial zip.
+        :return: the path to the zip file
+        """
+        zip_file = self.get_zip_file_path()
+
+        dirname = 'command_output_' + self.submit_time.strftime('%Y%m%d_%H%M%S')
+
+        # A unique temp file, so concurrent downloads don't write over each other
+        fd, tmp_zip_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(zip_file))
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as command_zip:
+                    command_zip.writestr(
+                        str('{0}/__command'.format(dirname)),
+                        self.command.encode('utf-8'),
+                    )
+
+                    for host in sorted(self.std_out_index):
+                        output_file = self.get_output_file_path(host)
+                        if os.path.isfile(output_file):
+                            # ZipFile.write() streams the file in chunks
+                            command_zip.write(output_file,
+                                              str('{0}/{1}.txt'.format(dirname, host)))
+
+            os.rename(tmp_zip_file, zip_file)
+        except Exception:
+            if os.path.exists(tmp_zip_file):
+                os.remove(tmp_zip_file)
+            raise
+
+        return zip_file
+
     @property
     def std_out(self):
-        if self.std_out_storage != "":
-            return json.loads(self.std_out_storage)
-        else:
-            return []
+        """
+        Just the index of the output - the output itself can be big, so it's served
+        per-host straight off disk.
+        """
+        return [{'host': host, 'size': size}
+                for host, size in sorted(self.std_out_index.items())]
 
     @property
     def std_err(self):
@@ -1077,11 +1427,13 @@ class Host(TimeStampedModel):
 
         default_permissions = ()
 
+    # The activity of this host if it differs from the stack's, null to follow the stack
     activity = models.CharField('Activity',
                                 max_length=32,
                                 blank=True,
+                                null=True,
                                 choices=Activity.ALL,
-                                default=Activity.QUEUED)
+                                default=None)
 
     stack = models.ForeignKey('Stack',
                               related_name='hosts')
@@ -1136,13 +1488,41 @@ class Host(TimeStampedModel):
     # Any extra options we need to pass on to the host
     extra_options = JSONField('Extra Options')
 
+    # The stack sync fingerprint this host was last synced with
+    sync_fingerprint = models.CharField('Sync Fingerprint', max_length=64, blank=True)
+
+    objects = TransformQuerySet.as_manager()
+
     def __str__(self):
         return six.text_type(self.hostname)
 
     def set_activity(self, activity):
+        """
+        Override the stack's activity on just this host.  Pass None to follow the stack again.
+        """
         self.activity = activity
         self.save(update_fields=['activity'])
 
+    def get_activity(self):
+        """
+        The host's own activity if it has one, otherwise the stack's
+        """
+        if self.activity is None:
+            return self.stack.activity
+        return self.activity
+
+    def get_version_stamp(self):
+        """
+        A cheap string that changes whenever the serialized host would.
+        """
+        return '{0}-{1}-{2}-{3}-{4}'.format(
+            self.id,
+            self.modified.isoformat(),
+            self.get_activity(),
+            self.state,
+            self.health,
+        )
+
     @property
     @django_cache('host-{id}-health')
     def health(self):
@@ -1153,7 +1533,7 @@ class Host(TimeStampedModel):
         healths = self.get_current_component_healths().values()
 
         # Add the health from the driver
-        healths.append(self.get_driver().get_host_health(self.state, self.activity))
+        healths.append(self.get_driver().get_host_health(self.state, self.get_activity()))
 
         # Aggregate them together
         return Health.aggregate(healths)
@@ -1360,7 +1740,7 @@ def metadata_post_save(sender, **kwargs):
         'stack-{}-health'.format(host.stack_id),
         'host-{}-health'.format(host.id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
 
     # Pre-cache these by accessing them
     host.health
@@ -1382,7 +1762,23 @@ def metadata_post_delete(sender, **kwargs):
         'component-metadata-{}-sls-path'.format(metadata.id),
         'host-{}-component-metadata-for-{}'.format(metadata.host_id, sls_path),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
+
+
+@receiver(models.signals.post_delete, sender=StackCommand)
+def command_post_delete(sender, **kwargs):
+    command = kwargs.pop('instance')
+
+    # Build the path by hand so we don't need to fetch the stack (it may be getting deleted too)
+    output_dir = os.path.join(settings.FILE_STORAGE_DIRECTORY,
+                              'stacks',
+                              six.text_type(command.stack_id),
+                              'commands',
+                              six.text_type(command.pk))
+
+    # Get rid of all the output on disk
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
 
 
 @receiver(models.signals.post_save, sender=Host)
@@ -1397,7 +1793,7 @@ def host_post_save(sender, **kwargs):
         'stack-{}-health'.format(host.stack_id),
         'host-{}-health'.format(host.id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
 
     # Pre-cache these by accessing them
     host.health
@@ -1427,7 +1823,7 @@ def host_post_delete(sender, **kwargs):
         'host-{}-account'.format(host.id),
         'host-{}-provider'.format(host.id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
 
     # Pre-cache these by accessing them
     stack.get_cached_hosts()
@@ -1444,7 +1840,7 @@ def stack_post_save(sender, **kwargs):
     cache_keys = [
         'blueprint-{}-stack-count'.format(stack.blueprint_id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
 
     # Pre-cache these by accessing them
     blueprint.stack_count
@@ -1466,7 +1862,7 @@ def stack_post_delete(sender, **kwargs):
         'stack-{}-volume-count'.format(stack.id),
         'stack-{}-health'.format(stack.id),
     ]
-    cache.delete_many(cache_keys)
+    delete_cached(cache_keys)
 
     # Pre-cache these by accessing them
     blueprint.stack_count
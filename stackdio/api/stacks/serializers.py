@@ -30,6 +30,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.reverse import reverse
 from stackdio.api.blueprints.models import Blueprint, BlueprintHostDefinition
 from stackdio.api.blueprints.serializers import BlueprintHostDefinitionSerializer
 from stackdio.api.cloud.models import SecurityGroup
@@ -51,6 +52,32 @@ from stackdio.core.validators import validate_hostname
 logger = logging.getLogger(__name__)
 
 
+def validate_workflow_opts(data, options_class):
+    """
+    Pull just the options the workflow knows about out of the raw request data, making sure
+    the rolling options are valid host counts.
+    :param data: the serializer's initial_data
+    :param options_class: the WorkflowOptions subclass of the workflow that will run
+    :return: a dict to pass to the workflow as opts
+    """
+    opts = dict((k, v) for k, v in data.items() if k in options_class.DEFAULTS)
+
+    errors = {}
+
+    for option in ('rolling_batch_size', 'rolling_max_failures'):
+        try:
+            utils.parse_host_count(opts.get(option), 0, None)
+        except (TypeError, ValueError):
+            errors.setdefault(option, []).append(
+                'Must be a number of hosts or a percentage of hosts (like 25%).'
+            )
+
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    return opts
+
+
 class HostComponentSerializer(FormulaComponentSerializer):
     status = serializers.SerializerMethodField()
     health = serializers.SerializerMethodField()
@@ -90,6 +117,7 @@ class HostComponentSerializer(FormulaComponentSerializer):
 
 class HostSerializer(StackdioParentHyperlinkedModelSerializer):
     # Read only fields
+    activity = serializers.ReadOnlyField(source='get_activity')
     availability_zone = serializers.PrimaryKeyRelatedField(read_only=True)
     blueprint_host_definition = serializers.ReadOnlyField(source='blueprint_host_definition.title')
     formula_components = HostComponentSerializer(many=True, read_only=True)
@@ -152,6 +180,7 @@ class HostSerializer(StackdioParentHyperlinkedModelSerializer):
         super(HostSerializer, self).__init__(*args, **kwargs)
         self.create_object = False
         self.host = None
+        self.workflow_opts = {}
 
     def get_fields(self):
         """
@@ -226,6 +255,13 @@ class HostSerializer(StackdioParentHyperlinkedModelSerializer):
         if errors:
             raise serializers.ValidationError(errors)
 
+        if action == 'add':
+            options_class = workflows.LaunchWorkflowOptions
+        else:
+            options_class = workflows.DestroyWorkflowOptions
+
+        self.workflow_opts = validate_workflow_opts(self.initial_data, options_class)
+
         return attrs
 
     def do_add(self, stack, validated_data):
@@ -235,7 +271,7 @@ class HostSerializer(StackdioParentHyperlinkedModelSerializer):
             host_ids = [h.id for h in hosts]
 
             # Launch celery tasks to create the hosts
-            workflow = workflows.LaunchWorkflow(stack, host_ids=host_ids, opts=self.initial_data)
+            workflow = workflows.LaunchWorkflow(stack, host_ids=host_ids, opts=self.workflow_opts)
             workflow.execute()
 
         return hosts
@@ -255,7 +291,7 @@ class HostSerializer(StackdioParentHyperlinkedModelSerializer):
             )
 
             # Start the celery task chain to kill the hosts
-            workflow = workflows.DestroyHostsWorkflow(stack, host_ids, opts=self.initial_data)
+            workflow = workflows.DestroyHostsWorkflow(stack, host_ids, opts=self.workflow_opts)
             workflow.execute()
 
         return hosts
@@ -316,6 +352,25 @@ class StackHistorySerializer(StackdioHyperlinkedModelSerializer):
         )
 
 
+class StateTimingSerializer(StackdioHyperlinkedModelSerializer):
+    class Meta:
+        model = models.StateTiming
+        fields = (
+            'run_id',
+            'run_type',
+            'stage',
+            'host',
+            'sls',
+            'state_id',
+            'function',
+            'name',
+            'start_time',
+            'duration',
+            'result',
+            'created',
+        )
+
+
 class StackSerializer(CreateOnlyFieldsMixin, StackdioHyperlinkedModelSerializer):
     # Read only fields
     label_list = StackdioLiteralLabelsSerializer(read_only=True, many=True,
@@ -348,6 +403,9 @@ class StackSerializer(CreateOnlyFieldsMixin, StackdioHyperlinkedModelSerializer)
     history = serializers.HyperlinkedIdentityField(
         view_name='api:stacks:stack-history',
         lookup_url_kwarg='parent_pk')
+    timings = serializers.HyperlinkedIdentityField(
+        view_name='api:stacks:stack-timing-list',
+        lookup_url_kwarg='parent_pk')
     security_groups = serializers.HyperlinkedIdentityField(
         view_name='api:stacks:stack-security-groups',
         lookup_url_kwarg='parent_pk')
@@ -389,6 +447,7 @@ class StackSerializer(CreateOnlyFieldsMixin, StackdioHyperlinkedModelSerializer)
             'labels',
             'properties',
             'history',
+            'timings',
             'action',
             'commands',
             'security_groups',
@@ -527,6 +586,18 @@ class FullStackSerializer(StackSerializer):
     blueprint = serializers.PrimaryKeyRelatedField(queryset=Blueprint.objects.all())
     formula_versions = FormulaVersionSerializer(many=True, required=False)
 
+    def __init__(self, *args, **kwargs):
+        super(FullStackSerializer, self).__init__(*args, **kwargs)
+        self.workflow_opts = {}
+
+    def validate(self, attrs):
+        attrs = super(FullStackSerializer, self).validate(attrs)
+
+        self.workflow_opts = validate_workflow_opts(self.initial_data,
+                                                    workflows.LaunchWorkflowOptions)
+
+        return attrs
+
     def create(self, validated_data):
         formula_versions = validated_data.pop('formula_versions', [])
 
@@ -542,8 +613,7 @@ class FullStackSerializer(StackSerializer):
             formula_version_field.create(formula_versions)
 
         # The stack was created, now let's launch it
-        # We'll pass the initial_data in as the opts
-        workflow = workflows.LaunchWorkflow(stack, opts=self.initial_data)
+        workflow = workflows.LaunchWorkflow(stack, opts=self.workflow_opts)
         workflow.execute()
 
         return stack
@@ -625,6 +695,10 @@ class StackActionSerializer(serializers.Serializer):  # pylint: disable=abstract
     action = serializers.CharField(write_only=True)
     args = serializers.ListField(child=serializers.DictField(), required=False)
 
+    def __init__(self, *args, **kwargs):
+        super(StackActionSerializer, self).__init__(*args, **kwargs)
+        self.workflow_opts = {}
+
     def validate(self, attrs):
         stack = self.instance
         action = attrs['action']
@@ -677,6 +751,9 @@ class StackActionSerializer(serializers.Serializer):  # pylint: disable=abstract
                 'args': single_sls_errors,
             })
 
+        self.workflow_opts = validate_workflow_opts(self.initial_data,
+                                                    workflows.ActionWorkflowOptions)
+
         return attrs
 
     def to_representation(self, instance):
@@ -696,7 +773,7 @@ class StackActionSerializer(serializers.Serializer):  # pylint: disable=abstract
         actstream.action.send(request.user, verb='executed {0}'.format(action), target=stack)
 
         # Utilize our workflow to run the action
-        workflow = workflows.ActionWorkflow(stack, action, args)
+        workflow = workflows.ActionWorkflow(stack, action, args, opts=self.workflow_opts)
         workflow.execute()
 
         return self.instance
@@ -704,6 +781,7 @@ class StackActionSerializer(serializers.Serializer):  # pylint: disable=abstract
 
 class StackCommandSerializer(StackdioParentHyperlinkedModelSerializer):
     zip_url = HyperlinkedParentField(view_name='api:stacks:stack-command-zip', parent_attr='stack')
+    std_out = serializers.SerializerMethodField()
 
     class Meta:
         model = models.StackCommand
@@ -719,6 +797,8 @@ class StackCommandSerializer(StackdioParentHyperlinkedModelSerializer):
             'status',
             'host_target',
             'command',
+            'batch_size',
+            'timeout',
             'std_out',
             'std_err',
         )
@@ -727,6 +807,43 @@ class StackCommandSerializer(StackdioParentHyperlinkedModelSerializer):
             'status',
         )
 
+        extra_kwargs = {
+            'timeout': {'min_value': 1},
+        }
+
+    def get_std_out(self, obj):
+        # Link to each host's output rather than embedding it
+        request = self.context.get('request')
+        ret = []
+
+        for output in obj.std_out:
+            output['output_url'] = reverse('api:stacks:stack-command-output',
+                                           kwargs={'parent_pk': obj.stack_id,
+                                                   'pk': obj.pk,
+                                                   'host': output['host']},
+                                           request=request)
+            ret.append(output)
+
+        return ret
+
+    def validate_batch_size(self, value):
+        """
+        Same format as salt's --batch option: either a number of hosts or a percentage
+        """
+        if not value:
+            return value
+
+        number = value[:-1] if value.endswith('%') else value
+
+        try:
+            if int(number) <= 0:
+                raise ValueError()
+        except ValueError:
+            raise serializers.ValidationError('Batch size must be a positive number of hosts '
+                                              'or a percentage (e.g. `10%`).')
+
+        return value
+
     def create(self, validated_data):
         command = super(StackCommandSerializer, self).create(validated_data)
 
@@ -20,9 +20,7 @@
 from __future__ import unicode_literals
 
 import collections
-import json
 import os
-import shutil
 import subprocess
 import time
 import types
@@ -42,16 +40,23 @@ from django.conf import settings
 from django.db import transaction
 from stackdio.api.cloud.models import SecurityGroup
 from stackdio.api.cloud.providers.base import DeleteGroupException
+from stackdio.api.cloud.utils import (
+    get_provider_inventories,
+    invalidate_provider_inventory,
+    run_per_account,
+)
 from stackdio.api.stacks import utils, validators
 from stackdio.api.stacks.exceptions import StackTaskException
 from stackdio.api.stacks.models import Stack, StackCommand, StackHistory
 from stackdio.core.constants import Activity, ComponentStatus, Health
 from stackdio.core.events import trigger_event
-from stackdio.core.utils import auto_retry
+from stackdio.core.utils import auto_retry, copy_file_if_changed
 from stackdio.salt.utils.client import (
+    MinionReadinessListener,
     StackdioLocalClient,
     StackdioRunnerClient,
     StackdioSaltClientException,
+    iter_job_returns,
 )
 from stackdio.salt.utils.cloud import StackdioSaltCloudClient
 
@@ -128,8 +133,9 @@ def copy_global_orchestrate(stack):
         if not os.path.isdir(dest_dir):
             os.mkdir(dest_dir, 0o755)
 
-        shutil.copyfile(src_file, os.path.join(dest_dir,
-                                               'stack_{0}_global_orchestrate.sls'.format(stack.id)))
+        copy_file_if_changed(src_file, os.path.join(dest_dir,
+                                                    'stack_{0}_global_orchestrate.sls'.format(
+                                                        stack.id)))
 
 
 def change_pillar(stack, global_orch):
@@ -158,10 +164,68 @@ def change_pillar(stack, global_orch):
 
 # Tasks that directly operate on stacks
 
+def run_in_batches(stack, client, target, function, batch_size=None, max_failures=None,
+                   **kwargs):
+    """
+    Run a salt function on the target hosts in rolling batches, so the salt master only has
+    to serve batch_size hosts at once.  The rollout stops early once more than max_failures
+    hosts have failed.  Both options can be a number of hosts or a percentage (like '25%').
+    With no batch_size everything runs at once.
+    :return: the same dict StackdioLocalClient.run() returns, for all the batches that ran
+    """
+    try:
+        size = max(utils.parse_host_count(batch_size, len(target), len(target)), 1)
+        allowed_failures = utils.parse_host_count(max_failures, len(target), 0)
+    except (TypeError, ValueError):
+        raise StackTaskException(
+            'Invalid rolling options: batch_size={0!r}, max_failures={1!r}'.format(
+                batch_size,
+                max_failures,
+            )
+        )
+
+    batches = utils.split_into_batches(target, size)
+
+    if len(batches) <= 1:
+        return client.run(target, function, expr_form='list', **kwargs)
+
+    ret = {
+        'failed': False,
+        'failed_hosts': set(),
+        'succeeded_hosts': set(),
+        'num_hosts': 0,
+        'timings': [],
+    }
+
+    for i, batch in enumerate(batches, 1):
+        start = time.time()
+        result = client.run(batch, function, expr_form='list', **kwargs)
+        elapsed = time.time() - start
+
+        ret['failed'] = ret['failed'] or result['failed']
+        ret['failed_hosts'].update(result['failed_hosts'])
+        ret['succeeded_hosts'].update(result['succeeded_hosts'])
+        ret['num_hosts'] += result['num_hosts']
+        ret['timings'].extend(result['timings'])
+
+        msg = 'Batch {0} of {1} ({2} hosts) finished in {3:.1f} seconds with {4} failure(s).'
+        stack.log_history(msg.format(i, len(batches), len(batch), elapsed,
+                                     len(result['failed_hosts'])))
+
+        if len(ret['failed_hosts']) > allowed_failures and i < len(batches):
+            stack.log_history(
+                'Stopping the rollout, {0} host(s) failed and only {1} are allowed to '
+                'fail.'.format(len(ret['failed_hosts']), allowed_failures)
+            )
+            break
+
+    return ret
+
+
 @stack_task(name='stacks.launch_hosts')
 def launch_hosts(stack, max_attempts=3,
                  parallel=True, simulate_launch_failures=False,
-                 simulate_ssh_failures=False, failure_percent=0.3):
+                 simulate_ssh_failures=False, failure_percent=0.3, query_version=None):
     """
     Uses salt cloud to launch machines using the given Stack's map_file
     that was generated when the Stack was created. Salt cloud will
@@ -173,6 +237,7 @@ def launch_hosts(stack, max_attempts=3,
     @param parallel (bool) - if True, salt-cloud will launch the stack
         in parallel using multiprocessing.
     @param max_attempts (int) - the number of attempts to launch the stack
+    @param query_version (str) - the workflow's provider query snapshot version
 
     Failure simulations:
     @param simulate_launch_failures (bool) - if True, will modify the stack's
@@ -192,6 +257,9 @@ def launch_hosts(stack, max_attempts=3,
     # Set the activity right away
     stack.set_activity(Activity.LAUNCHING)
 
+    # Freshly launched minions have never been synced
+    stack.hosts.update(sync_fingerprint='')
+
     hosts = stack.get_hosts()
     num_hosts = len(hosts)
     log_file = utils.get_salt_cloud_log_file(stack, 'launch')
@@ -203,34 +271,28 @@ def launch_hosts(stack, max_attempts=3,
     @auto_retry('launch_hosts', max_attempts, StackTaskException)
     def do_launch(attempt=None):
 
-        salt_cloud = StackdioSaltCloudClient(settings.STACKDIO_CONFIG.salt_cloud_config)
-        query = salt_cloud.query()
-
-        # Check each host to make sure it is running
+        # Check each host to make sure it is running.  Every account is queried
+        # (and re-tagged) concurrently.
+        account_hosts = collections.defaultdict(list)
         for host in hosts:
             account = host.cloud_account
-            provider = account.provider.name
-
-            # Grab the details
-            host_details = query.get(account.slug, {}).get(provider, {}).get(host.hostname)
-
-            if host_details:
-                state = host_details.get('state')
-
-                # Only re-tag if the state exists and it is not running
-                if state and state not in ('running',):
-                    salt_cloud.action(
-                        'set_tags',
-                        names=[host.hostname],
-                        kwargs={
-                            'Name': '{0}-DEL_BY_STACKDIO'.format(host.hostname)
-                        }
-                    )
+            account_hosts[account.slug].append((host.hostname, account.provider.name))
+
+        retagged = run_per_account(
+            utils.retag_stopped_hosts,
+            dict((slug, (slug_hosts, query_version)) for slug, slug_hosts in account_hosts.items()),
+        )
+
+        retagged_hostnames = set()
+        for hostnames in retagged.values():
+            retagged_hostnames.update(hostnames)
 
-                    # Delete the volume IDs on these
-                    for vol in host.volumes.all():
-                        vol.volume_id = ''
-                        vol.save()
+        # Delete the volume IDs on the re-tagged hosts
+        for host in hosts:
+            if host.hostname in retagged_hostnames:
+                for vol in host.volumes.all():
+                    vol.volume_id = ''
+                    vol.save()
 
         logger.info('Task {0} try {1} of {2} for stack {3!r}'.format(
             launch_hosts.name,
@@ -278,12 +340,25 @@ def launch_hosts(stack, max_attempts=3,
         else:
             logger.info('Launching hosts in SERIAL mode.')
 
-        # Launch everything!
-        launch_result = salt_cloud.launch_map(
-            cloud_map=cloud_map,
-            parallel=parallel,
-            log_file=log_file,
-        )
+        # Launch everything!  Each account gets launched concurrently, and all of them
+        # log to the same launch log.
+        salt_cloud = StackdioSaltCloudClient(settings.STACKDIO_CONFIG.salt_cloud_config)
+
+        try:
+            with salt_cloud.log_to_file(log_file=log_file):
+                account_maps = utils.partition_cloud_map(hosts, cloud_map)
+                account_results = run_per_account(
+                    utils.launch_account_map,
+                    dict((slug, (account_map, parallel))
+                         for slug, account_map in account_maps.items()),
+                )
+        finally:
+            # Whatever happened, the provider doesn't look the same anymore
+            invalidate_provider_inventory(account_hosts)
+
+        launch_result = {}
+        for result in account_results.values():
+            launch_result.update(result)
 
         # Look for launch errors
         errors = set()
@@ -321,7 +396,7 @@ def launch_hosts(stack, max_attempts=3,
 
 
 @stack_task(name='stacks.update_metadata', final_task=True)
-def update_metadata(stack, activity=None, host_ids=None):
+def update_metadata(stack, activity=None, host_ids=None, query_version=None):
     if activity is not None:
         # Update activity
         stack.log_history('Collecting host metadata from cloud provider.', activity, host_ids)
@@ -330,13 +405,22 @@ def update_metadata(stack, activity=None, host_ids=None):
     # metadata and store what we want to keep track of.
     logger.info('Updating metadata for stack: {0!r}'.format(stack))
 
-    # Use salt-cloud to look up host information we need now that
-    # the machines are running
-    query_results = stack.query_hosts(force=True)
+    hosts = list(stack.get_hosts(host_ids))
+
+    try:
+        # Only ask the provider about this stack's hosts
+        query_results = stack.describe_hosts(host_ids)
+    except NotImplementedError:
+        # Use salt-cloud to look up host information we need now that
+        # the machines are running
+        query_results = stack.query_hosts(force=True, query_version=query_version)
 
     bad_states = ('terminated', 'shutting-down')
 
-    for host in stack.get_hosts(host_ids):
+    original_metadata = dict((host.pk, utils.get_host_metadata(host)) for host in hosts)
+    volume_ids = {}
+
+    for host in hosts:
         logger.debug('Updating metadata for host {0}'.format(host))
 
         # FIXME: This is cloud provider specific. Should farm it out to
@@ -356,11 +440,13 @@ def update_metadata(stack, activity=None, host_ids=None):
             host.state = 'Absent' if is_absent else host_data['state']
 
         else:
-            # Process the host info
-            utils.process_host_info(host_data, host)
+            # Process the host info, the volumes all get saved together below
+            utils.process_host_info(host_data, host, update_volumes=False)
+            volume_ids[host.pk] = utils.get_attached_volume_ids(host_data)
 
-        # save the host
-        host.save()
+    # Save everything that changed
+    utils.save_host_metadata(stack, hosts, original_metadata)
+    utils.save_volume_ids(volume_ids)
 
     if activity is not None:
         stack.set_activity(Activity.QUEUED, host_ids)
@@ -415,61 +501,77 @@ def register_dns(stack, activity, host_ids=None):
 def ping(stack, activity, interval=5, max_failures=10):
     """
     Attempts to use salt's test.ping module to ping the entire stack
-    and confirm that all hosts are reachable by salt.
+    and confirm that all hosts are reachable by salt.  Hosts that have
+    already answered aren't pinged again, and instead of sleeping between
+    rounds we listen on the salt event bus and re-ping a host as soon as
+    its minion starts.
 
     @stack_id: The id of the stack to ping. We will use salt's grain
                system to target the hosts with this stack id
-    @interval: The looping interval, ie, the amount of time to sleep
-               before the next iteration.
+    @interval: The longest to wait for a minion to connect before
+               pinging every host that hasn't answered yet again.
     @max_failures: Number of ping failures before giving up completely.
-                   The timeout does not affect this parameter.
+                   The timeout does not affect this parameter.  Hosts not
+                   answering a ping sent early because of a minion start
+                   event don't count as failures, only interval rounds do.
     @raises StackTaskException
     """
     stack.log_history('Attempting to ping all hosts.', activity)
-    required_hosts = [h.hostname for h in stack.get_hosts()]
+    pending_hosts = set(h.hostname for h in stack.get_hosts())
 
     client = salt.client.LocalClient(settings.STACKDIO_CONFIG.salt_master_config)
 
     # Execute until successful, failing after a few attempts
     failures = 0
+    false_hosts = set()
 
-    while True:
-        ret = client.cmd_iter(required_hosts, 'test.ping', expr_form='list')
-
-        result = {}
-        for res in ret:
-            for host, data in res.items():
-                result[host] = data
-
-        # check that we got a report back for all hosts
-        pinged_hosts = set(result.keys())
-        missing_hosts = set(required_hosts).difference(pinged_hosts)
-        if missing_hosts:
-            failures += 1
-            logger.debug('The following hosts did not respond to '
-                         'the ping request: {0}; Total failures: '
-                         '{1}'.format(missing_hosts,
-                                      failures))
-
-        false_hosts = []
-        for host, data in result.items():
-            if data['ret'] is not True or data['retcode'] != 0:
-                failures += 1
-                false_hosts.append(host)
+    # Start listening before the first ping so we can't miss a minion connecting
+    with MinionReadinessListener() as listener:
+        targets = set(pending_hosts)
+        event_round = False
 
-        if not missing_hosts and not false_hosts:
-            # Successful ping.
-            break
+        while True:
+            ret = iter_job_returns(client, list(targets), 'test.ping', expr_form='list')
 
-        if failures > max_failures:
-            err_msg = 'Max failures ({0}) reached while pinging hosts.'.format(max_failures)
-            raise StackTaskException(err_msg)
+            result = {}
+            for res in ret:
+                for host, data in res.items():
+                    result[host] = data
 
-        time.sleep(interval)
+            # check that we got a report back for all the hosts we pinged
+            missing_hosts = targets.difference(result)
+            if missing_hosts and not event_round:
+                failures += 1
+                logger.debug('The following hosts did not respond to '
+                             'the ping request: {0}; Total failures: '
+                             '{1}'.format(missing_hosts,
+                                          failures))
+
+            for host, data in result.items():
+                if data['ret'] is not True or data['retcode'] != 0:
+                    failures += 1
+                    false_hosts.add(host)
+                else:
+                    # This one is done, don't ping it again
+                    false_hosts.discard(host)
+                    pending_hosts.discard(host)
+
+            if not pending_hosts:
+                # Successful ping.
+                break
+
+            if failures > max_failures:
+                if false_hosts:
+                    err_msg = 'Unable to ping hosts: {0}'.format(', '.join(false_hosts))
+                else:
+                    err_msg = 'Max failures ({0}) reached while pinging hosts.'.format(max_failures)
+                raise StackTaskException(err_msg)
 
-    if false_hosts:
-        err_msg = 'Unable to ping hosts: {0}'.format(', '.join(false_hosts))
-        raise StackTaskException(err_msg)
+            # Ping the hosts that just connected right away, or everything that's
+            # left if nobody connects in time
+            ready_hosts = listener.wait(pending_hosts, interval)
+            event_round = bool(ready_hosts)
+            targets = ready_hosts or set(pending_hosts)
 
     stack.log_history('All hosts pinged successfully.')
 
@@ -481,39 +583,64 @@ def sync_all(stack):
 
     logger.info('Syncing all salt systems for stack: {0!r}'.format(stack))
 
-    # Generate all the files before we sync
+    # Generate all the files before we sync (these are only written if they changed)
     stack.generate_orchestrate_file()
     stack.generate_global_orchestrate_file()
 
-    target = [h.hostname for h in stack.get_hosts()]
+    # Only sync the hosts that haven't been synced with exactly what we'd push out now
+    fingerprint = stack.get_sync_fingerprint()
+
+    hosts = stack.get_hosts()
+    target = [h.hostname for h in hosts if h.sync_fingerprint != fingerprint]
+
+    if not target:
+        stack.log_history('Salt systems are already up to date on all hosts.')
+        return
+
+    logger.info('Syncing {0} of {1} hosts'.format(len(target), len(hosts)))
+
     client = salt.client.LocalClient(settings.STACKDIO_CONFIG.salt_master_config)
 
-    ret = client.cmd_iter(target, 'saltutil.sync_all', kwarg={'saltenv': 'base'}, expr_form='list')
+    ret = iter_job_returns(client, target, 'saltutil.sync_all', kwarg={'saltenv': 'base'},
+                           expr_form='list')
 
     result = {}
     for res in ret:
         for host, data in res.items():
             result[host] = data
 
+    synced_hosts = []
+    errors = []
+
     for host, data in result.items():
         if 'retcode' not in data:
             logger.warning('Host {0} missing a retcode... assuming failure'.format(host))
 
         if data.get('retcode', 1) != 0:
-            err_msg = six.text_type(data['ret'])
-            raise StackTaskException('Error syncing salt data: {0!r}'.format(err_msg))
+            errors.append(six.text_type(data['ret']))
+        else:
+            synced_hosts.append(host)
+
+    # Remember the hosts that made it, so a retry doesn't have to sync them again
+    stack.hosts.filter(hostname__in=synced_hosts).update(sync_fingerprint=fingerprint)
+
+    if errors:
+        raise StackTaskException('Error syncing salt data: {0!r}'.format(errors[0]))
 
     stack.log_history('Finished synchronizing salt systems on all hosts.')
 
 
 @stack_task(name='stacks.highstate')
-def highstate(stack, max_attempts=3):
+def highstate(stack, max_attempts=3, batch_size=None, max_failures=None):
     """
     Executes the state.highstate function on the stack using the default
     stackdio top file. That top tile will only target the 'base'
     environment and core states for the stack. These core states are
     purposely separate from others to provision hosts with things that
     stackdio needs.
+
+    Pass in batch_size (and optionally max_failures) to provision the hosts
+    in rolling batches.  See run_in_batches.
     """
     stack.set_activity(Activity.PROVISIONING)
 
@@ -551,7 +678,10 @@ def highstate(stack, max_attempts=3):
                                  root_dir=root_dir,
                                  log_dir=log_dir) as client:
 
-            results = client.run(target, 'state.highstate', expr_form='list')
+            results = run_in_batches(stack, client, target, 'state.highstate',
+                                     batch_size=batch_size, max_failures=max_failures)
+
+            stack.record_state_timings(client.run_type, results['timings'])
 
             if results['failed']:
                 raise StackTaskException(
@@ -572,7 +702,7 @@ def highstate(stack, max_attempts=3):
 
 
 @stack_task(name='stacks.propagate_ssh')
-def propagate_ssh(stack, max_attempts=3):
+def propagate_ssh(stack, max_attempts=3, batch_size=None, max_failures=None):
     """
     Similar to stacks.highstate, except we only run `core.stackdio_users`
     instead of `core.*`.  This is useful so that ssh keys can be added to
@@ -611,7 +741,11 @@ def propagate_ssh(stack, max_attempts=3):
                                  root_dir=root_dir,
                                  log_dir=log_dir) as client:
 
-            results = client.run(target, 'state.sls', arg=['core.stackdio_users'], expr_form='list')
+            results = run_in_batches(stack, client, target, 'state.sls',
+                                     batch_size=batch_size, max_failures=max_failures,
+                                     arg=['core.stackdio_users'])
+
+            stack.record_state_timings(client.run_type, results['timings'])
 
             if results['failed']:
                 raise StackTaskException(
@@ -700,6 +834,8 @@ def global_orchestrate(stack, max_attempts=3):
             except StackdioSaltClientException as e:
                 raise StackTaskException('Global orchestration failed: {}'.format(six.text_type(e)))
 
+            stack.record_state_timings(client.run_type, result['timings'])
+
             if result['failed']:
                 err_msg = 'Global Orchestration errors on components: ' \
                           '{0}. Please see the global orchestration errors ' \
@@ -777,6 +913,8 @@ def orchestrate(stack, max_attempts=3):
             except StackdioSaltClientException as e:
                 raise StackTaskException('Orchestration failed: {}'.format(six.text_type(e)))
 
+            stack.record_state_timings(client.run_type, result['timings'])
+
             utils.set_component_statuses(stack, result)
 
             if result['failed']:
@@ -878,6 +1016,8 @@ def single_sls(stack, component, host_target, max_attempts=3):
                 expr_form=expr_form,
             )
 
+            stack.record_state_timings(client.run_type, results['timings'])
+
             if results['failed']:
                 raise StackTaskException(
                     'Single SLS {} errors on hosts: '
@@ -965,7 +1105,16 @@ def destroy_hosts(stack, host_ids=None, delete_hosts=True, delete_security_group
         else:
             logger.info('Destroying complete stack: {0!r}'.format(stack))
 
-        result = salt_cloud.destroy_map(stack.generate_cloud_map(), hosts, parallel=parallel)
+        # Figure out what to destroy from the shared provider inventory, so concurrent
+        # destroys on the same account only query the provider once
+        account_slugs = set(host.cloud_account.slug for host in hosts)
+        inventories = get_provider_inventories(account_slugs)
+
+        try:
+            result = salt_cloud.destroy_map(stack.generate_cloud_map(), hosts,
+                                            provider_query=inventories, parallel=parallel)
+        finally:
+            invalidate_provider_inventory(account_slugs)
 
         # Error checking?
         for provider in result.values():
@@ -1088,25 +1237,42 @@ def run_command(command_id):
     command.start = datetime.now()
     command.save()
 
+    target = '{0} and G@stack_id:{1}'.format(command.host_target, stack.id)
+
+    kwargs = {
+        'expr_form': 'compound',
+    }
+
+    if command.timeout:
+        # Make sure both salt and the command itself give up on hung hosts
+        kwargs['timeout'] = command.timeout
+        kwargs['kwarg'] = {'timeout': command.timeout}
+
+        # cmd_batch ignores the timeout kwarg and only looks at the client's opts
+        salt_client.opts['timeout'] = command.timeout
+
     try:
-        res = salt_client.cmd_iter(
-            '{0} and G@stack_id:{1}'.format(command.host_target, stack.id),
-            'cmd.run',
-            [command.command],
-            expr_form='compound',
-        )
+        if command.batch_size:
+            res = salt_client.cmd_batch(target, 'cmd.run', [command.command],
+                                        batch=command.batch_size, **kwargs)
+        else:
+            res = salt_client.cmd_iter(target, 'cmd.run', [command.command],
+                                       expect_minions=True, **kwargs)
 
-        result = {}
+        # Stream each host's output to disk as it comes back rather than holding it all
+        # in memory.  Only the index of hosts / sizes ends up in the database, and it's saved
+        # after every host so the API shows results as they arrive.
         for ret in res:
-            for k, v in ret.items():
-                result[k] = v
+            for host, data in ret.items():
+                if command.batch_size:
+                    # The batch client yields the return value directly
+                    output = utils.get_batch_command_output(data)
+                else:
+                    output = utils.get_command_output(data)
 
-        # Convert to an easier format for javascript
-        ret = []
-        for host, output in result.items():
-            ret.append({'host': host, 'output': output['ret']})
+                command.write_output(host, output)
+                command.save(update_fields=['std_out_index', 'modified'])
 
-        command.std_out_storage = json.dumps(ret)
         command.status = StackCommand.FINISHED
 
         command.save()
@@ -1167,13 +1333,13 @@ def update_host_info():
                 host_info = account_info.get(host.hostname)
 
                 old_state = host.state
-                old_activity = host.activity
+                old_activity = host.get_activity()
 
                 # Check for terminated host state
                 if not host_info:
                     # If we're queued or launching, we may have just not been launched yet,
                     # so we don't want to be terminated in that case
-                    if host.activity not in (Activity.QUEUED, Activity.LAUNCHING):
+                    if old_activity not in (Activity.QUEUED, Activity.LAUNCHING):
                         host.state = 'terminated'
                 else:
                     host.state = host_info['state']
@@ -1189,16 +1355,16 @@ def update_host_info():
                 # Only change the host activity if the state is terminated and we are
                 # not currently terminated or terminating
                 if host.state in ('terminated',):
-                    if host.activity not in (Activity.TERMINATING, Activity.TERMINATED):
+                    if old_activity not in (Activity.TERMINATING, Activity.TERMINATED):
                         host.activity = Activity.DEAD
 
                 # Change the activity back to idle if we're no longer dead
-                if host.activity == Activity.DEAD and host.state not in ('terminated',):
+                if host.get_activity() == Activity.DEAD and host.state not in ('terminated',):
                     host.activity = Activity.IDLE
 
-                new_host_activities.append(host.activity)
+                new_host_activities.append(host.get_activity())
 
-                if old_activity != Activity.DEAD and host.activity == Activity.DEAD:
+                if old_activity != Activity.DEAD and host.get_activity() == Activity.DEAD:
                     newly_dead_hosts.append(host.hostname)
 
                 # save the host
@@ -1214,13 +1380,17 @@ def update_host_info():
 
             all_dead = all([a == Activity.DEAD for a in new_host_activities])
 
+            new_activity = stack.activity
+
             # If all the hosts are dead, set the stack to dead also
             if all_dead and new_host_activities:
-                stack.activity = Activity.DEAD
+                new_activity = Activity.DEAD
 
             # If the stack is currently marked dead and all the hosts are NOT dead, then set the
             # activity to idle.
             if stack.activity == Activity.DEAD and not all_dead:
-                stack.activity = Activity.IDLE
+                new_activity = Activity.IDLE
 
-            stack.save(update_fields=['activity'])
+            if new_activity != stack.activity:
+                # Leave the host activities as they are
+                stack.set_activity(new_activity, [])
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+import io
+import logging
+import shutil
+import tempfile
+from datetime import timedelta
+
+import mock
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+from stackdio.api.blueprints.models import Blueprint, BlueprintHostDefinition, BlueprintVolume
+from stackdio.api.cloud.models import CloudAccount, CloudImage
+from stackdio.api.stacks import tasks, utils, workflows
+from stackdio.api.stacks.exceptions import StackTaskException
+from stackdio.api.stacks.models import Host, Stack, StackCommand, StateTiming
+from stackdio.api.stacks.serializers import validate_workflow_opts
+from stackdio.api.volumes.models import Volume
+from stackdio.core.tests.utils import StackdioTestCase
+
+logger = logging.getLogger(__name__)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StackTestCase(StackdioTestCase):
+    """
+    Sets up a stack with a couple of hosts in the database, nothing is launched
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super(StackTestCase, cls).setUpTestData()
+
+        cls.account = CloudAccount.objects.create(
+            provider_id=1,
+            region_id=1,
+            title='test',
+            description='test',
+            vpc_id='vpc-blah',
+        )
+
+        cls.image = CloudImage.objects.create(
+            account=cls.account,
+            title='test',
+            description='test',
+            image_id='ami-blah',
+            default_instance_size_id=1,
+            ssh_user='root',
+        )
+
+        cls.blueprint = Blueprint.objects.create(
+            title='test',
+            description='test',
+            create_users=False,
+        )
+
+        cls.host_definition = BlueprintHostDefinition.objects.create(
+            blueprint=cls.blueprint,
+            cloud_image=cls.image,
+            title='test',
+            description='test',
+            count=2,
+            hostname_template='{namespace}-test-{index}',
+            size_id=1,
+        )
+
+        # Don't go through Stack.objects.create(), that generates the hosts & security groups
+        cls.stack = Stack(
+            blueprint=cls.blueprint,
+            title='test',
+            description='test',
+            namespace='test',
+            create_users=False,
+        )
+        cls.stack.save()
+
+        cls.hosts = [
+            Host.objects.create(
+                stack=cls.stack,
+                blueprint_host_definition=cls.host_definition,
+                hostname='test-test-{0}'.format(i),
+                index=i,
+            )
+            for i in range(2)
+        ]
+
+
+class QueryHostsTestCase(StackTestCase):
+
+    @mock.patch('stackdio.api.stacks.models.get_provider_inventories')
+    def test_query_hosts(self, get_provider_inventories):
+        get_provider_inventories.return_value = {
+            self.account.slug: {
+                'ec2': {
+                    'test-test-0': {'state': 'running'},
+                },
+            },
+        }
+
+        # The accounts for every host should come along with the hosts themselves
+        with self.assertNumQueries(1):
+            result = self.stack.query_hosts(force=True, query_version='abc')
+
+        self.assertEqual(result, {
+            'test-test-0': {'state': 'running'},
+            'test-test-1': None,
+        })
+
+        get_provider_inventories.assert_called_once_with(
+            [self.account.slug, self.account.slug],
+            version='abc',
+            max_age=0,
+        )
+
+    @mock.patch('stackdio.api.stacks.models.get_provider_inventories')
+    def test_query_hosts_missing_account(self, get_provider_inventories):
+        get_provider_inventories.return_value = {}
+
+        result = self.stack.query_hosts()
+
+        self.assertEqual(result, {
+            'test-test-0': None,
+            'test-test-1': None,
+        })
+
+        get_provider_inventories.assert_called_once_with(
+            [self.account.slug, self.account.slug],
+            version=None,
+            max_age=None,
+        )
+
+
+class HostMetadataTestCase(StackTestCase):
+
+    def get_updates(self, queries):
+        return [q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_unchanged(self):
+        hosts = list(self.stack.hosts.all())
+        original_metadata = dict((host.pk, utils.get_host_metadata(host)) for host in hosts)
+
+        with self.assertNumQueries(0):
+            utils.save_host_metadata(self.stack, hosts, original_metadata)
+
+    def test_only_changed_hosts_written(self):
+        hosts = list(self.stack.hosts.order_by('index'))
+        original_metadata = dict((host.pk, utils.get_host_metadata(host)) for host in hosts)
+        modified = hosts[1].modified
+
+        hosts[0].state = 'running'
+        hosts[0].instance_id = 'i-12345'
+
+        with CaptureQueriesContext(connection) as queries:
+            utils.save_host_metadata(self.stack, hosts, original_metadata)
+
+        self.assertEqual(len(self.get_updates(queries)), 1)
+
+        changed = Host.objects.get(pk=hosts[0].pk)
+        self.assertEqual(changed.state, 'running')
+        self.assertEqual(changed.instance_id, 'i-12345')
+
+        # The other host wasn't touched at all
+        self.assertEqual(Host.objects.get(pk=hosts[1].pk).modified, modified)
+
+    def test_same_metadata_shares_update(self):
+        hosts = list(self.stack.hosts.all())
+        original_metadata = dict((host.pk, utils.get_host_metadata(host)) for host in hosts)
+
+        for host in hosts:
+            host.state = 'Absent'
+            host.sir_id = 'NA'
+
+        with CaptureQueriesContext(connection) as queries:
+            utils.save_host_metadata(self.stack, hosts, original_metadata)
+
+        self.assertEqual(len(self.get_updates(queries)), 1)
+        self.assertEqual(set(Host.objects.values_list('state', flat=True)), {'Absent'})
+
+    def test_save_volume_ids(self):
+        blueprint_volume = BlueprintVolume.objects.create(host=self.host_definition,
+                                                          device='/dev/sdb',
+                                                          mount_point='/mnt/data')
+        volumes = [Volume.objects.create(host=host, blueprint_volume=blueprint_volume)
+                   for host in self.hosts]
+
+        with CaptureQueriesContext(connection) as queries:
+            utils.save_volume_ids({
+                self.hosts[0].pk: {'/dev/sdb': 'vol-12345'},
+                self.hosts[1].pk: {},
+            })
+
+        # One query to read the volumes, and one update for the volume that changed
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertEqual(Volume.objects.get(pk=volumes[0].pk).volume_id, 'vol-12345')
+        self.assertEqual(Volume.objects.get(pk=volumes[1].pk).volume_id, '')
+
+
+class StateTimingTestCase(StackTestCase):
+
+    def get_timing(self, duration):
+        return {
+            'stage': '',
+            'host': 'test-test-0',
+            'sls': 'nginx',
+            'state_id': 'nginx',
+            'function': 'pkg.installed',
+            'name': 'nginx',
+            'start_time': '10:15:01.123456',
+            'duration': duration,
+            'result': True,
+        }
+
+    def test_record_state_timings(self):
+        run_id = self.stack.record_state_timings('provisioning', [self.get_timing(1500.5),
+                                                                  self.get_timing(2.0)])
+
+        timings = StateTiming.objects.filter(run_id=run_id)
+        self.assertEqual(timings.count(), 2)
+        self.assertEqual(sorted(timings.values_list('duration', flat=True)), [2.0, 1500.5])
+        self.assertEqual(timings[0].start_time.microsecond, 123456)
+
+    def test_nothing_to_record(self):
+        self.assertIsNone(self.stack.record_state_timings('provisioning', []))
+        self.assertEqual(StateTiming.objects.count(), 0)
+
+    def test_old_runs_deleted(self):
+        max_runs = settings.STACKDIO_CONFIG.get('state_timing_max_runs', 10)
+        start = timezone.now() - timedelta(days=1)
+
+        run_ids = []
+        for i in range(max_runs + 1):
+            run_id = self.stack.record_state_timings('provisioning', [self.get_timing(i)])
+            run_ids.append(run_id)
+
+            # Space the runs out so they're ordered no matter how fast this runs
+            StateTiming.objects.filter(run_id=run_id).update(created=start + timedelta(minutes=i))
+
+        # Only the oldest run is gone
+        kept = set(StateTiming.objects.values_list('run_id', flat=True))
+        self.assertEqual(kept, set(run_ids[1:]))
+
+        # Other run types are counted separately
+        self.stack.record_state_timings('orchestration', [self.get_timing(1.0)])
+        self.assertEqual(StateTiming.objects.filter(run_type='provisioning').count(), max_runs)
+
+
+class RunCommandTestCase(StackTestCase):
+
+    def setUp(self):
+        super(RunCommandTestCase, self).setUp()
+
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir, ignore_errors=True)
+
+        settings_override = override_settings(FILE_STORAGE_DIRECTORY=storage_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patcher = mock.patch('salt.client.LocalClient')
+        self.salt_client = patcher.start().return_value
+        self.salt_client.opts = {'timeout': 5}
+        self.addCleanup(patcher.stop)
+
+    def get_output(self, command, host):
+        with io.open(command.get_output_file_path(host), 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def test_batch_no_return(self):
+        command = StackCommand.objects.create(stack=self.stack, host_target='*',
+                                              command='ls', batch_size='1', timeout=30)
+
+        # cmd_batch hands back an empty dict for a minion that never returned
+        self.salt_client.cmd_batch.return_value = iter([
+            {'test-test-0': 'file.txt'},
+            {'test-test-1': {}},
+        ])
+
+        tasks.run_command(command.id)
+
+        # The timeout has to be on the client's opts, cmd_batch ignores the kwarg
+        self.assertEqual(self.salt_client.opts['timeout'], 30)
+
+        kwargs = self.salt_client.cmd_batch.call_args[1]
+        self.assertEqual(kwargs['batch'], '1')
+        self.assertEqual(kwargs['kwarg'], {'timeout': 30})
+
+        command.refresh_from_db()
+        self.assertEqual(command.status, StackCommand.FINISHED)
+        self.assertEqual(set(command.std_out_index), {'test-test-0', 'test-test-1'})
+        self.assertEqual(self.get_output(command, 'test-test-0'), 'file.txt')
+        self.assertEqual(self.get_output(command, 'test-test-1'), utils.NO_RETURN_OUTPUT)
+        self.assertEqual(command.std_out_index['test-test-1'], len(utils.NO_RETURN_OUTPUT))
+
+    def test_no_return(self):
+        command = StackCommand.objects.create(stack=self.stack, host_target='*', command='ls')
+
+        self.salt_client.cmd_iter.return_value = iter([
+            {'test-test-0': {'ret': 'file.txt', 'retcode': 0}},
+            {'test-test-1': {'failed': True}},
+        ])
+
+        tasks.run_command(command.id)
+
+        # No timeout on the command leaves salt's alone
+        self.assertEqual(self.salt_client.opts['timeout'], 5)
+        self.assertNotIn('timeout', self.salt_client.cmd_iter.call_args[1])
+
+        command.refresh_from_db()
+        self.assertEqual(command.status, StackCommand.FINISHED)
+        self.assertEqual(self.get_output(command, 'test-test-0'), 'file.txt')
+        self.assertEqual(self.get_output(command, 'test-test-1'), utils.NO_RETURN_OUTPUT)
+
+
+class RollingBatchTestCase(SimpleTestCase):
+
+    def get_client(self, failed_hosts=()):
+        """
+        A client whose run() fails the given hosts and succeeds the rest
+        """
+        def run(target, function, **kwargs):
+            failed = set(target) & set(failed_hosts)
+            return {
+                'failed': bool(failed),
+                'failed_hosts': failed,
+                'succeeded_hosts': set(target) - failed,
+                'num_hosts': len(target),
+                'timings': [],
+            }
+
+        client = mock.Mock()
+        client.run.side_effect = run
+        return client
+
+    def test_parse_host_count(self):
+        self.assertEqual(utils.parse_host_count(None, 10, 4), 4)
+        self.assertEqual(utils.parse_host_count('', 10, 4), 4)
+        self.assertEqual(utils.parse_host_count(3, 10, 4), 3)
+        self.assertEqual(utils.parse_host_count(' 3 ', 10, 4), 3)
+        self.assertEqual(utils.parse_host_count(0, 10, 4), 0)
+
+        # Percentages round up
+        self.assertEqual(utils.parse_host_count('25%', 10, 4), 3)
+        self.assertEqual(utils.parse_host_count('100%', 10, 4), 10)
+        self.assertEqual(utils.parse_host_count('0%', 10, 4), 0)
+
+    def test_parse_host_count_invalid(self):
+        for value in ('abc', '-1', -1, '101%', '-5%', 'abc%'):
+            with self.assertRaises(ValueError):
+                utils.parse_host_count(value, 10, 4)
+
+    def test_split_into_batches(self):
+        hosts = ['a', 'b', 'c', 'd', 'e']
+
+        self.assertEqual(utils.split_into_batches(hosts, 2), [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(utils.split_into_batches(hosts, 5), [hosts])
+        self.assertEqual(utils.split_into_batches(hosts, 10), [hosts])
+        self.assertEqual(utils.split_into_batches([], 2), [])
+
+    def test_run_in_batches_all_at_once(self):
+        stack = mock.Mock()
+        client = self.get_client()
+
+        ret = tasks.run_in_batches(stack, client, ['a', 'b', 'c'], 'state.highstate')
+
+        client.run.assert_called_once_with(['a', 'b', 'c'], 'state.highstate', expr_form='list')
+        self.assertEqual(ret['num_hosts'], 3)
+        stack.log_history.assert_not_called()
+
+    def test_run_in_batches(self):
+        stack = mock.Mock()
+        client = self.get_client()
+
+        ret = tasks.run_in_batches(stack, client, ['a', 'b', 'c', 'd', 'e'], 'state.highstate',
+                                   batch_size=2)
+
+        self.assertEqual([c[0][0] for c in client.run.call_args_list],
+                         [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertFalse(ret['failed'])
+        self.assertEqual(ret['num_hosts'], 5)
+        self.assertEqual(ret['succeeded_hosts'], {'a', 'b', 'c', 'd', 'e'})
+
+    def test_run_in_batches_stops_on_failure(self):
+        stack = mock.Mock()
+        client = self.get_client(failed_hosts=['c'])
+
+        ret = tasks.run_in_batches(stack, client, ['a', 'b', 'c', 'd', 'e'], 'state.highstate',
+                                   batch_size=2)
+
+        # No failures are allowed by default, so the last batch never runs
+        self.assertEqual(client.run.call_count, 2)
+        self.assertTrue(ret['failed'])
+        self.assertEqual(ret['failed_hosts'], {'c'})
+        self.assertEqual(ret['num_hosts'], 4)
+
+    def test_run_in_batches_max_failures(self):
+        stack = mock.Mock()
+        client = self.get_client(failed_hosts=['a', 'c', 'd'])
+
+        ret = tasks.run_in_batches(stack, client, ['a', 'b', 'c', 'd', 'e', 'f'],
+                                   'state.highstate', batch_size=2, max_failures='40%')
+
+        # 40% of 6 hosts rounds up to 3 failures allowed, so the rollout keeps going
+        self.assertEqual(client.run.call_count, 3)
+        self.assertEqual(ret['failed_hosts'], {'a', 'c', 'd'})
+
+        client = self.get_client(failed_hosts=['a', 'c', 'd'])
+
+        tasks.run_in_batches(stack, client, ['a', 'b', 'c', 'd', 'e', 'f'],
+                             'state.highstate', batch_size=2, max_failures=2)
+
+        self.assertEqual(client.run.call_count, 2)
+
+    def test_run_in_batches_invalid_options(self):
+        with self.assertRaises(StackTaskException):
+            tasks.run_in_batches(mock.Mock(), self.get_client(), ['a', 'b'],
+                                 'state.highstate', batch_size='abc')
+
+    def test_validate_workflow_opts(self):
+        opts = validate_workflow_opts({
+            'rolling_batch_size': '25%',
+            'rolling_max_failures': 1,
+            'max_attempts': 2,
+            'title': 'not an option',
+        }, workflows.ActionWorkflowOptions)
+
+        self.assertEqual(opts, {
+            'rolling_batch_size': '25%',
+            'rolling_max_failures': 1,
+            'max_attempts': 2,
+        })
+
+        with self.assertRaises(ValidationError) as cm:
+            validate_workflow_opts({
+                'rolling_batch_size': 'abc',
+                'rolling_max_failures': '150%',
+            }, workflows.LaunchWorkflowOptions)
+
+        self.assertEqual(set(cm.exception.detail), {'rolling_batch_size',
+                                                    'rolling_max_failures'})
@@ -94,6 +94,14 @@ urlpatterns = (
         api.StackHistoryAPIView.as_view(),
         name='stack-history'),
 
+    url(r'^(?P<parent_pk>[0-9]+)/timings/$',
+        api.StackTimingListAPIView.as_view(),
+        name='stack-timing-list'),
+
+    url(r'^(?P<parent_pk>[0-9]+)/timings/summary/$',
+        api.StackTimingSummaryAPIView.as_view(),
+        name='stack-timing-summary'),
+
     url(r'^(?P<parent_pk>[0-9]+)/logs/$',
         api.StackLogsAPIView.as_view(),
         name='stack-logs'),
@@ -118,6 +126,10 @@ urlpatterns = (
         api.StackCommandZipAPIView.as_view(),
         name='stack-command-zip'),
 
+    url(r'^(?P<parent_pk>[0-9]+)/commands/(?P<pk>[0-9]+)/output/(?P<host>[^/]+)/$',
+        api.StackCommandOutputAPIView.as_view(),
+        name='stack-command-output'),
+
     url(r'^(?P<parent_pk>[0-9]+)/security_groups/$',
         api.StackSecurityGroupsAPIView.as_view(),
         name='stack-security-groups'),
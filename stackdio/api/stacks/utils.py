@@ -17,14 +17,29 @@
 
 from __future__ import print_function, unicode_literals
 
+import hashlib
 import logging
+import math
 import os
 import random
+from collections import defaultdict
 from datetime import datetime
 
 import salt.config
+import six
 from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from stackdio.api.cloud.utils import (
+    get_account_cloud_client,
+    get_provider_inventory,
+    invalidate_provider_inventory,
+)
+from stackdio.api.volumes.models import Volume
+from stackdio.core.caching import delete_cached
 from stackdio.core.constants import Action, ComponentStatus
+from stackdio.core.permissions import get_permission_resolver
+from stackdio.core.utils import get_file_hash
 from stackdio.salt.utils.cloud import StackdioSaltCloudMap, catch_salt_cloud_map_failures
 
 logger = logging.getLogger(__name__)
@@ -50,6 +65,7 @@ def set_component_statuses(stack, orch_result):
 
 
 def filter_actions(user, stack, actions):
+    resolver = get_permission_resolver(user)
     ret = []
     for action in actions:
         the_action = action
@@ -57,18 +73,72 @@ def filter_actions(user, stack, actions):
             the_action = 'execute'
         elif action == Action.PROPAGATE_SSH:
             the_action = 'admin'
-        if user.has_perm('stacks.{0}_stack'.format(the_action.lower()), stack):
+        if resolver.has_perm('stacks.{0}_stack'.format(the_action.lower()), stack):
             ret.append(action)
 
     return ret
 
 
-def process_host_info(host_info, host):
+NO_RETURN_OUTPUT = 'Minion did not return.'
+
+
+def get_command_output(data):
+    """
+    Pull the output for a single host out of the data returned by salt's cmd_iter.
+    Hosts that never returned (via expect_minions) get a message instead of output.
+    :param data: the per-host dict yielded by cmd_iter
+    :return: the output for the host
+    """
+    if data.get('failed'):
+        return NO_RETURN_OUTPUT
+    return data.get('ret', '')
+
+
+def get_batch_command_output(data):
+    """
+    Same as get_command_output, but for the return values yielded by salt's cmd_batch.
+    Hosts that never returned come back as an empty dict.
+    :param data: the per-host return value yielded by cmd_batch
+    :return: the output for the host
+    """
+    if isinstance(data, dict) and not data:
+        return NO_RETURN_OUTPUT
+    return data
+
+
+# The host fields that come from the cloud provider
+HOST_METADATA_FIELDS = (
+    'state',
+    'instance_id',
+    'sir_id',
+    'provider_public_dns',
+    'provider_private_dns',
+    'provider_public_ip',
+    'provider_private_ip',
+)
+
+
+def get_attached_volume_ids(host_info):
+    """
+    Get the volumes attached to a host from the salt cloud host dict.
+    :return: a dict of device name -> volume id
+    """
+    block_device_mappings_parent = host_info.get('blockDeviceMapping') or {}
+    block_device_mappings = block_device_mappings_parent.get('item') or []
+
+    if not isinstance(block_device_mappings, list):
+        block_device_mappings = [block_device_mappings]
+
+    return {bdm['deviceName']: bdm['ebs']['volumeId'] for bdm in block_device_mappings}
+
+
+def process_host_info(host_info, host, update_volumes=True):
     """
     Process the host info object received from salt cloud.
     This *DOES NOT* save the host, it only updates fields on the host.
     :param host_info: the salt-cloud host dict
     :param host: the stackdio host object
+    :param update_volumes: whether to update (and save) the host's volumes too
     """
     # Set the host state
     host.state = host_info.get('state') or 'unknown'
@@ -87,28 +157,15 @@ def process_host_info(host_info, host):
     host.provider_public_ip = host_info.get('ipAddress')
     host.provider_private_ip = host_info.get('privateIpAddress')
 
-    # update volume information
-    block_device_mappings_parent = host_info.get('blockDeviceMapping') or {}
-    block_device_mappings = block_device_mappings_parent.get('item') or []
+    if update_volumes:
+        volume_ids = get_attached_volume_ids(host_info)
 
-    if not isinstance(block_device_mappings, list):
-        block_device_mappings = [block_device_mappings]
-
-    # Build up a map of device name -> device mapping
-    bdm_map = {bdm['deviceName']: bdm for bdm in block_device_mappings}
-
-    # For each volume we allegedly have, make sure it is attached to the host.
-    # If we can't find it, forget the volume_id
-    # Otherwise update the volume_id
-    for volume in host.volumes.all():
-        if volume.device in bdm_map:
-            # update the volume_id info
-            volume.volume_id = bdm_map[volume.device]['ebs']['volumeId']
-        else:
-            # The volume is gone - reflect this on the volume model
-            volume.volume_id = ''
-
-        volume.save()
+        # For each volume we allegedly have, make sure it is attached to the host.
+        # If we can't find it, forget the volume_id
+        # Otherwise update the volume_id
+        for volume in host.volumes.all():
+            volume.volume_id = volume_ids.get(volume.device, '')
+            volume.save()
 
     # Update spot instance metadata
     if 'spotInstanceRequestId' in host_info:
@@ -117,6 +174,75 @@ def process_host_info(host_info, host):
         host.sir_id = ''
 
 
+def get_host_metadata(host):
+    return tuple(getattr(host, field) for field in HOST_METADATA_FIELDS)
+
+
+def save_host_metadata(stack, hosts, original_metadata):
+    """
+    Write the provider metadata for the given hosts, only touching the hosts that changed.
+    Hosts that ended up with identical metadata (e.g. all absent) share a single UPDATE.
+    :param original_metadata: a dict of host id -> get_host_metadata() from before the
+                              hosts were modified
+    """
+    # Import here to not cause circular imports
+    from stackdio.api.stacks.models import Host
+
+    changes = defaultdict(list)
+    for host in hosts:
+        metadata = get_host_metadata(host)
+        if metadata != original_metadata[host.pk]:
+            changes[metadata].append(host.pk)
+
+    if not changes:
+        return
+
+    timestamp = now()
+
+    with transaction.atomic(using=Host.objects.db):
+        for metadata, host_ids in changes.items():
+            fields = dict(zip(HOST_METADATA_FIELDS, metadata))
+            Host.objects.filter(pk__in=host_ids).update(modified=timestamp, **fields)
+
+    # update() doesn't send post_save, so do what host_post_save would have (just once)
+    cache_keys = [
+        'stack-{}-host-count'.format(stack.id),
+        'stack-{}-hosts'.format(stack.id),
+        'stack-{}-health'.format(stack.id),
+    ]
+    for host_ids in changes.values():
+        cache_keys.extend('host-{}-health'.format(host_id) for host_id in host_ids)
+    delete_cached(cache_keys)
+
+    # Pre-cache these by accessing them
+    stack.get_cached_hosts()
+    stack.host_count
+    stack.health
+
+
+def save_volume_ids(volume_ids):
+    """
+    Update the volume ids for the volumes on the given hosts.  Volumes that aren't attached
+    anymore lose their volume id.
+    :param volume_ids: a dict of host id -> get_attached_volume_ids() for that host
+    """
+    # Only pull the columns we compare - the device lives on the blueprint volume
+    volumes = Volume.objects.filter(host_id__in=list(volume_ids)).values_list(
+        'id', 'host_id', 'blueprint_volume__device', 'volume_id',
+    )
+
+    changes = defaultdict(list)
+    for pk, host_id, device, current_volume_id in volumes:
+        volume_id = volume_ids[host_id].get(device, '')
+        if volume_id != current_volume_id:
+            changes[volume_id].append(pk)
+
+    timestamp = now()
+
+    for volume_id, pks in changes.items():
+        Volume.objects.filter(pk__in=pks).update(volume_id=volume_id, modified=timestamp)
+
+
 def get_salt_cloud_log_file(stack, suffix):
     """
     suffix is a string (e.g, launch, overstate, highstate, error, etc)
@@ -146,6 +272,136 @@ def get_salt_cloud_opts():
     )
 
 
+def get_core_modules_hash():
+    """
+    Hash all the custom salt modules (everything in the `_*` directories of the core
+    states) that saltutil.sync_all pushes out to the minions.
+    """
+    root_dir = settings.STACKDIO_CONFIG.salt_core_states
+
+    sha = hashlib.sha256()
+
+    for module_dir in sorted(os.listdir(root_dir)):
+        if not module_dir.startswith('_'):
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(os.path.join(root_dir, module_dir)):
+            # Make sure we always walk in the same order
+            dirnames.sort()
+
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                sha.update(os.path.relpath(path, root_dir).encode('utf-8'))
+                sha.update((get_file_hash(path) or '').encode('utf-8'))
+
+    return sha.hexdigest()
+
+
+def parse_host_count(value, total, default):
+    """
+    Turn a host count option into a number of hosts.  The option can either be a number of
+    hosts or a percentage of total (like '25%').
+    :raises ValueError: if the value isn't a valid count
+    """
+    if value is None or value == '':
+        return default
+
+    if isinstance(value, six.string_types):
+        value = value.strip()
+        if value.endswith('%'):
+            percent = float(value[:-1])
+            if not 0 <= percent <= 100:
+                raise ValueError('Percentage must be between 0 and 100: {0}'.format(value))
+            return int(math.ceil(total * percent / 100.0))
+
+    value = int(value)
+    if value < 0:
+        raise ValueError('Host count must not be negative: {0}'.format(value))
+    return value
+
+
+def split_into_batches(hosts, batch_size):
+    """
+    Split the list of hosts into consecutive batches of (at most) batch_size hosts
+    """
+    return [hosts[i:i + batch_size] for i in range(0, len(hosts), batch_size)]
+
+
+def partition_cloud_map(hosts, cloud_map):
+    """
+    Split a cloud map up by cloud account
+    :return: a dict of account slug -> cloud map with only that account's hosts
+    """
+    partitions = defaultdict(lambda: defaultdict(dict))
+
+    for host in hosts:
+        image_slug = host.cloud_image.slug
+        if host.hostname in cloud_map.get(image_slug, {}):
+            host_map = cloud_map[image_slug][host.hostname]
+            partitions[host.cloud_account.slug][image_slug][host.hostname] = host_map
+
+    return dict((slug, dict(images)) for slug, images in partitions.items())
+
+
+def retag_stopped_hosts(account_slug, retag_args):
+    """
+    Find the hosts in a single account that exist but aren't running, and re-tag them so
+    they can be replaced.
+    :param retag_args: a tuple of (a list of (hostname, provider name) tuples,
+                       the workflow's query version)
+    :return: the hostnames that were re-tagged
+    """
+    hosts, query_version = retag_args
+
+    inventory = get_provider_inventory(account_slug, query_version, max_age=0)
+
+    salt_cloud = None
+    retagged = []
+
+    for hostname, provider in hosts:
+        # Grab the details
+        host_details = inventory.get(provider, {}).get(hostname)
+
+        if host_details:
+            state = host_details.get('state')
+
+            # Only re-tag if the state exists and it is not running.
+            # set_tags applies the same tags to every name it's given, and the Name tag
+            # differs per host, so this is one call per host.
+            if state and state not in ('running',):
+                if salt_cloud is None:
+                    salt_cloud = get_account_cloud_client(account_slug)
+                salt_cloud.action(
+                    'set_tags',
+                    names=[hostname],
+                    kwargs={
+                        'Name': '{0}-DEL_BY_STACKDIO'.format(hostname)
+                    }
+                )
+                retagged.append(hostname)
+
+    if retagged:
+        invalidate_provider_inventory([account_slug])
+
+    return retagged
+
+
+def launch_account_map(account_slug, launch_args):
+    """
+    Launch the cloud map for a single account.  The caller is expected to have
+    set up logging to the launch log file already.
+    """
+    cloud_map, parallel = launch_args
+
+    salt_cloud = get_account_cloud_client(account_slug)
+
+    return salt_cloud.launch_map(
+        cloud_map=cloud_map,
+        parallel=parallel,
+        manage_logging=False,
+    )
+
+
 @catch_salt_cloud_map_failures(retry_times=5)
 def terminate_hosts(stack, cloud_map, hostnames):
     """
@@ -18,6 +18,7 @@
 from __future__ import unicode_literals
 
 import logging
+import uuid
 
 import actstream
 from celery import chain
@@ -58,6 +59,22 @@ class LaunchWorkflowOptions(WorkflowOptions):
         'simulate_launch_failures': False,
         'simulate_ssh_failures': False,
         'failure_percent': 0.3,
+
+        # Provision (highstate) the hosts in rolling batches instead of all at once.
+        # Either a number of hosts or a percentage (like '25%').  None means all at once.
+        'rolling_batch_size': None,
+        # Stop the rollout once more than this many hosts (or percentage of hosts) fail
+        'rolling_max_failures': None,
+    }
+
+
+class ActionWorkflowOptions(WorkflowOptions):
+    DEFAULTS = {
+        'max_attempts': 3,
+
+        # See LaunchWorkflowOptions for these
+        'rolling_batch_size': None,
+        'rolling_max_failures': None,
     }
 
 
@@ -77,6 +94,9 @@ class BaseWorkflow(object):
         self.host_ids = host_ids
         self.opts = self._options_class(opts)
 
+        # Every task in this workflow shares one provider query snapshot per cloud account
+        self.query_version = uuid.uuid4().hex
+
     def task_list(self):
         return []
 
@@ -107,14 +127,19 @@ class LaunchWorkflow(BaseWorkflow):
                 max_attempts=opts.max_attempts,
                 simulate_launch_failures=opts.simulate_launch_failures,
                 simulate_ssh_failures=opts.simulate_ssh_failures,
-                failure_percent=opts.failure_percent
+                failure_percent=opts.failure_percent,
+                query_version=self.query_version,
             ),
-            tasks.update_metadata.si(stack_id, Activity.LAUNCHING, host_ids=host_ids),
+            tasks.update_metadata.si(stack_id, Activity.LAUNCHING, host_ids=host_ids,
+                                     query_version=self.query_version),
             tasks.tag_infrastructure.si(stack_id, activity=Activity.LAUNCHING, host_ids=host_ids),
             tasks.register_dns.si(stack_id, Activity.LAUNCHING, host_ids=host_ids),
             tasks.ping.si(stack_id, Activity.LAUNCHING),
             tasks.sync_all.si(stack_id),
-            tasks.highstate.si(stack_id, max_attempts=opts.max_attempts),
+            tasks.highstate.si(stack_id,
+                               max_attempts=opts.max_attempts,
+                               batch_size=opts.rolling_batch_size,
+                               max_failures=opts.rolling_max_failures),
             tasks.global_orchestrate.si(stack_id, max_attempts=opts.max_attempts),
         ]
         if opts.provision:
@@ -138,7 +163,8 @@ class DestroyHostsWorkflow(BaseWorkflow):
         host_ids = self.host_ids
 
         return [
-            tasks.update_metadata.si(stack_id, Activity.TERMINATING, host_ids=host_ids),
+            tasks.update_metadata.si(stack_id, Activity.TERMINATING, host_ids=host_ids,
+                                     query_version=self.query_version),
             tasks.register_volume_delete.si(stack_id, host_ids=host_ids),
             tasks.unregister_dns.si(stack_id, Activity.TERMINATING, host_ids=host_ids),
             tasks.destroy_hosts.si(stack_id,
@@ -163,7 +189,8 @@ class DestroyStackWorkflow(BaseWorkflow):
     def task_list(self):
         stack_id = self.stack.pk
         return [
-            tasks.update_metadata.si(stack_id, Activity.TERMINATING),
+            tasks.update_metadata.si(stack_id, Activity.TERMINATING,
+                                     query_version=self.query_version),
             tasks.register_volume_delete.si(stack_id),
             tasks.unregister_dns.si(stack_id, Activity.TERMINATING),
             tasks.destroy_hosts.si(stack_id, parallel=self.opts.parallel),
@@ -175,9 +202,10 @@ class ActionWorkflow(BaseWorkflow):
     """
     Runs an action
     """
+    _options_class = ActionWorkflowOptions
 
-    def __init__(self, stack, action, args):
-        super(ActionWorkflow, self).__init__(stack)
+    def __init__(self, stack, action, args, opts=None):
+        super(ActionWorkflow, self).__init__(stack, opts=opts)
         self.action = action
         self.args = args
 
@@ -185,10 +213,11 @@ class ActionWorkflow(BaseWorkflow):
         # TODO: not generic enough
         base_tasks = {
             Action.LAUNCH: [
-                tasks.launch_hosts.si(self.stack.id),
+                tasks.launch_hosts.si(self.stack.id, query_version=self.query_version),
             ],
             Action.TERMINATE: [
-                tasks.update_metadata.si(self.stack.id, Activity.TERMINATING),
+                tasks.update_metadata.si(self.stack.id, Activity.TERMINATING,
+                                         query_version=self.query_version),
                 tasks.register_volume_delete.si(self.stack.id),
                 tasks.unregister_dns.si(self.stack.id, Activity.TERMINATING),
                 tasks.destroy_hosts.si(self.stack.id, delete_hosts=False,
@@ -201,7 +230,9 @@ class ActionWorkflow(BaseWorkflow):
                 tasks.execute_action.si(self.stack.id, self.action, Activity.RESUMING, *self.args),
             ],
             Action.PROPAGATE_SSH: [
-                tasks.propagate_ssh.si(self.stack.id),
+                tasks.propagate_ssh.si(self.stack.id,
+                                       batch_size=self.opts.rolling_batch_size,
+                                       max_failures=self.opts.rolling_max_failures),
             ],
             Action.SINGLE_SLS: [
                 tasks.single_sls.si(self.stack.id, arg['component'], arg.get('host_target'))
@@ -237,7 +268,8 @@ class ActionWorkflow(BaseWorkflow):
         # Update the metadata after the main action has been executed
         if self.action not in (Action.SINGLE_SLS, Action.TERMINATE):
             task_list.append(tasks.update_metadata.si(self.stack.id,
-                                                      action_to_activity[self.action]))
+                                                      action_to_activity[self.action],
+                                                      query_version=self.query_version))
 
         # Resuming and launching requires DNS updates
         if self.action in (Action.RESUME, Action.LAUNCH):
@@ -254,7 +286,9 @@ class ActionWorkflow(BaseWorkflow):
             task_list.append(tasks.sync_all.si(self.stack.id))
 
         if self.action in (Action.LAUNCH, Action.PROVISION):
-            task_list.append(tasks.highstate.si(self.stack.id))
+            task_list.append(tasks.highstate.si(self.stack.id,
+                                                batch_size=self.opts.rolling_batch_size,
+                                                max_failures=self.opts.rolling_max_failures))
 
         if self.action in (Action.LAUNCH, Action.PROVISION, Action.ORCHESTRATE):
             task_list.append(tasks.global_orchestrate.si(self.stack.id))
@@ -20,10 +20,10 @@
 from __future__ import unicode_literals
 
 import six
-from django.core.cache import cache
 from django.db import models
 from django.dispatch import receiver
 from django_extensions.db.models import TimeStampedModel
+from stackdio.core.caching import delete_cached
 
 _volume_model_permissions = (
     'create',
@@ -106,7 +106,7 @@ def volume_post_save(sender, **kwargs):
         cache_keys = [
             'stack-{}-volume-count'.format(stack.id),
         ]
-        cache.delete_many(cache_keys)
+        delete_cached(cache_keys)
 
         stack.volume_count
 
@@ -121,6 +121,6 @@ def volume_post_delete(sender, **kwargs):
         cache_keys = [
             'stack-{}-volume-count'.format(stack.id),
         ]
-        cache.delete_many(cache_keys)
+        delete_cached(cache_keys)
 
         stack.volume_count
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+A local, in-process memo that sits in front of the django cache for the length of a
+request (or a task).  Anything cached with @django_cache is only fetched from redis once
+per scope, and whole lists of objects can be prefetched with a single get_many.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import logging
+import threading
+from functools import wraps
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class CacheScope(object):
+    """
+    The local memo for one request / task, along with hit and miss counters:
+    `memo_hits` were served locally, `hits` came from the django cache, and
+    `misses` had to be computed.
+    """
+
+    def __init__(self):
+        self.memo = {}
+        self.stats = collections.Counter()
+
+    def get(self, key):
+        return self.memo.get(key)
+
+    def set(self, key, value):
+        self.memo[key] = value
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.memo.pop(key, None)
+
+
+def get_cache_scope():
+    """
+    Get the active cache scope, or None if there isn't one
+    """
+    return getattr(_local, 'scope', None)
+
+
+def enter_cache_scope():
+    """
+    Start a cache scope.  Scopes don't nest - entering while one is active just keeps
+    using the outer one.
+    :return: True if a new scope was started (and should be exited later)
+    """
+    if get_cache_scope() is not None:
+        return False
+
+    _local.scope = CacheScope()
+    return True
+
+
+def exit_cache_scope():
+    scope = get_cache_scope()
+    _local.scope = None
+
+    if scope is not None and scope.stats:
+        logger.debug('Cache scope stats: {0}'.format(dict(scope.stats)))
+
+    return scope
+
+
+class cache_scope(object):  # pylint: disable=invalid-name
+    """
+    Context manager / decorator to run something inside a cache scope
+    """
+
+    def __init__(self):
+        self._started = False
+
+    def __enter__(self):
+        self._started = enter_cache_scope()
+        return get_cache_scope()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._started:
+            exit_cache_scope()
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with cache_scope():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def get_cache_key(key_template, obj):
+    """
+    Build the cache key for an object.  The content type lookup is only done if the
+    key actually needs it.
+    """
+    if '{ctype}' in key_template:
+        ctype = ContentType.objects.get_for_model(obj)
+        return key_template.format(ctype=ctype.pk, id=obj.id)
+
+    return key_template.format(id=obj.id)
+
+
+def get_cached(key):
+    """
+    Get something from the local memo first, then the django cache.
+    :return: the cached value, or None
+    """
+    scope = get_cache_scope()
+
+    if scope is not None:
+        value = scope.get(key)
+        if value is not None:
+            scope.stats['memo_hits'] += 1
+            return value
+
+    value = cache.get(key)
+
+    if scope is not None:
+        if value is None:
+            scope.stats['misses'] += 1
+        else:
+            scope.stats['hits'] += 1
+            scope.set(key, value)
+
+    return value
+
+
+def set_cached(key, value, timeout=None):
+    cache.set(key, value, timeout)
+
+    scope = get_cache_scope()
+    if scope is not None:
+        scope.set(key, value)
+
+
+def delete_cached(keys):
+    """
+    Delete the given keys from both the django cache and the local memo.  Use this instead
+    of cache.delete_many for anything cached with @django_cache.
+    """
+    keys = list(keys)
+    cache.delete_many(keys)
+
+    scope = get_cache_scope()
+    if scope is not None:
+        scope.delete_many(keys)
+
+
+def get_cached_function(model_cls, name):
+    """
+    Find the function behind a @django_cache method or property on a model.
+    """
+    attr = getattr(model_cls, name)
+
+    # Unwrap properties
+    func = getattr(attr, 'fget', attr)
+
+    if getattr(func, 'cache_key', None) is None:
+        raise ValueError('{0}.{1} is not cached with @django_cache'.format(model_cls.__name__,
+                                                                           name))
+
+    return func
+
+
+def prefetch_cached(objects, *names):
+    """
+    Resolve cached methods / properties for a whole list of objects at once.  Everything
+    is fetched with a single get_many, and the misses are computed together by the
+    function's `many` loader (usually a single aggregate query) and written back with
+    set_many.  Functions without a `many` loader leave their misses to be computed one at
+    a time as usual.
+
+    Results are kept in the local memo, so this only saves anything inside a cache scope
+    (which every request has).
+    :return: the objects
+    """
+    scope = get_cache_scope()
+
+    if scope is None or not objects:
+        return objects
+
+    model_cls = type(objects[0])
+
+    for name in names:
+        func = get_cached_function(model_cls, name)
+
+        key_map = collections.OrderedDict(
+            (get_cache_key(func.cache_key, obj), obj) for obj in objects
+        )
+
+        keys = [key for key in key_map if scope.get(key) is None]
+
+        if not keys:
+            continue
+
+        found = cache.get_many(keys)
+
+        for key, value in found.items():
+            scope.set(key, value)
+
+        scope.stats['prefetched'] += len(found)
+
+        missing = [key_map[key] for key in keys if key not in found]
+
+        if not missing or func.cache_many is None:
+            continue
+
+        # Compute all the misses together
+        values = func.cache_many(missing)
+
+        to_cache = {}
+        for obj in missing:
+            value = values.get(obj.id)
+            if value is not None:
+                to_cache[get_cache_key(func.cache_key, obj)] = value
+
+        if to_cache:
+            cache.set_many(to_cache, func.cache_timeout)
+
+            for key, value in to_cache.items():
+                scope.set(key, value)
+
+        scope.stats['batch_misses'] += len(missing)
+
+    return objects
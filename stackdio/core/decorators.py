@@ -19,31 +19,37 @@ from __future__ import unicode_literals
 
 from functools import wraps
 
-from django.contrib.contenttypes.models import ContentType
-from django.core.cache import cache
+from stackdio.core.caching import get_cache_key, get_cached, set_cached
 
 
-def django_cache(cache_key, timeout=None):
+def django_cache(cache_key, timeout=None, many=None):
     """
-    decorator to cache the result of a function in the django cache
+    decorator to cache the result of a function in the django cache.  Inside a cache scope
+    (see stackdio.core.caching) results are also memoized locally for the rest of the scope.
+
+    `many` is an optional function that computes the same value for a list of objects at
+    once (returning a dict of object id -> value), used by prefetch_cached.
     """
 
     def wrapper(func):
 
         @wraps(func)
         def wrapped(self):
-            ctype = ContentType.objects.get_for_model(self)
-
-            final_cache_key = cache_key.format(ctype=ctype.pk, id=self.id)
+            final_cache_key = get_cache_key(cache_key, self)
 
-            cached_item = cache.get(final_cache_key)
+            cached_item = get_cached(final_cache_key)
 
             if cached_item is None:
                 cached_item = func(self)
-                cache.set(final_cache_key, cached_item, timeout)
+                set_cached(final_cache_key, cached_item, timeout)
 
             return cached_item
 
+        # So everything can be found again for batch lookups
+        wrapped.cache_key = cache_key
+        wrapped.cache_timeout = timeout
+        wrapped.cache_many = many
+
         return wrapped
 
     return wrapper
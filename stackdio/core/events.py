@@ -18,16 +18,34 @@
 from __future__ import unicode_literals
 
 from django.contrib.contenttypes.models import ContentType
-from stackdio.core.notifications.tasks import generate_notifications
+from django.core.cache import cache
+from django.db import transaction
+from stackdio.core.models import OutboxEvent
+from stackdio.core.notifications.tasks import RELAY_SCHEDULED_KEY, relay_events
+
+
+def schedule_relay():
+    # Only one relay needs to be queued at a time - it drains everything that's committed.
+    # The key expires quickly in case the transaction rolls back, and the periodic relay
+    # picks up anything that slips through.
+    if cache.add(RELAY_SCHEDULED_KEY, True, 30):
+        relay_events.si().apply_async()
 
 
 def trigger_event(event_tag, content_object):
     """
     Trigger an event on a given object.  Things may be listening for this event
-    (like notification channels)
+    (like notification channels).  The event is written to the outbox as part of the
+    current transaction, and only gets relayed after it commits.
     """
     # Find the content type
     ctype = ContentType.objects.get_for_model(content_object)
 
-    # Start up the celery task
-    generate_notifications.si(event_tag, content_object.pk, ctype.id).apply_async()
+    OutboxEvent.objects.create(
+        event_tag=event_tag,
+        content_type=ctype,
+        object_id=content_object.pk,
+    )
+
+    # Start up the relay once the data is committed
+    transaction.on_commit(schedule_relay)
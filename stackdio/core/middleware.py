@@ -21,6 +21,7 @@ import logging
 
 from django.conf import settings
 from django.http import HttpResponseRedirect
+from stackdio.core.caching import enter_cache_scope, exit_cache_scope
 
 logger = logging.getLogger(__name__)
 
@@ -69,3 +70,22 @@ class LoginRedirectMiddleware(object):
         if request.path != '/':
             redirect_url = '{0}?next={1}'.format(redirect_url, request.path)
         return redirect_url
+
+
+class CacheScopeMiddleware(object):
+    """
+    Memoize @django_cache lookups locally for the rest of the request, so reading the same
+    cached property twice (or for every host in a list) doesn't go back to redis each time.
+    """
+
+    def process_request(self, request):
+        # Never pick up a scope left over from an earlier request on this thread
+        exit_cache_scope()
+        enter_cache_scope()
+
+    def process_response(self, request, response):
+        exit_cache_scope()
+        return response
+
+    def process_exception(self, request, exception):
+        exit_cache_scope()
@@ -17,9 +17,12 @@
 
 from __future__ import unicode_literals
 
+import hashlib
 import logging
+from calendar import timegm
 
 from django.db.models.query import QuerySet
+from django.utils.http import http_date, parse_etags, quote_etag
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
@@ -80,6 +83,37 @@ class ParentRelatedMixin(object):
         return get_object_or_404(queryset, **filter_kwargs)
 
 
+class ConditionalRetrieveMixin(object):
+    """
+    Adds ETag & Last-Modified headers to retrieve requests, and returns a 304 without
+    serializing anything when the If-None-Match header matches.  The ETag is computed
+    from the object's `get_version_stamp()`, so it needs to be cheap.
+    """
+
+    def get_etag(self, instance):
+        # The representation differs between renderers, so include the format
+        stamp = '{0}-{1}'.format(instance.get_version_stamp(),
+                                 self.request.accepted_renderer.format)
+        return hashlib.md5(stamp.encode('utf-8')).hexdigest()
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag(instance)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match and (if_none_match.strip() == '*' or
+                              etag in parse_etags(if_none_match)):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            serializer = self.get_serializer(instance)
+            response = Response(serializer.data)
+
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(timegm(instance.modified.utctimetuple()))
+        return response
+
+
 class BulkUpdateModelMixin(object):
     """
     Mixin to allow for bulk updates on list endpoints
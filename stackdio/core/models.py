@@ -22,13 +22,15 @@ from operator import or_
 
 import six
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.core.cache import cache
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import Q
 from django.dispatch import receiver
+from stackdio.core.caching import delete_cached
+from stackdio.core.queryset_transform import TransformQuerySet
 
 
-class SearchQuerySet(models.QuerySet):
+class SearchQuerySet(TransformQuerySet):
     searchable_fields = ()
 
     def search(self, query):
@@ -63,6 +65,24 @@ class Label(models.Model):
         return six.text_type('{}:{} on {}'.format(self.key, self.value, self.content_object))
 
 
+def get_label_lists(objects):
+    """
+    Get the labels for a list of objects (of the same type) in one query.
+    Suitable as the `many` loader for a cached label list.
+    :return: a dict of object id -> list of labels
+    """
+    ctype = ContentType.objects.get_for_model(objects[0])
+
+    label_lists = dict((obj.id, []) for obj in objects)
+
+    labels = Label.objects.filter(content_type=ctype, object_id__in=list(label_lists))
+
+    for label in labels:
+        label_lists[label.object_id].append(label)
+
+    return label_lists
+
+
 @six.python_2_unicode_compatible
 class Event(models.Model):
     """
@@ -74,10 +94,31 @@ class Event(models.Model):
         return six.text_type(self.tag)
 
 
+@six.python_2_unicode_compatible
+class OutboxEvent(models.Model):
+    """
+    An event waiting to be relayed to the notification system.  These are written in the
+    same transaction as whatever triggered them, and drained by the relay task after commit.
+    """
+    event_tag = models.CharField('Event Tag', max_length=128)
+
+    # the object the event was triggered on
+    content_type = models.ForeignKey('contenttypes.ContentType', related_name='+')
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+
+    created = models.DateTimeField('Created', auto_now_add=True)
+
+    def __str__(self):
+        return six.text_type('{} on {} {}'.format(self.event_tag,
+                                                 self.content_type_id,
+                                                 self.object_id))
+
+
 @receiver([models.signals.post_save, models.signals.post_delete], sender=Label)
 def label_post_save(sender, **kwargs):
     label = kwargs.pop('instance')
 
     # Delete from the cache
     cache_key = '{}-{}-label-list'.format(label.content_type_id, label.object_id)
-    cache.delete(cache_key)
+    delete_cached([cache_key])
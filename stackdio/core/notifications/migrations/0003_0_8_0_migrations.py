@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2018-04-07 15:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_unsent(apps, schema_editor):
+    """
+    Forwards migration - anything unsent is due right away
+    """
+    Notification = apps.get_model('notifications', 'Notification')
+
+    Notification.objects.filter(sent=False).update(next_attempt_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_0_8_0_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next Attempt At'),
+        ),
+        migrations.AddField(
+            model_name='notificationhandler',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0, verbose_name='Consecutive Failures'),
+        ),
+        migrations.AddField(
+            model_name='notificationhandler',
+            name='suspended_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Suspended Until'),
+        ),
+        migrations.AlterIndexTogether(
+            name='notification',
+            index_together=set([('sent', 'next_attempt_at')]),
+        ),
+        migrations.RunPython(schedule_unsent, migrations.RunPython.noop),
+    ]
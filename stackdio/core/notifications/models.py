@@ -188,6 +188,11 @@ class NotificationHandler(models.Model):
     # If too many notifications fail to send, we'll disable the handler.
     disabled = models.BooleanField('Disabled', default=False)
 
+    # Circuit breaker - if sends keep failing, stop sending to this handler for a while
+    # so a dead endpoint doesn't tie up the workers.
+    consecutive_failures = models.PositiveIntegerField('Consecutive Failures', default=0)
+    suspended_until = models.DateTimeField('Suspended Until', blank=True, null=True)
+
     def __str__(self):
         return six.text_type('Handler {} on {}'.format(self.notifier, self.channel))
 
@@ -204,11 +209,22 @@ class Notification(TimeStampedModel):
     """
     A representation of a single notification to be sent
     """
+    class Meta(TimeStampedModel.Meta):
+        index_together = [
+            ('sent', 'next_attempt_at'),
+        ]
 
     sent = models.BooleanField('Sent', default=False)
 
     failed_count = models.PositiveIntegerField('Failed Count', default=0)
 
+    # When to (re)try sending this notification if it still hasn't been sent
+    next_attempt_at = models.DateTimeField('Next Attempt At', blank=True, null=True)
+
+    # Notifications generated together are created with bulk_create, which doesn't give us
+    # primary keys back, so this is used to look them up again.
+    batch = models.UUIDField('Batch', blank=True, null=True, db_index=True)
+
     event = models.ForeignKey('core.Event')
 
     handler = models.ForeignKey('notifications.NotificationHandler')
@@ -55,6 +55,7 @@ class NotificationHandlerSerializer(serializers.HyperlinkedModelSerializer):
             'notifier',
             'verified',
             'disabled',
+            'suspended_until',
             'options',
         )
 
@@ -62,6 +63,7 @@ class NotificationHandlerSerializer(serializers.HyperlinkedModelSerializer):
             'notifier': {'validators': [validate_notifier]},
             'verified': {'read_only': True},
             'disabled': {'read_only': True},
+            'suspended_until': {'read_only': True},
         }
 
     def validate(self, attrs):
@@ -18,41 +18,150 @@
 from __future__ import unicode_literals
 
 import logging
+import random
+import time
+import uuid
 from collections import defaultdict
+from datetime import timedelta
 
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from stackdio.core.models import Event
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+from stackdio.core.models import Event, OutboxEvent
 from stackdio.core.notifications import models, utils
 
 logger = logging.getLogger(__name__)
 
+RELAY_SCHEDULED_KEY = 'notifications-relay-scheduled'
+
+# Used to derive a stable notification batch id from an outbox event id
+OUTBOX_BATCH_NAMESPACE = uuid.UUID('2b9ef2d4-6b43-4c1f-9b8e-3f0c4a1d5e77')
+
 
 class NotificationTaskException(Exception):
     pass
 
 
+def get_batch_size():
+    """
+    The max number of notifications handled by a single task
+    """
+    return settings.STACKDIO_CONFIG.get('notification_batch_size', 100)
+
+
+def get_retry_delay(failed_count):
+    """
+    Exponential backoff with jitter - 1, 2, 4, 8... minutes (capped at an hour), where
+    each delay is randomly shrunk by up to half so failed notifications don't all come due
+    at the same time.
+    """
+    delay = min(60 * 2 ** max(failed_count - 1, 0), 3600)
+    return timedelta(seconds=random.uniform(delay / 2.0, delay))
+
+
+def get_send_timeout():
+    """
+    If a notification is handed to a task but still isn't sent after this long, it's
+    considered due again.
+    """
+    return timedelta(seconds=settings.STACKDIO_CONFIG.get('notification_send_timeout', 600))
+
+
+def record_handler_results(succeeded_handler_ids, failed_handler_ids):
+    """
+    Update the handler circuit breakers.  Any success closes the circuit, and a handler that
+    has only failed several times in a row gets suspended for a while.
+    """
+    failed_handler_ids = set(failed_handler_ids) - set(succeeded_handler_ids)
+
+    if succeeded_handler_ids:
+        models.NotificationHandler.objects.filter(
+            id__in=succeeded_handler_ids,
+        ).update(consecutive_failures=0, suspended_until=None)
+
+    if failed_handler_ids:
+        models.NotificationHandler.objects.filter(
+            id__in=failed_handler_ids,
+        ).update(consecutive_failures=F('consecutive_failures') + 1)
+
+        threshold = settings.STACKDIO_CONFIG.get('notification_circuit_threshold', 3)
+        cooldown = settings.STACKDIO_CONFIG.get('notification_circuit_cooldown', 600)
+
+        models.NotificationHandler.objects.filter(
+            id__in=failed_handler_ids,
+            consecutive_failures__gte=threshold,
+        ).update(suspended_until=timezone.now() + timedelta(seconds=cooldown))
+
+
 def generate_notification_tasks(notifications):
+    """
+    Start up the tasks to send the given notifications - one task per batch per notifier.
+    Notifications on suspended handlers are left alone until the handler comes back.
+    :param notifications: a QuerySet of notifications
+    """
+    notifications = notifications.exclude(handler__suspended_until__gt=timezone.now())
+
     notifier_notification_map = defaultdict(list)
 
-    for notification in notifications:
-        notifier_notification_map[notification.handler.notifier].append(notification.id)
+    for notification_id, notifier_name in notifications.values_list('id', 'handler__notifier'):
+        notifier_notification_map[notifier_name].append(notification_id)
+
+    batch_size = get_batch_size()
 
     for notifier_name, notification_ids in notifier_notification_map.items():
-        if utils.get_notifier_class(notifier_name).prefer_send_in_bulk:
-            # Bulk is supported - only 1 task per handler
-            send_bulk_notifications.si(notifier_name, notification_ids).apply_async()
-        else:
-            # No bulk support, separate task for each notification
-            for notification_id in notification_ids:
-                send_notification.si(notification_id).apply_async()
+        prefer_send_in_bulk = utils.get_notifier_class(notifier_name).prefer_send_in_bulk
+
+        for i in range(0, len(notification_ids), batch_size):
+            batch_ids = notification_ids[i:i + batch_size]
+
+            if prefer_send_in_bulk:
+                # Bulk is supported - let the notifier handle the whole batch
+                send_bulk_notifications.si(notifier_name, batch_ids).apply_async()
+            else:
+                # No bulk support, the task will send them one at a time
+                send_notification_batch.si(batch_ids).apply_async()
+
+
+def get_group_members(group_ids):
+    """
+    Get the members of all the given groups in a single query
+    :return: a dict of group id -> list of users
+    """
+    members = defaultdict(list)
+
+    if group_ids:
+        memberships = get_user_model().groups.through.objects.filter(
+            group_id__in=group_ids,
+        ).select_related('user')
+
+        for membership in memberships:
+            members[membership.group_id].append(membership.user)
+
+    return members
 
 
 @shared_task(name='notifications.generate_notifications')
-def generate_notifications(event_tag, object_id, content_type_id):
+def generate_notifications(event_tag, object_id, content_type_id, outbox_id=None):
+    """
+    Create the notifications for an event.  When this comes from the outbox, the batch id
+    is derived from the outbox id so relaying the same event twice is a no-op.
+    """
+    if outbox_id is None:
+        batch = uuid.uuid4()
+    else:
+        batch = uuid.uuid5(OUTBOX_BATCH_NAMESPACE, '{}'.format(outbox_id))
+
+        if models.Notification.objects.filter(batch=batch).exists():
+            logger.info('Notifications for outbox event {} were already '
+                        'generated'.format(outbox_id))
+            return
 
     try:
         event = Event.objects.get(tag=event_tag)
@@ -65,48 +174,170 @@ def generate_notifications(event_tag, object_id, content_type_id):
     except ObjectDoesNotExist:
         raise NotificationTaskException('Failed to look up content object.')
 
-    new_notifications = []
+    # We only care about the handlers that are both verified and enabled
+    active_handlers = models.NotificationHandler.objects.filter(verified=True, disabled=False)
 
-    subscribed_channels = models.NotificationChannel.objects.filter(
+    subscribed_channels = list(models.NotificationChannel.objects.filter(
         subscribed_object=content_object,
         events=event,
-    )
+    ).prefetch_related(
+        'auth_object',
+        Prefetch('handlers', queryset=active_handlers, to_attr='active_handlers'),
+    ))
+
+    # Grab the members of every group that will be split up all at once
+    group_members = get_group_members(set(
+        channel.auth_object.id for channel in subscribed_channels
+        if isinstance(channel.auth_object, Group) and any(
+            utils.get_notifier_class(h.notifier).split_group_notifications
+            for h in channel.active_handlers
+        )
+    ))
+
+    next_attempt_at = timezone.now() + get_send_timeout()
+    new_notifications = []
 
     for channel in subscribed_channels:
         auth_object = channel.auth_object
 
-        # We only care about the handlers that are both verified and enabled
-        for handler in channel.handlers.filter(verified=True, disabled=False):
+        for handler in channel.active_handlers:
             if utils.get_notifier_class(handler.notifier).split_group_notifications:
                 if isinstance(auth_object, get_user_model()):
                     auth_objects = [auth_object]
                 elif isinstance(auth_object, Group):
-                    auth_objects = auth_object.user_set.all()
+                    auth_objects = group_members[auth_object.id]
                 else:
                     raise TypeError('Channel has an auth_object that isn\'t a User or Group.')
             else:
                 auth_objects = [auth_object]
 
             for auth_obj in auth_objects:
-                # Create the notification object
-                notification = models.Notification.objects.create(event=event,
-                                                                  handler=handler,
-                                                                  auth_object=auth_obj,
-                                                                  content_object=content_object)
+                new_notifications.append(models.Notification(batch=batch,
+                                                             next_attempt_at=next_attempt_at,
+                                                             event=event,
+                                                             handler=handler,
+                                                             auth_object=auth_obj,
+                                                             content_object=content_object))
 
-                new_notifications.append(notification)
+    if not new_notifications:
+        return
 
-    # start up the tasks
-    generate_notification_tasks(new_notifications)
+    models.Notification.objects.bulk_create(new_notifications, batch_size=get_batch_size())
+
+    # start up the tasks, but not until the notifications are committed
+    transaction.on_commit(
+        lambda: generate_notification_tasks(models.Notification.objects.filter(batch=batch))
+    )
+
+
+@shared_task(name='notifications.relay_events')
+def relay_events():
+    """
+    Drain the event outbox in batches.  Each batch generates its notifications and deletes
+    its outbox rows in one transaction, so an event is relayed at least once - and
+    generate_notifications makes relaying it again harmless.
+    """
+    # Let the next committed event schedule another relay
+    cache.delete(RELAY_SCHEDULED_KEY)
+
+    batch_size = get_batch_size()
+    start = time.time()
+    relayed = 0
+
+    # Events that blew up get left in the outbox for the next relay to retry
+    failed_ids = []
+
+    while True:
+        with transaction.atomic():
+            outbox_events = list(
+                OutboxEvent.objects.select_for_update().exclude(
+                    id__in=failed_ids,
+                ).order_by('id')[:batch_size]
+            )
+
+            if not outbox_events:
+                break
+
+            done_ids = []
+
+            for outbox_event in outbox_events:
+                try:
+                    with transaction.atomic():
+                        generate_notifications(outbox_event.event_tag,
+                                               outbox_event.object_id,
+                                               outbox_event.content_type_id,
+                                               outbox_event.id)
+                except NotificationTaskException as e:
+                    # Nothing will ever be deliverable for this one (the object is gone)
+                    logger.warning('Dropping outbox event {}: {}'.format(outbox_event, e))
+                except Exception:
+                    logger.exception('Failed to relay outbox event {}'.format(outbox_event))
+                    failed_ids.append(outbox_event.id)
+                    continue
+
+                done_ids.append(outbox_event.id)
+
+            OutboxEvent.objects.filter(id__in=done_ids).delete()
+
+        relayed += len(done_ids)
+
+    if relayed:
+        elapsed = time.time() - start
+        logger.info('Relayed {} events in {:.2f}s ({:.1f} events/s)'.format(
+            relayed,
+            elapsed,
+            relayed / elapsed if elapsed else float(relayed),
+        ))
 
 
 @shared_task(name='notifications.resend_failed_notifications')
 def resend_failed_notifications():
+    """
+    Pick up the unsent notifications that are due, in a bounded batch.
+    """
+    now = timezone.now()
+    limit = settings.STACKDIO_CONFIG.get('notification_resend_limit', 1000)
+
     # We only care about notifications that failed and we've retried less than 5 times
-    failed_notifications = models.Notification.objects.filter(sent=False, failed_count__lte=5)
+    due_ids = list(models.Notification.objects.filter(
+        sent=False,
+        next_attempt_at__lte=now,
+        failed_count__lte=5,
+        handler__disabled=False,
+    ).exclude(
+        handler__suspended_until__gt=now,
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+
+    if not due_ids:
+        return
+
+    due_notifications = models.Notification.objects.filter(id__in=due_ids)
+
+    # Push them out so the next run doesn't pick them up again while they're queued
+    due_notifications.update(next_attempt_at=now + get_send_timeout())
 
     # start up the tasks
-    generate_notification_tasks(failed_notifications)
+    generate_notification_tasks(due_notifications)
+
+
+def record_notification_result(notification, result):
+    """
+    Save the outcome of sending a single notification
+    """
+    # Report that the notification sent properly
+    if result:
+        notification.sent = True
+    else:
+        notification.sent = False
+        notification.failed_count += 1
+        notification.next_attempt_at = timezone.now() + get_retry_delay(notification.failed_count)
+
+    notification.save()
+
+    # Disable the handler if we fail too many times
+    if notification.failed_count > 5:
+        notification.handler.disabled = True
+        notification.handler.save()
 
 
 @shared_task(name='notifications.send_notification')
@@ -122,45 +353,96 @@ def send_notification(notification_id):
     try:
         result = notifier.send_notification(notification)
     except Exception as e:
-        notification.sent = False
-        notification.failed_count += 1
-        notification.save()
+        record_notification_result(notification, False)
+        record_handler_results([], [notification.handler_id])
         logger.exception(e)
         raise NotificationTaskException('An exception occurred while sending a notification.')
 
-    # Report that the notification sent properly
+    record_notification_result(notification, result)
+
     if result:
-        notification.sent = True
+        record_handler_results([notification.handler_id], [])
     else:
-        notification.sent = False
-        notification.failed_count += 1
+        record_handler_results([], [notification.handler_id])
 
-    notification.save()
 
-    # Disable the handler if we fail too many times
-    if notification.failed_count > 5:
-        notification.handler.disabled = True
-        notification.handler.save()
+@shared_task(name='notifications.send_notification_batch')
+def send_notification_batch(notification_ids):
+    """
+    Send several notifications one at a time for notifiers that don't support bulk sending.
+    One failure doesn't stop the rest of the batch.
+    """
+    notifications = models.Notification.objects.filter(
+        id__in=notification_ids,
+    ).exclude(
+        handler__suspended_until__gt=timezone.now(),
+    ).select_related('handler')
+
+    succeeded_handler_ids = set()
+    failed_handler_ids = set()
+
+    for notification in notifications:
+        notifier = notification.handler.get_notifier_instance()
+
+        try:
+            result = notifier.send_notification(notification)
+        except Exception as e:
+            logger.exception(e)
+            result = False
+
+        record_notification_result(notification, result)
+
+        if result:
+            succeeded_handler_ids.add(notification.handler_id)
+        else:
+            failed_handler_ids.add(notification.handler_id)
+
+    record_handler_results(succeeded_handler_ids, failed_handler_ids)
 
 
 @shared_task(name='notifications.send_bulk_notifications')
 def send_bulk_notifications(notifier_name, notification_ids):
     notifier = utils.get_notifier_instance(notifier_name)
 
-    notifications = models.Notification.objects.filter(id__in=notification_ids)
+    notifications = models.Notification.objects.filter(
+        id__in=notification_ids,
+    ).exclude(
+        handler__suspended_until__gt=timezone.now(),
+    ).select_related('handler')
+
+    notification_list = list(notifications)
 
     # Need to pass in a list, not a QuerySet
-    successful_notifications = notifier.send_notifications_in_bulk(list(notifications))
+    successful_notifications = notifier.send_notifications_in_bulk(notification_list)
 
-    successful_ids = [n.id for n in successful_notifications]
+    successful_ids = set(n.id for n in successful_notifications)
+    failed_notifications = [n for n in notification_list if n.id not in successful_ids]
 
-    # Report that the notifications sent properly
-    for notification in notifications.filter(id__in=successful_ids):
-        notification.sent = True
-        notification.save()
+    now = timezone.now()
 
-    # Report that any other notifications failed
-    for notification in notifications.exclude(id__in=successful_ids):
-        notification.sent = False
-        notification.failed_count += 1
-        notification.save()
+    # Report that the notifications sent properly
+    models.Notification.objects.filter(id__in=successful_ids).update(sent=True, modified=now)
+
+    # Report that any other notifications failed.  The backoff depends on the failed count,
+    # so there's one update per distinct count rather than one per notification.
+    failed_by_count = defaultdict(list)
+    for notification in failed_notifications:
+        failed_by_count[notification.failed_count + 1].append(notification.id)
+
+    for failed_count, failed_ids in failed_by_count.items():
+        models.Notification.objects.filter(id__in=failed_ids).update(
+            sent=False,
+            failed_count=failed_count,
+            next_attempt_at=now + get_retry_delay(failed_count),
+            modified=now,
+        )
+
+    # Disable the handlers that have failed too many times
+    models.NotificationHandler.objects.filter(
+        id__in=set(n.handler_id for n in failed_notifications if n.failed_count + 1 > 5),
+    ).update(disabled=True)
+
+    record_handler_results(
+        set(n.handler_id for n in successful_notifications),
+        set(n.handler_id for n in failed_notifications),
+    )
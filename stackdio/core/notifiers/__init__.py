@@ -19,8 +19,9 @@ from __future__ import unicode_literals
 
 from stackdio.core.notifiers.base import BaseNotifier
 from stackdio.core.notifiers.email import EmailNotifier, ExtraEmailNotifier
+from stackdio.core.notifiers.http import HTTPNotifier
 from stackdio.core.notifiers.slack import SlackNotifier
 from stackdio.core.notifiers.webhook import WebhookNotifier
 
-__all__ = ['BaseNotifier', 'EmailNotifier', 'ExtraEmailNotifier', 'WebhookNotifier',
-           'SlackNotifier']
+__all__ = ['BaseNotifier', 'EmailNotifier', 'ExtraEmailNotifier', 'HTTPNotifier',
+           'WebhookNotifier', 'SlackNotifier']
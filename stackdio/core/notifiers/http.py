@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from six.moves.urllib_parse import urlparse
+from stackdio.core.notifiers.base import BaseNotifier
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header, which can either be a number of seconds or an HTTP date.
+    :return: the number of seconds to wait, or None if it couldn't be parsed
+    """
+    if not value:
+        return None
+
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+
+    parsed = parsedate_tz(value)
+
+    if parsed is None:
+        return None
+
+    return max(mktime_tz(parsed) - time.time(), 0)
+
+
+class HostRateLimiter(object):
+    """
+    Thread-safe rate limiter that spaces out requests to each host.
+    """
+
+    def __init__(self, rate_limit=0):
+        # rate_limit is the max requests per second to a single host, 0 means no limit
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0
+        self._lock = threading.Lock()
+        self._next_allowed = {}
+
+    def wait(self, host):
+        """
+        Block until we're allowed to send another request to the given host
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = slot + self.min_interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+    def back_off(self, host, seconds):
+        """
+        Don't send anything else to the given host for the given number of seconds
+        """
+        with self._lock:
+            resume_at = time.time() + seconds
+            self._next_allowed[host] = max(self._next_allowed.get(host, 0), resume_at)
+
+
+class HTTPNotifier(BaseNotifier):
+    """
+    Base class for notifiers that send their notifications over HTTP.  All requests go
+    through a shared session so connections get pooled, and bulk sends happen concurrently
+    on a bounded thread pool.  Requests to a single host can be rate limited, and a
+    Retry-After on a 429 or 503 response is honored (up to `max_retry_after` seconds)
+    before retrying once.
+
+    Subclasses implement prepare_request() and optionally handle_response().
+    """
+
+    prefer_send_in_bulk = True
+
+    retry_status_codes = (429, 503)
+
+    def __init__(self, timeout=30, max_workers=8, rate_limit=0, max_retry_after=60):
+        super(HTTPNotifier, self).__init__()
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.max_retry_after = max_retry_after
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Created lazily so each celery worker process gets its own connection pool
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.max_workers,
+                                          pool_maxsize=self.max_workers)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def prepare_request(self, notification):
+        """
+        Override this method to build the request for a notification.  This is always called
+        from the calling thread, so it's safe to hit the database here.
+        :param notification: a stackdio.core.notifications.models.Notification object
+        :rtype: dict
+        :return: the kwargs to pass to requests (must include `method` and `url`)
+        """
+        raise NotImplementedError()
+
+    def handle_response(self, response):
+        """
+        Override this method to decide if a response counts as a success.
+        :param response: the requests Response object
+        :rtype: bool
+        """
+        # define a failure as a non-200 response
+        return response.status_code == 200
+
+    def perform_request(self, request_kwargs):
+        """
+        Send a prepared request.  This is called from the worker threads, so it must NOT
+        touch the database.
+        """
+        host = urlparse(request_kwargs['url']).netloc
+
+        self.rate_limiter.wait(host)
+        response = self.session.request(timeout=self.timeout, **request_kwargs)
+
+        if response.status_code in self.retry_status_codes:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if retry_after is not None:
+                self.rate_limiter.back_off(host, retry_after)
+
+                if retry_after <= self.max_retry_after:
+                    self.rate_limiter.wait(host)
+                    response = self.session.request(timeout=self.timeout, **request_kwargs)
+
+        return self.handle_response(response)
+
+    def _send_prepared(self, request_kwargs):
+        try:
+            return self.perform_request(request_kwargs)
+        except Exception:
+            logger.exception('Failed to send request to {}'.format(request_kwargs['url']))
+            return False
+
+    def send_notification(self, notification):
+        return self.perform_request(self.prepare_request(notification))
+
+    def send_notifications_in_bulk(self, notifications):
+        # Build all the requests up front in this thread, since that can hit the database
+        prepared = []
+        for notification in notifications:
+            try:
+                prepared.append((notification, self.prepare_request(notification)))
+            except Exception:
+                logger.exception('Failed to prepare notification {}'.format(notification.id))
+
+        if not prepared:
+            return []
+
+        pool = ThreadPool(min(self.max_workers, len(prepared)))
+        try:
+            results = pool.map(self._send_prepared, [kwargs for _, kwargs in prepared])
+        finally:
+            pool.close()
+            pool.join()
+
+        return [notification for (notification, _), result in zip(prepared, results) if result]
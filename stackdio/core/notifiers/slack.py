@@ -17,37 +17,31 @@
 
 from __future__ import unicode_literals
 
+import json
 import logging
-import time
 
 import six
 from django.conf import settings
-from stackdio.core.config import StackdioConfigException
 from stackdio.core.notifications import registry
-from stackdio.core.notifiers.base import BaseNotifier
+from stackdio.core.notifiers.http import HTTPNotifier
 
 logger = logging.getLogger(__name__)
 
+SLACK_POST_MESSAGE_URL = 'https://slack.com/api/chat.postMessage'
 
-try:
-    from slackclient import SlackClient
-except ImportError:
-    SlackClient = None
 
-
-class SlackNotifier(BaseNotifier):
+class SlackNotifier(HTTPNotifier):
+    """
+    Posts notifications to a slack channel.  Messages are sent straight to the slack web API
+    through the pooled HTTPNotifier session, so slack's rate limits (and Retry-After) are
+    honored.  Slack allows roughly 1 message per second, so that's the default rate limit.
+    """
 
     needs_verification = False
 
-    def __init__(self, slack_api_token, post_as_user=True):
-        super(SlackNotifier, self).__init__()
-
-        if SlackClient is None:
-            raise StackdioConfigException('Could not load the slack client.  Be sure you have '
-                                          'installed stackdio-server with the `slack` extra.  '
-                                          '(pip install stackdio-server[slack])')
-
-        self.slackclient = SlackClient(slack_api_token)
+    def __init__(self, slack_api_token, post_as_user=True, rate_limit=1, **kwargs):
+        super(SlackNotifier, self).__init__(rate_limit=rate_limit, **kwargs)
+        self.slack_api_token = slack_api_token
         self.post_as_user = post_as_user
 
     @classmethod
@@ -56,7 +50,7 @@ class SlackNotifier(BaseNotifier):
             'channel',
         ]
 
-    def send_notification(self, notification):
+    def prepare_request(self, notification):
         ui_url = registry.get_ui_url(notification.content_object)
 
         notification_text = 'Event {} triggered on {}'.format(notification.event.tag,
@@ -81,24 +75,37 @@ class SlackNotifier(BaseNotifier):
                 'short': True,
             })
 
-        chat_kwargs = {
-            'channel': self.get_option(notification, 'channel'),
-            'as_user': self.post_as_user,
-            'attachments': [
-                {
-                    'fallback': notification_text,
-                    'author_name': 'stackd.io',
-                    'author_link': settings.STACKDIO_CONFIG.server_url,
-                    'title': six.text_type(notification.content_object.title),
-                    'title_link': ui_url,
-                    'text': notification_text,
-                    'fields': fields,
-                    'ts': int(notification.created.strftime('%s')),
-                }
-            ]
+        attachments = [
+            {
+                'fallback': notification_text,
+                'author_name': 'stackd.io',
+                'author_link': settings.STACKDIO_CONFIG.server_url,
+                'title': six.text_type(notification.content_object.title),
+                'title_link': ui_url,
+                'text': notification_text,
+                'fields': fields,
+                'ts': int(notification.created.strftime('%s')),
+            }
+        ]
+
+        return {
+            'method': 'POST',
+            'url': SLACK_POST_MESSAGE_URL,
+            'data': {
+                'token': self.slack_api_token,
+                'channel': self.get_option(notification, 'channel'),
+                'as_user': 'true' if self.post_as_user else 'false',
+                'attachments': json.dumps(attachments),
+            },
         }
-        time.time()
 
-        result = self.slackclient.api_call('chat.postMessage', **chat_kwargs)
+    def handle_response(self, response):
+        if response.status_code != 200:
+            return False
+
+        result = response.json()
+
+        if not result.get('ok'):
+            logger.warning('Slack refused the message: {}'.format(result.get('error')))
 
-        return result['ok']
+        return result.get('ok', False)
@@ -17,22 +17,21 @@
 
 from __future__ import unicode_literals
 
-import requests
 from stackdio.core.notifications import registry
-from stackdio.core.notifiers.base import BaseNotifier
+from stackdio.core.notifiers.http import HTTPNotifier
 
 
-class WebhookNotifier(BaseNotifier):
+class WebhookNotifier(HTTPNotifier):
     """
-    A basic webhook notifier.  Takes a single timeout parameter.
+    A basic webhook notifier.  Takes a timeout parameter, and optionally the
+    max_workers, rate_limit, and max_retry_after parameters from HTTPNotifier.
     """
 
     needs_verification = False
 
-    def __init__(self, default_method='POST', timeout=30):
-        super(WebhookNotifier, self).__init__()
+    def __init__(self, default_method='POST', timeout=30, **kwargs):
+        super(WebhookNotifier, self).__init__(timeout=timeout, **kwargs)
         self.default_method = default_method
-        self.timeout = timeout
 
     @classmethod
     def get_required_options(cls):
@@ -43,19 +42,15 @@ class WebhookNotifier(BaseNotifier):
     def get_request_data(self, notification):
         return registry.get_notification_serializer(notification).data
 
-    def send_notification(self, notification):
+    def prepare_request(self, notification):
         # just post to a URL
         url = self.get_option(notification, 'url')
 
         # Grab the request method
         method = self.get_option(notification, 'method') or self.default_method
 
-        r = requests.request(
-            method,
-            url,
-            json=self.get_request_data(notification),
-            timeout=self.timeout,
-        )
-
-        # define a failure as a non-200 response
-        return r.status_code == 200
+        return {
+            'method': method,
+            'url': url,
+            'json': self.get_request_data(notification),
+        }
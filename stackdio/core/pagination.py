@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StackdioPageNumberPagination(PageNumberPagination):
+    """
+    The default page number pagination, with the ability to skip the COUNT(*) query
+    by passing `count=false`.  Without a count we grab one extra row to find out if there
+    is a next page.  Useful for very large tables where the count is the expensive part.
+    """
+    count_query_param = 'count'
+
+    false_values = ('false', 'False', 'no', 'No', '0')
+
+    skip_count = False
+    has_next = False
+    page_number = 1
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.skip_count = request.query_params.get(self.count_query_param) in self.false_values
+
+        if not self.skip_count:
+            return super(StackdioPageNumberPagination, self).paginate_queryset(queryset,
+                                                                               request,
+                                                                               view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+            if self.page_number < 1:
+                raise ValueError()
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='That page number is not a valid integer',
+            ))
+
+        self.request = request
+
+        offset = (self.page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+
+        self.has_next = len(results) > page_size
+
+        if not results and self.page_number != 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.page_number,
+                message='That page contains no results',
+            ))
+
+        return results[:page_size]
+
+    def get_paginated_response(self, data):
+        if not self.skip_count:
+            return super(StackdioPageNumberPagination, self).get_paginated_response(data)
+
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+    def get_next_link(self):
+        if not self.skip_count:
+            return super(StackdioPageNumberPagination, self).get_next_link()
+
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if not self.skip_count:
+            return super(StackdioPageNumberPagination, self).get_previous_link()
+
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+
+class StackdioCursorPagination(CursorPagination):
+    """
+    Cursor pagination for high-volume tables (like history) keyed on (created, id).
+    No COUNT(*) and no OFFSET scan, so deep pages cost the same as the first one.
+    The model should have an index covering these fields.
+    """
+    ordering = ('-created', '-id')
+
+    page_size_query_param = 'page_size'
+
+    max_page_size = 500
+
+    def get_page_size(self, request):
+        # DRF's CursorPagination ignores page_size_query_param & max_page_size
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
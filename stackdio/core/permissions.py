@@ -18,14 +18,118 @@
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict
+from itertools import chain
 
+import six
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.http import Http404
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from rest_framework import permissions
 
 logger = logging.getLogger(__name__)
 
 
+class ObjectPermissionResolver(object):
+    """
+    Serves a user's object permissions (both direct and group-derived) from memory.
+    Call prefetch() with a page of objects to load all of their permissions in
+    2 queries per model - anything that wasn't prefetched gets loaded on first use.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._perm_cache = {}
+
+    @staticmethod
+    def _get_key(obj):
+        # get_for_model is cached by django, so this doesn't hit the database
+        content_type = ContentType.objects.get_for_model(obj)
+        return content_type.id, six.text_type(obj.pk)
+
+    def _load_perms(self, content_type_id, object_pks):
+        for object_pk in object_pks:
+            self._perm_cache[(content_type_id, object_pk)] = set()
+
+        user_perms = UserObjectPermission.objects.filter(
+            user=self.user,
+            content_type_id=content_type_id,
+            object_pk__in=object_pks,
+        ).values_list('object_pk', 'permission__codename')
+
+        group_perms = GroupObjectPermission.objects.filter(
+            group__user=self.user,
+            content_type_id=content_type_id,
+            object_pk__in=object_pks,
+        ).values_list('object_pk', 'permission__codename')
+
+        for object_pk, codename in chain(user_perms, group_perms):
+            self._perm_cache[(content_type_id, object_pk)].add(codename)
+
+    def prefetch(self, objects):
+        """
+        Load the permissions for all the given objects up front.
+        """
+        # Inactive users & superusers never look at their object permissions
+        if not self.user.is_active or self.user.is_superuser:
+            return
+
+        pks_by_content_type = defaultdict(set)
+        for obj in objects:
+            key = self._get_key(obj)
+            if key not in self._perm_cache:
+                pks_by_content_type[key[0]].add(key[1])
+
+        for content_type_id, object_pks in pks_by_content_type.items():
+            self._load_perms(content_type_id, object_pks)
+
+    def get_perms(self, obj):
+        """
+        Get the set of permission codenames the user has on the given object
+        """
+        key = self._get_key(obj)
+        if key not in self._perm_cache:
+            self._load_perms(key[0], [key[1]])
+        return self._perm_cache[key]
+
+    def has_perm(self, perm, obj):
+        if not self.user.is_active:
+            return False
+
+        if self.user.is_superuser:
+            return True
+
+        if obj.pk is None:
+            return self.user.has_perm(perm, obj)
+
+        if '.' in perm:
+            app_label, codename = perm.split('.', 1)
+            if app_label != obj._meta.app_label:
+                # Leave the mismatched case up to the auth backends
+                return self.user.has_perm(perm, obj)
+        else:
+            codename = perm
+
+        return codename in self.get_perms(obj)
+
+    def has_perms(self, perm_list, obj):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def clear(self):
+        self._perm_cache = {}
+
+
+def get_permission_resolver(user):
+    """
+    Get the permission resolver for a user.  It lives on the user object (just like
+    django's own permission cache), so it lasts for the rest of the request.
+    """
+    if not hasattr(user, '_stackdio_perm_resolver'):
+        user._stackdio_perm_resolver = ObjectPermissionResolver(user)
+    return user._stackdio_perm_resolver
+
+
 def log_permissions(cls):
     """
     decorator to log some things about permissions.
@@ -158,12 +262,12 @@ class StackdioParentPermissions(permissions.DjangoObjectPermissions):
         )
 
         model_cls = queryset.model
-        user = request.user
+        resolver = get_permission_resolver(request.user)
         obj = view.get_parent_object()
 
         perms = self.get_required_object_permissions(request.method, model_cls)
 
-        if not user.has_perms(perms, obj):
+        if not resolver.has_perms(perms, obj):
             # If the user does not have permissions we need to determine if
             # they have read permissions to see 403, or not, and simply see
             # a 404 response.
@@ -176,7 +280,7 @@ class StackdioParentPermissions(permissions.DjangoObjectPermissions):
                 raise Http404
 
             # Check for base required permissions
-            if not user.has_perms(base_required_perms, obj):
+            if not resolver.has_perms(base_required_perms, obj):
                 raise Http404
 
             # Has permissions to view 403
@@ -32,10 +32,22 @@
 
 from __future__ import unicode_literals
 
+from itertools import islice
+
 from django.db.models.query import QuerySet
+from stackdio.core.caching import prefetch_cached
 
 
 class TransformQuerySet(QuerySet):
+    """
+    A QuerySet that runs transform functions over its results.  Transforms are run lazily
+    on chunks of at most `transform_chunk_size` results as they're iterated over, so a
+    sliced queryset (like a page) only transforms the rows it actually returns, and a big
+    one never has to transform everything at once.
+    """
+
+    transform_chunk_size = 100
+
     def __init__(self, *args, **kwargs):
         super(TransformQuerySet, self).__init__(*args, **kwargs)
         self._transform_fns = []
@@ -50,11 +62,28 @@ class TransformQuerySet(QuerySet):
         c._transform_fns.append(fn)
         return c
 
+    def prefetch_cached(self, *names):
+        """
+        Resolve the given @django_cache methods / properties for all the results at once
+        (see stackdio.core.caching.prefetch_cached)
+        """
+        return self.transform(lambda results: prefetch_cached(results, *names))
+
     def iterator(self):
         result_iter = super(TransformQuerySet, self).iterator()
         if self._transform_fns:
-            results = list(result_iter)
+            return self._transform_iterator(result_iter)
+        return result_iter
+
+    def _transform_iterator(self, result_iter):
+        while True:
+            results = list(islice(result_iter, self.transform_chunk_size))
+
+            if not results:
+                return
+
             for fn in self._transform_fns:
                 fn(results)
-            return iter(results)
-        return result_iter
+
+            for result in results:
+                yield result
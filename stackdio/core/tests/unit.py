@@ -18,12 +18,36 @@
 from __future__ import unicode_literals
 
 import logging
+import uuid
+from datetime import timedelta
 
+import mock
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
 from django.http import Http404
+from django.test import override_settings
+from django.utils import timezone
 from guardian.shortcuts import assign_perm, remove_perm
 from rest_framework.serializers import ValidationError
 from stackdio.api.cloud.models import CloudAccount
-from stackdio.core import shortcuts, viewsets
+from stackdio.core import permissions, shortcuts, viewsets
+from stackdio.core.caching import cache_scope, delete_cached, prefetch_cached
+from stackdio.core.decorators import django_cache
+from stackdio.core.events import trigger_event
+from stackdio.core.models import Event, Label, OutboxEvent
+from stackdio.core.notifications.models import (
+    Notification,
+    NotificationChannel,
+    NotificationHandler,
+)
+from stackdio.core.notifications.tasks import (
+    OUTBOX_BATCH_NAMESPACE,
+    get_retry_delay,
+    record_handler_results,
+    relay_events,
+)
+from stackdio.core.queryset_transform import TransformQuerySet
 from stackdio.core.tests.utils import StackdioTestCase, group_has_perm
 
 logger = logging.getLogger(__name__)
@@ -716,3 +740,367 @@ class ObjectPermissionsViewSetTestCase(StackdioTestCase):
 
         for perm in CloudAccount.object_permissions:
             self.assertFalse(self.user.has_perm('cloud.%s_cloudaccount' % perm, self.account))
+
+
+class ObjectPermissionResolverTestCase(StackdioTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(ObjectPermissionResolverTestCase, cls).setUpTestData()
+
+        for i in range(3):
+            CloudAccount.objects.create(
+                provider_id=1,
+                title='test{}'.format(i),
+                description='test',
+                vpc_id='vpc-blah',
+                region_id=1,
+            )
+
+    def test_matches_has_perm(self):
+        accounts = list(CloudAccount.objects.order_by('id'))
+
+        assign_perm('cloud.view_cloudaccount', self.user, accounts[0])
+        assign_perm('cloud.update_cloudaccount', self.group, accounts[0])
+        assign_perm('cloud.view_cloudaccount', self.group, accounts[1])
+
+        resolver = permissions.ObjectPermissionResolver(self.user)
+
+        with self.assertNumQueries(2):
+            resolver.prefetch(accounts)
+
+        with self.assertNumQueries(0):
+            resolved = [
+                [resolver.has_perm('cloud.%s_cloudaccount' % perm, account)
+                 for perm in CloudAccount.object_permissions]
+                for account in accounts
+            ]
+
+        expected = [
+            [self.user.has_perm('cloud.%s_cloudaccount' % perm, account)
+             for perm in CloudAccount.object_permissions]
+            for account in accounts
+        ]
+
+        self.assertEqual(resolved, expected)
+
+    def test_superuser(self):
+        resolver = permissions.ObjectPermissionResolver(self.admin)
+        account = CloudAccount.objects.first()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(resolver.has_perm('cloud.admin_cloudaccount', account))
+
+
+def get_many_values(things):
+    for thing in things:
+        thing.calls += 1
+    return dict((thing.id, 'many-{}'.format(thing.id)) for thing in things)
+
+
+class CachedThing(object):
+
+    def __init__(self, thing_id):
+        self.id = thing_id
+        self.calls = 0
+
+    @property
+    @django_cache('thing-{id}-value')
+    def value(self):
+        self.calls += 1
+        return 'value-{}'.format(self.id)
+
+    @property
+    @django_cache('thing-{id}-other', many=get_many_values)
+    def other(self):
+        self.calls += 1
+        return 'other-{}'.format(self.id)
+
+    @property
+    def uncached(self):
+        return 'uncached-{}'.format(self.id)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheScopeTestCase(StackdioTestCase):
+
+    def setUp(self):
+        super(CacheScopeTestCase, self).setUp()
+        cache.clear()
+
+    def test_no_scope(self):
+        thing = CachedThing(1)
+
+        self.assertEqual(thing.value, 'value-1')
+        self.assertEqual(thing.value, 'value-1')
+        self.assertEqual(thing.calls, 1)
+
+        # Without a scope everything comes straight from the django cache
+        cache.set('thing-1-value', 'changed')
+        self.assertEqual(thing.value, 'changed')
+
+    def test_memoized_in_scope(self):
+        thing = CachedThing(1)
+
+        with cache_scope() as scope:
+            self.assertEqual(thing.value, 'value-1')
+
+            # Changes behind our back aren't seen for the rest of the scope
+            cache.set('thing-1-value', 'changed')
+            self.assertEqual(thing.value, 'value-1')
+
+            self.assertEqual(scope.stats['misses'], 1)
+            self.assertEqual(scope.stats['memo_hits'], 1)
+
+        self.assertEqual(thing.value, 'changed')
+
+    def test_delete_cached(self):
+        thing = CachedThing(1)
+
+        with cache_scope():
+            self.assertEqual(thing.value, 'value-1')
+
+            delete_cached(['thing-1-value'])
+
+            self.assertEqual(thing.value, 'value-1')
+            self.assertEqual(thing.calls, 2)
+
+    def test_prefetch_cached(self):
+        things = [CachedThing(i) for i in range(5)]
+
+        for thing in things[:3]:
+            cache.set('thing-{}-value'.format(thing.id), 'cached')
+
+        with cache_scope() as scope:
+            prefetch_cached(things, 'value')
+
+            self.assertEqual(scope.stats['prefetched'], 3)
+
+            self.assertEqual([thing.value for thing in things],
+                             ['cached', 'cached', 'cached', 'value-3', 'value-4'])
+            self.assertEqual(scope.stats['memo_hits'], 3)
+            self.assertEqual(scope.stats['misses'], 2)
+
+    def test_prefetch_cached_many(self):
+        things = [CachedThing(i) for i in range(5)]
+
+        cache.set('thing-0-other', 'cached')
+
+        with cache_scope() as scope:
+            prefetch_cached(things, 'other')
+
+            self.assertEqual(scope.stats['prefetched'], 1)
+            self.assertEqual(scope.stats['batch_misses'], 4)
+
+            self.assertEqual([thing.other for thing in things],
+                             ['cached', 'many-1', 'many-2', 'many-3', 'many-4'])
+            self.assertEqual(scope.stats['memo_hits'], 5)
+            self.assertEqual(scope.stats['misses'], 0)
+
+        # The batch results were written back to the django cache too
+        self.assertEqual(cache.get('thing-4-other'), 'many-4')
+
+    def test_prefetch_cached_not_cached(self):
+        with cache_scope():
+            with self.assertRaises(ValueError):
+                prefetch_cached([CachedThing(1)], 'uncached')
+
+
+class SmallChunkQuerySet(TransformQuerySet):
+    transform_chunk_size = 2
+
+
+class TransformQuerySetTestCase(StackdioTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super(TransformQuerySetTestCase, cls).setUpTestData()
+
+        ctype = ContentType.objects.get_for_model(Label)
+
+        for i in range(5):
+            Label.objects.create(key='key-{}'.format(i), content_type=ctype, object_id=1)
+
+    def setUp(self):
+        super(TransformQuerySetTestCase, self).setUp()
+        self.chunks = []
+
+    def get_queryset(self):
+        return SmallChunkQuerySet(model=Label).order_by('key').transform(
+            lambda results: self.chunks.append([label.key for label in results])
+        )
+
+    def test_transforms_in_chunks(self):
+        labels = list(self.get_queryset())
+
+        self.assertEqual(len(labels), 5)
+        self.assertEqual(self.chunks, [['key-0', 'key-1'], ['key-2', 'key-3'], ['key-4']])
+
+    def test_only_transforms_slice(self):
+        labels = list(self.get_queryset()[1:3])
+
+        self.assertEqual([label.key for label in labels], ['key-1', 'key-2'])
+        self.assertEqual(self.chunks, [['key-1', 'key-2']])
+
+    def test_lazy(self):
+        iterator = self.get_queryset().iterator()
+
+        self.assertEqual(self.chunks, [])
+
+        next(iterator)
+
+        self.assertEqual(self.chunks, [['key-0', 'key-1']])
+
+
+class RetryDelayTestCase(StackdioTestCase):
+
+    def test_backoff(self):
+        # Take the top of the jitter range to see the raw backoff
+        with mock.patch('random.uniform', side_effect=lambda low, high: high):
+            delays = [get_retry_delay(i).total_seconds() for i in range(7)]
+
+        self.assertEqual(delays, [60, 60, 120, 240, 480, 960, 1920])
+
+    def test_cap(self):
+        with mock.patch('random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual(get_retry_delay(7).total_seconds(), 3600)
+            self.assertEqual(get_retry_delay(100).total_seconds(), 3600)
+
+    def test_jitter_bounds(self):
+        for failed_count in (1, 3, 100):
+            with mock.patch('random.uniform', side_effect=lambda low, high: high):
+                delay = get_retry_delay(failed_count)
+
+            for _ in range(20):
+                jittered = get_retry_delay(failed_count)
+                self.assertGreaterEqual(jittered, delay / 2)
+                self.assertLessEqual(jittered, delay)
+
+
+class HandlerCircuitBreakerTestCase(StackdioTestCase):
+
+    def setUp(self):
+        super(HandlerCircuitBreakerTestCase, self).setUp()
+
+        channel = NotificationChannel.objects.create(name='test', auth_object=self.user)
+
+        self.handler = NotificationHandler.objects.create(notifier='email', channel=channel)
+        self.other_handler = NotificationHandler.objects.create(notifier='email',
+                                                                channel=channel)
+
+    def test_failures_suspend(self):
+        record_handler_results([], [self.handler.id])
+        record_handler_results([], [self.handler.id])
+
+        self.handler.refresh_from_db()
+        self.assertEqual(self.handler.consecutive_failures, 2)
+        self.assertIsNone(self.handler.suspended_until)
+
+        # The third failure in a row trips the circuit
+        record_handler_results([], [self.handler.id])
+
+        self.handler.refresh_from_db()
+        self.assertEqual(self.handler.consecutive_failures, 3)
+        self.assertGreater(self.handler.suspended_until, timezone.now())
+
+        # Other handlers are left alone
+        self.other_handler.refresh_from_db()
+        self.assertEqual(self.other_handler.consecutive_failures, 0)
+        self.assertIsNone(self.other_handler.suspended_until)
+
+    def test_success_resets(self):
+        NotificationHandler.objects.filter(id=self.handler.id).update(
+            consecutive_failures=5,
+            suspended_until=timezone.now() + timedelta(minutes=10),
+        )
+
+        record_handler_results([self.handler.id], [])
+
+        self.handler.refresh_from_db()
+        self.assertEqual(self.handler.consecutive_failures, 0)
+        self.assertIsNone(self.handler.suspended_until)
+
+    def test_success_wins(self):
+        NotificationHandler.objects.filter(id=self.handler.id).update(consecutive_failures=2)
+
+        # A handler that both failed and succeeded in the same batch is working
+        record_handler_results([self.handler.id], [self.handler.id])
+
+        self.handler.refresh_from_db()
+        self.assertEqual(self.handler.consecutive_failures, 0)
+        self.assertIsNone(self.handler.suspended_until)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EventRelayTestCase(StackdioTestCase):
+
+    def setUp(self):
+        super(EventRelayTestCase, self).setUp()
+
+        self.event = Event.objects.create(tag='test-event')
+
+        channel = NotificationChannel.objects.create(name='test', auth_object=self.user)
+        channel.events.add(self.event)
+        channel.add_subscriber(self.group)
+
+        NotificationHandler.objects.create(notifier='email', channel=channel, verified=True)
+
+        # Don't depend on the notifiers that happen to be configured
+        notifier_class = mock.Mock(split_group_notifications=False)
+        patcher = mock.patch('stackdio.core.notifications.utils.get_notifier_class',
+                             return_value=notifier_class)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rolled_back_event_not_relayed(self):
+        with mock.patch('stackdio.core.events.schedule_relay') as schedule_relay:
+            try:
+                with transaction.atomic():
+                    trigger_event('test-event', self.group)
+                    self.assertEqual(OutboxEvent.objects.count(), 1)
+                    raise RuntimeError('roll it back')
+            except RuntimeError:
+                pass
+
+            self.assertEqual(OutboxEvent.objects.count(), 0)
+
+            relay_events()
+
+        schedule_relay.assert_not_called()
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_relay(self):
+        trigger_event('test-event', self.group)
+
+        outbox_event = OutboxEvent.objects.get()
+
+        relay_events()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.batch,
+                         uuid.uuid5(OUTBOX_BATCH_NAMESPACE, '{}'.format(outbox_event.id)))
+        self.assertEqual(notification.content_object, self.group)
+        self.assertEqual(notification.auth_object, self.user)
+
+        # Relayed events are removed from the outbox
+        self.assertEqual(OutboxEvent.objects.count(), 0)
+
+    def test_relay_twice(self):
+        trigger_event('test-event', self.group)
+
+        outbox_event = OutboxEvent.objects.get()
+
+        relay_events()
+
+        batch = Notification.objects.get().batch
+
+        # As if the first relay had died before it could clear out the outbox
+        OutboxEvent.objects.create(id=outbox_event.id,
+                                   event_tag=outbox_event.event_tag,
+                                   content_type_id=outbox_event.content_type_id,
+                                   object_id=outbox_event.object_id)
+
+        relay_events()
+
+        self.assertEqual(list(Notification.objects.values_list('batch', flat=True)), [batch])
+        self.assertEqual(OutboxEvent.objects.count(), 0)
@@ -18,8 +18,12 @@
 from __future__ import unicode_literals
 
 import collections
+import hashlib
+import io
+import shutil
 from functools import wraps
 
+import six
 from django.conf import settings
 from django.conf.urls import url
 from django.views.decorators.cache import cache_page
@@ -155,3 +159,48 @@ def cached_url(regex, view, kwargs=None, name=None, prefix='',
     if user_sensitive:
         view = vary_on_cookie(view)
     return url(regex, view, kwargs, name, prefix)
+
+
+def get_file_hash(path):
+    """
+    Get the sha256 of the contents of the given file, or None if it doesn't exist
+    """
+    sha = hashlib.sha256()
+    try:
+        with io.open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                sha.update(chunk)
+    except (IOError, OSError):
+        return None
+    return sha.hexdigest()
+
+
+def write_file_if_changed(path, content):
+    """
+    Write content to the given path, but only if the file's contents would actually change.
+    Leaving unchanged files alone keeps their mtimes (and anything caching on them) intact.
+    :return: True if the file was written
+    """
+    if isinstance(content, six.text_type):
+        content = content.encode('utf-8')
+
+    if get_file_hash(path) == hashlib.sha256(content).hexdigest():
+        return False
+
+    with io.open(path, 'wb') as f:
+        f.write(content)
+
+    return True
+
+
+def copy_file_if_changed(src, dest):
+    """
+    Copy src to dest, but only if dest doesn't already have the same contents.
+    :return: True if the file was copied
+    """
+    if get_file_hash(src) == get_file_hash(dest):
+        return False
+
+    shutil.copyfile(src, dest)
+
+    return True
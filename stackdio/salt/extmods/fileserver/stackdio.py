@@ -31,9 +31,9 @@ than static environments in the config file.
 """
 from __future__ import absolute_import
 
-import errno
 import logging
 import os
+import shutil
 
 import salt.ext.six as six
 import salt.fileserver
@@ -49,6 +49,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stackdio.server.settings.produc
 
 __virtualname__ = 'stackdio'
 
+_hash_index = None
+
 
 def django_setup():
     """
@@ -68,6 +70,7 @@ from stackdio.api.cloud.models import CloudAccount  # NOQA
 from stackdio.api.formulas.models import Formula  # NOQA
 from stackdio.api.stacks.models import Stack  # NOQA
 from stackdio.api.environments.models import Environment  # NOQA
+from stackdio.salt.utils.hash_index import FileHashIndex  # NOQA
 
 
 def __virtual__():
@@ -89,6 +92,18 @@ def __virtual__():
     return __virtualname__
 
 
+def _get_hash_index():
+    """
+    The file hash index for this process, shared across all the saltenvs
+    """
+    global _hash_index
+
+    if _hash_index is None:
+        _hash_index = FileHashIndex(os.path.join(__opts__['cachedir'], 'stackdio/hash_index'))
+
+    return _hash_index
+
+
 def _get_storage_dir():
     salt_root_dir = __opts__.get('root_dir')
 
@@ -240,16 +255,17 @@ def serve_file(load, fnd):
 
 def update():
     """
-    When we are asked to update (regular interval) lets reap the cache
+    When we are asked to update (regular interval) lets compact the hash index
     """
-    try:
-        salt.fileserver.reap_fileserver_cache_dir(
-            os.path.join(__opts__['cachedir'], 'stackdio/hash'),
-            find_file
-        )
-    except (IOError, OSError):
-        # Hash file won't exist if no files have yet been served up
-        pass
+    # Hashes used to be cached in one file per served file, those aren't used anymore
+    legacy_hash_dir = os.path.join(__opts__['cachedir'], 'stackdio/hash')
+    if os.path.isdir(legacy_hash_dir):
+        shutil.rmtree(legacy_hash_dir, ignore_errors=True)
+
+    hash_index = _get_hash_index()
+    hash_index.compact()
+    log.debug('stackdio fileserver hash index stats: {0}, hit rate {1:.1%}'.format(
+        dict(hash_index.stats), hash_index.hit_rate))
 
     mtime_map_path = os.path.join(__opts__['cachedir'], 'stackdio/mtime_map')
     # data to send on event
@@ -262,8 +278,9 @@ def update():
         with salt.utils.fopen(mtime_map_path, 'r') as fp_:
             for line in fp_:
                 try:
-                    file_path, mtime = line.split(':', 1)
-                    old_mtime_map[file_path] = mtime
+                    # Paths may have colons in them, the mtime won't
+                    file_path, mtime = line.rsplit(':', 1)
+                    old_mtime_map[file_path] = float(mtime)
                 except ValueError:
                     # Document the invalid entry in the log
                     log.warning('Skipped invalid cache mtime entry in {0}: {1}'
@@ -282,8 +299,9 @@ def update():
         os.makedirs(mtime_map_path_dir)
     with salt.utils.fopen(mtime_map_path, 'w') as fp_:
         for file_path, mtime in six.iteritems(new_mtime_map):
+            # repr() so the mtime reads back as exactly the same float
             fp_.write('{file_path}:{mtime}\n'.format(file_path=file_path,
-                                                     mtime=mtime))
+                                                     mtime=repr(mtime)))
 
     if __opts__.get('fileserver_events', False):
         # if there is a change, fire an event
@@ -325,58 +343,12 @@ def file_hash(load, fnd):
     # set the hash_type as it is determined by config-- so mechanism won't change that
     ret['hash_type'] = __opts__['hash_type']
 
-    # check if the hash is cached
-    # cache file's contents should be "hash:mtime"
-    cache_path = os.path.join(__opts__['cachedir'],
-                              'stackdio/hash',
-                              load['saltenv'],
-                              u'{0}.hash.{1}'.format(fnd['rel'], __opts__['hash_type']))
-
-    # if we have a cache, serve that if the mtime hasn't changed
-    if os.path.exists(cache_path):
-        try:
-            with salt.utils.fopen(cache_path, 'r') as fp_:
-                try:
-                    hsum, mtime = fp_.read().split(':')
-                except ValueError:
-                    log.debug('Fileserver attempted to read incomplete cache file. Retrying.')
-                    # Delete the file since its incomplete (either corrupted or incomplete)
-                    try:
-                        os.unlink(cache_path)
-                    except OSError:
-                        pass
-                    return file_hash(load, fnd)
-                if os.path.getmtime(path) == mtime:
-                    # check if mtime changed
-                    ret['hsum'] = hsum
-                    return ret
-        except (os.error, IOError):  # Can't use Python select() because we need Windows support
-            log.debug("Fileserver encountered lock when reading cache file. Retrying.")
-            # Delete the file since its incomplete (either corrupted or incomplete)
-            try:
-                os.unlink(cache_path)
-            except OSError:
-                pass
-            return file_hash(load, fnd)
+    try:
+        ret['hsum'] = _get_hash_index().get_hash(path, ret['hash_type'])
+    except (IOError, OSError):
+        # The file went away
+        return {}
 
-    # if we don't have a cache entry-- lets make one
-    ret['hsum'] = salt.utils.get_hash(path, __opts__['hash_type'])
-    cache_dir = os.path.dirname(cache_path)
-    # make cache directory if it doesn't exist
-    if not os.path.exists(cache_dir):
-        try:
-            os.makedirs(cache_dir)
-        except OSError as err:
-            if err.errno == errno.EEXIST:
-                # rarely, the directory can be already concurrently created between
-                # the os.path.exists and the os.makedirs lines above
-                pass
-            else:
-                raise
-    # save the cache object "hash:mtime"
-    cache_object = '{0}:{1}'.format(ret['hsum'], os.path.getmtime(path))
-    with salt.utils.flopen(cache_path, 'w') as fp_:
-        fp_.write(cache_object)
     return ret
 
 
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from __future__ import unicode_literals
+
+import collections
+import io
+import logging
+import os
+import shutil
+import tempfile
+
+import mock
+import salt.utils
+import six
+from django.test import SimpleTestCase
+from stackdio.salt.utils.client import StackdioRunnerClient, get_state_timings, parse_duration
+from stackdio.salt.utils.hash_index import FileHashIndex, get_mtime_ns
+
+logger = logging.getLogger(__name__)
+
+
+def fake_orchestrate(mods, saltenv='base', test=None, exclude=None, pillar=None):
+    pass
+
+
+class RunnerClientTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super(RunnerClientTestCase, self).setUp()
+
+        # Skip __init__, we don't want a real salt config
+        self.client = StackdioRunnerClient.__new__(StackdioRunnerClient)
+        self.client.salt_runner = mock.MagicMock()
+        self.client.salt_runner.functions = {'state.orchestrate': fake_orchestrate}
+        getattr(self.client.salt_runner, 'async').return_value = {'jid': '1234'}
+
+    @mock.patch('stackdio.salt.utils.client.SaltJobListener')
+    def test_run_async_low_data(self, listener_cls):
+        listener = listener_cls.return_value.__enter__.return_value
+
+        self.client.run_async('state.orchestrate',
+                              arg=['stack_1_orchestrate', 'stacks.1'],
+                              kwarg={'pillar': {'foo': 'bar'}})
+
+        getattr(self.client.salt_runner, 'async').assert_called_once_with('state.orchestrate', {
+            'args': ['stack_1_orchestrate', 'stacks.1'],
+            'kwargs': {'pillar': {'foo': 'bar'}},
+        })
+        listener.wait_for_runner.assert_called_once_with('1234', mock.ANY)
+
+    def test_low_data_without_kwarg(self):
+        low = self.client.get_low_data('state.orchestrate', arg=['stack_1_orchestrate'])
+
+        self.assertEqual(low, {
+            'args': ['stack_1_orchestrate'],
+            'kwargs': {},
+        })
+
+
+class StateTimingsTestCase(SimpleTestCase):
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration('12.3 ms'), 12.3)
+        self.assertEqual(parse_duration('7'), 7.0)
+        self.assertEqual(parse_duration(12.3), 12.3)
+        self.assertEqual(parse_duration(5), 5.0)
+
+        # Never fail on something unexpected
+        self.assertEqual(parse_duration(''), 0)
+        self.assertEqual(parse_duration('ms'), 0)
+        self.assertEqual(parse_duration(None), 0)
+
+    def test_get_state_timings(self):
+        timings = get_state_timings({
+            'host1': {
+                'pkg_|-nginx_|-nginx_|-installed': {
+                    '__sls__': 'nginx',
+                    'start_time': '10:15:01.123456',
+                    'duration': '1500.5 ms',
+                    'result': True,
+                },
+                'service_|-nginx_|-nginx_|-running': {
+                    '__sls__': 'nginx',
+                    'start_time': '10:15:02.623456',
+                    'duration': 250.25,
+                    'result': False,
+                },
+                # No duration, nothing to record
+                'file_|-conf_|-/etc/nginx.conf_|-managed': {
+                    'result': True,
+                },
+            },
+            # Errors come back as a list of strings
+            'host2': ['Rendering SLS failed'],
+        }, stage='web')
+
+        timings = sorted(timings, key=lambda timing: timing['function'])
+
+        self.assertEqual(timings, [
+            {
+                'stage': 'web',
+                'host': 'host1',
+                'sls': 'nginx',
+                'state_id': 'nginx',
+                'function': 'pkg.installed',
+                'name': 'nginx',
+                'start_time': '10:15:01.123456',
+                'duration': 1500.5,
+                'result': True,
+            },
+            {
+                'stage': 'web',
+                'host': 'host1',
+                'sls': 'nginx',
+                'state_id': 'nginx',
+                'function': 'service.running',
+                'name': 'nginx',
+                'start_time': '10:15:02.623456',
+                'duration': 250.25,
+                'result': False,
+            },
+        ])
+
+
+class FileHashIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super(FileHashIndexTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tmp_dir, 'cache', 'hash_index')
+
+        self.files = []
+        for i in range(3):
+            self.files.append(self.write_file('file-{0}.sls'.format(i), 'contents {0}'.format(i)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(FileHashIndexTestCase, self).tearDown()
+
+    def write_file(self, name, contents):
+        path = os.path.join(self.tmp_dir, name)
+        with io.open(path, 'wt', encoding='utf-8') as f:
+            f.write(contents)
+        return path
+
+    def read_index_lines(self):
+        with io.open(self.index_path, 'rt', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_hashes(self):
+        index = FileHashIndex(self.index_path)
+
+        for path in self.files:
+            self.assertEqual(index.get_hash(path, 'sha256'), salt.utils.get_hash(path, 'sha256'))
+
+    def test_memory_hits(self):
+        index = FileHashIndex(self.index_path)
+
+        index.get_hash(self.files[0], 'sha256')
+        index.get_hash(self.files[0], 'sha256')
+
+        self.assertEqual(index.stats['misses'], 1)
+        self.assertEqual(index.stats['hits'], 1)
+        self.assertEqual(index.hit_rate, 0.5)
+
+    def test_hash_types_are_separate(self):
+        index = FileHashIndex(self.index_path)
+
+        sha256 = index.get_hash(self.files[0], 'sha256')
+        md5 = index.get_hash(self.files[0], 'md5')
+
+        self.assertNotEqual(sha256, md5)
+        self.assertEqual(index.stats['misses'], 2)
+
+    def test_shared_between_processes(self):
+        first = FileHashIndex(self.index_path)
+        second = FileHashIndex(self.index_path)
+
+        first.get_hash(self.files[0], 'sha256')
+
+        # second never saw it, but picks up what first appended instead of hashing again
+        second.get_hash(self.files[0], 'sha256')
+
+        self.assertEqual(second.stats['disk_hits'], 1)
+        self.assertEqual(second.stats['misses'], 0)
+
+    def test_changed_file(self):
+        index = FileHashIndex(self.index_path)
+
+        old_hash = index.get_hash(self.files[0], 'sha256')
+
+        self.write_file('file-0.sls', 'some longer new contents')
+
+        self.assertNotEqual(index.get_hash(self.files[0], 'sha256'), old_hash)
+        self.assertEqual(index.stats['misses'], 2)
+
+    def test_partial_line(self):
+        index = FileHashIndex(self.index_path)
+        index.get_hash(self.files[0], 'sha256')
+        index.get_hash(self.files[1], 'sha256')
+
+        first_line, second_line = self.read_index_lines()
+
+        # Somebody else is halfway through appending the second line
+        with io.open(self.index_path, 'wt', encoding='utf-8') as f:
+            f.write('{0}\n{1}'.format(first_line, second_line[:20]))
+
+        other = FileHashIndex(self.index_path)
+        other._read_index()
+        self.assertEqual(len(other._hashes), 1)
+
+        # Once the line is finished it gets read from where we left off
+        with io.open(self.index_path, 'at', encoding='utf-8') as f:
+            f.write('{0}\n'.format(second_line[20:]))
+
+        other.get_hash(self.files[1], 'sha256')
+        self.assertEqual(other.stats['disk_hits'], 1)
+        self.assertEqual(other.stats['misses'], 0)
+
+    def test_invalid_line(self):
+        index = FileHashIndex(self.index_path)
+        index.get_hash(self.files[0], 'sha256')
+
+        with io.open(self.index_path, 'at', encoding='utf-8') as f:
+            f.write('sha256 abc not-a-number 1 2 3 /some/path\n')
+
+        other = FileHashIndex(self.index_path)
+        other.get_hash(self.files[0], 'sha256')
+
+        self.assertEqual(other.stats['disk_hits'], 1)
+        self.assertEqual(len(other._hashes), 1)
+
+    def test_compact(self):
+        index = FileHashIndex(self.index_path)
+
+        for path in self.files:
+            index.get_hash(path, 'sha256')
+
+        # Hash the same file twice, then change one and delete another
+        index.get_hash(self.files[0], 'md5')
+        self.write_file('file-1.sls', 'some longer new contents')
+        os.remove(self.files[2])
+
+        index.compact()
+
+        lines = self.read_index_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all(line.endswith(self.files[0]) for line in lines))
+
+    def test_compact_switches_files(self):
+        first = FileHashIndex(self.index_path)
+        second = FileHashIndex(self.index_path)
+
+        first.get_hash(self.files[0], 'sha256')
+        second.get_hash(self.files[0], 'sha256')
+
+        old_inode = os.stat(self.index_path).st_ino
+
+        first.compact()
+
+        # compact() replaces the file rather than rewriting it in place
+        self.assertNotEqual(os.stat(self.index_path).st_ino, old_inode)
+
+        first.get_hash(self.files[1], 'sha256')
+
+        # second notices the new file and reads it from the top
+        second.get_hash(self.files[1], 'sha256')
+        self.assertEqual(second.stats['disk_hits'], 2)
+        self.assertEqual(second.stats['misses'], 0)
+
+    def test_mtime_ns(self):
+        stat_result = os.stat(self.files[0])
+        self.assertIsInstance(get_mtime_ns(stat_result), six.integer_types)
+
+        # python 2 doesn't have st_mtime_ns
+        py2_stat = collections.namedtuple('stat_result', ['st_mtime'])(1500000000.5)
+        self.assertEqual(get_mtime_ns(py2_stat), 1500000000500000000)
@@ -21,19 +21,22 @@ import io
 import logging
 import os
 import re
+import time
 from datetime import datetime
 
 import salt.client
 import salt.config
+import salt.minion
 import salt.runner
+import salt.utils.args
+import salt.utils.event
 import six
 import yaml
 from django.conf import settings
 
-from stackdio.salt.utils.logging import setup_logfile_logger
+from stackdio.salt.utils.logging import RunLogContext
 
 logger = logging.getLogger(__name__)
-root_logger = logging.getLogger()
 
 
 COLOR_REGEX = re.compile(r'\[0;[\d]+m')
@@ -154,47 +157,87 @@ def process_sls_result(sls_result, err_file):
     return ret
 
 
-def process_times(sls_result):
+def parse_duration(duration):
+    """
+    Salt reports durations (in ms) as either a number or a string like '12.3 ms'
+    """
+    try:
+        if isinstance(duration, six.string_types):
+            return float(duration.split()[0])
+        else:
+            return float(duration)
+    except (IndexError, TypeError, ValueError):
+        # Make sure we never fail
+        return 0
+
+
+def get_state_timings(host_results, stage=''):
+    """
+    Pull a timing record for every state on every host out of a highstate-style result.
+    :param host_results: a dict of host -> {state string: state result}
+    :param stage: the orchestration stage the results came from, if any
+    :return: a list of timing dicts
+    """
+    timings = []
+
+    for host, state_results in host_results.items():
+        if not isinstance(state_results, dict):
+            continue
+
+        for state_str, state_meta in state_results.items():
+            if not isinstance(state_meta, dict) or 'duration' not in state_meta:
+                continue
+
+            state = state_to_dict(state_str)
+
+            timings.append({
+                'stage': stage,
+                'host': host,
+                'sls': state_meta.get('__sls__') or '',
+                'state_id': state.get('declaration_id', ''),
+                'function': '{0}.{1}'.format(state.get('module', ''), state.get('func', '')),
+                'name': state.get('name', ''),
+                'start_time': state_meta.get('start_time') or '',
+                'duration': parse_duration(state_meta['duration']),
+                'result': bool(state_meta.get('result', False)),
+            })
+
+    return timings
+
+
+def process_times(sls_result, stage=''):
+    """
+    Log how long each module took to run, and return the timing records for the result.
+    """
     if 'ret' not in sls_result:
-        return
+        return []
 
-    max_time_map = {}
+    timings = get_state_timings(sls_result['ret'], stage)
 
-    for state_results in sls_result['ret'].values():
-        for stage_label, stage_result in state_results.items():
+    max_time_map = {}
 
-            # Pull out the duration
-            if 'duration' in stage_result:
-                current = max_time_map.get(stage_label, 0)
-                duration = stage_result['duration']
-                try:
-                    if isinstance(duration, six.string_types):
-                        new_time = float(duration.split()[0])
-                    else:
-                        new_time = float(duration)
-                except ValueError:
-                    # Make sure we never fail
-                    new_time = 0
+    for timing in timings:
+        stage_label = (timing['function'], timing['state_id'], timing['name'])
 
-                # Only set the duration if it's higher than what we already have
-                # This should be all we care about - since everything is running in parallel,
-                # the bottleneck is the max time
-                max_time_map[stage_label] = max(current, new_time)
+        # Only set the duration if it's higher than what we already have
+        # This should be all we care about - since everything is running in parallel,
+        # the bottleneck is the max time
+        max_time_map[stage_label] = max(max_time_map.get(stage_label, 0), timing['duration'])
 
     time_map = {}
 
     # aggregate into modules
-    for stage_label, max_time in max_time_map.items():
-        info_dict = state_to_dict(stage_label)
-
-        current = time_map.get(info_dict['module'], 0)
+    for (function, _, _), max_time in max_time_map.items():
+        module = function.split('.')[0]
 
         # Now we want the sum since these are NOT running in parallel.
-        time_map[info_dict['module']] = current + max_time
+        time_map[module] = time_map.get(module, 0) + max_time
 
     for smodule, time in sorted(time_map.items()):
         logger.info('Module {0} took {1} total seconds to run'.format(smodule, time / 1000))
 
+    return timings
+
 
 def process_orchestrate_result(result, err_file):
     ret = {
@@ -202,6 +245,7 @@ def process_orchestrate_result(result, err_file):
         'succeeded_sls': {},
         'failed_sls': {},
         'cancelled_sls': {},
+        'timings': [],
     }
 
     if 'data' not in result:
@@ -244,7 +288,7 @@ def process_orchestrate_result(result, err_file):
         logger.info('Processing stage {0}'.format(sls_dict['name']))
 
         if 'changes' in sls_result:
-            process_times(sls_result['changes'])
+            ret['timings'].extend(process_times(sls_result['changes'], sls_dict['name']))
 
         logger.info('')
 
@@ -335,8 +379,7 @@ class LoggingContextManager(object):
         self.log_file = None
         self.err_file = None
 
-        self._file_log_handler = None
-        self._old_handlers = []
+        self._run_log = None
 
     @staticmethod
     def _symlink(source, target):
@@ -362,26 +405,15 @@ class LoggingContextManager(object):
         self._symlink(self.log_file, log_symlink)
         self._symlink(self.err_file, err_symlink)
 
-        self._file_log_handler = setup_logfile_logger(self.log_file)
-
-        # Remove the other handlers, but save them so we can put them back later
-        for handler in root_logger.handlers:
-            if isinstance(handler, logging.StreamHandler):
-                self._old_handlers.append(handler)
-                root_logger.removeHandler(handler)
+        # Only this run's logging goes to the file, so concurrent runs don't mix
+        self._run_log = RunLogContext(self.log_file)
+        self._run_log.__enter__()
 
     def _tear_down_logging(self):
-        # First remove our new log handler if it exists
-        if self._file_log_handler:
-            root_logger.removeHandler(self._file_log_handler)
+        if self._run_log is not None:
+            self._run_log.__exit__(None, None, None)
 
-        # Then re-add the old handlers we removed earlier
-        for handler in self._old_handlers:
-            root_logger.addHandler(handler)
-
-        # Reset our variables
-        self._file_log_handler = None
-        self._old_handlers = []
+        self._run_log = None
 
     # Make it a context manager
     def __enter__(self):
@@ -399,18 +431,20 @@ class StackdioLocalClient(LoggingContextManager):
         self.salt_client = salt.client.LocalClient(settings.STACKDIO_CONFIG.salt_master_config)
 
     def run(self, target, function, **kwargs):
-        result = self.salt_client.cmd_iter(target, function, **kwargs)
+        result = iter_job_returns(self.salt_client, target, function, **kwargs)
 
         ret = {
             'failed': False,
             'failed_hosts': set(),
             'succeeded_hosts': set(),
             'num_hosts': 0,
+            'timings': [],
         }
 
         for i in result:
             for host, result in i.items():
                 ret['num_hosts'] += 1
+                ret['timings'].extend(get_state_timings({host: result.get('ret')}))
                 host_errors = self.process_result(host, result)
                 if host_errors:
                     # We failed.
@@ -466,5 +500,260 @@ class StackdioRunnerClient(LoggingContextManager):
         self.salt_runner = salt.runner.RunnerClient(opts)
 
     def orchestrate(self, **kwargs):
-        result = self.salt_runner.cmd('state.orchestrate', **kwargs)
+        if use_async_jobs():
+            result = self.run_async('state.orchestrate', **kwargs)
+        else:
+            result = self.salt_runner.cmd('state.orchestrate', **kwargs)
         return process_orchestrate_result(result, self.err_file)
+
+    def run_async(self, function, arg=None, kwarg=None):
+        """
+        Run a runner function in the background and wait for its return on the event bus,
+        rather than blocking on RunnerClient.cmd.
+        """
+        with SaltJobListener() as listener:
+            if listener.event is None:
+                return self.salt_runner.cmd(function, arg=arg, kwarg=kwarg)
+
+            # `async` is a keyword on newer pythons
+            job = getattr(self.salt_runner, 'async')(function,
+                                                     self.get_low_data(function, arg, kwarg))
+
+            return listener.wait_for_runner(job['jid'], get_async_job_timeout())
+
+    def get_low_data(self, function, arg=None, kwarg=None):
+        """
+        Build the low data for a runner function the same way RunnerClient.cmd does -
+        low() only looks at the `args` and `kwargs` keys.
+        """
+        arglist = salt.utils.args.parse_input(list(arg or []))
+
+        if kwarg:
+            kwarg = dict(kwarg, __kwarg__=True)
+            arglist.append(kwarg)
+
+        args, kwargs = salt.minion.load_args_and_kwargs(self.salt_runner.functions[function],
+                                                        arglist)
+
+        return {
+            'args': args,
+            'kwargs': kwargs,
+        }
+
+
+def use_async_jobs():
+    """
+    Whether salt jobs should be submitted asynchronously and gathered from the event bus
+    """
+    return settings.STACKDIO_CONFIG.get('salt_async_jobs', False)
+
+
+def get_async_job_timeout():
+    # The longest to wait on a single job, 0 means forever
+    return settings.STACKDIO_CONFIG.get('salt_async_job_timeout', 6 * 60 * 60)
+
+
+def iter_job_returns(client, tgt, fun, arg=(), timeout=None, expr_form='glob', kwarg=None,
+                     **kwargs):
+    """
+    Run a salt job and iterate over the minion returns, exactly like LocalClient.cmd_iter.
+    When salt_async_jobs is on, the job is submitted with run_job and the returns come in
+    over the master event bus instead of through a blocking client call.
+    """
+    if not use_async_jobs():
+        for ret in client.cmd_iter(tgt, fun, arg, timeout=timeout, expr_form=expr_form,
+                                   kwarg=kwarg, **kwargs):
+            yield ret
+        return
+
+    with SaltJobListener() as listener:
+        if listener.event is None:
+            for ret in client.cmd_iter(tgt, fun, arg, timeout=timeout, expr_form=expr_form,
+                                       kwarg=kwarg, **kwargs):
+                yield ret
+            return
+
+        pub_data = client.run_job(tgt, fun, arg, expr_form=expr_form, timeout=timeout,
+                                  kwarg=kwarg, **kwargs)
+
+        if not pub_data or not pub_data.get('jid'):
+            raise StackdioSaltClientException('Unable to submit {0} job to the salt '
+                                              'master'.format(fun))
+
+        jid = pub_data['jid']
+
+        def running_minions(minions):
+            ret = client.cmd(list(minions), 'saltutil.find_job', [jid], expr_form='list',
+                             timeout=client.opts['gather_job_timeout'])
+            return set(minion for minion, data in ret.items() if data)
+
+        for ret in listener.iter_returns(jid, pub_data.get('minions', []), running_minions,
+                                         check_interval=timeout or client.opts['timeout'],
+                                         timeout=get_async_job_timeout()):
+            yield ret
+
+
+class MasterEventListener(object):
+    """
+    Base context manager for listening on the salt master event bus.  If the bus isn't
+    available `event` is None, and subclasses should fall back to something else.
+    """
+
+    def __init__(self):
+        self.event = None
+
+    def __enter__(self):
+        opts = salt.config.client_config(settings.STACKDIO_CONFIG.salt_master_config)
+        try:
+            self.event = salt.utils.event.get_event(
+                'master',
+                opts['sock_dir'],
+                opts['transport'],
+                opts=opts,
+                listen=True,
+            )
+        except Exception:
+            logger.warning('Unable to listen on the salt event bus', exc_info=True)
+            self.event = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.event is not None:
+            self.event.destroy()
+            self.event = None
+
+
+class SaltJobListener(MasterEventListener):
+    """
+    Gathers job returns from the master event bus, so waiting on a long salt job is just
+    waiting on a socket instead of tying up a blocking client call.  Enter it *before*
+    submitting the job so no returns are missed.
+    """
+
+    minion_ret_tag = 'salt/job/{0}/ret/'
+
+    runner_ret_tag = 'salt/run/{0}/ret'
+
+    def iter_returns(self, jid, minions, running_minions, check_interval, timeout=0):
+        """
+        Yield the minion returns for a job as they come in, in the same format as
+        LocalClient.cmd_iter.  Whenever nothing has come back for check_interval seconds,
+        running_minions(pending) is called to find out which minions are still working on
+        the job, and we stop waiting on the rest.
+        """
+        pending = set(minions)
+        tag = self.minion_ret_tag.format(jid)
+        deadline = time.time() + timeout if timeout else None
+        last_check = time.time()
+
+        while pending:
+            now = time.time()
+
+            if deadline is not None and now >= deadline:
+                logger.warning('Timed out waiting on job {0} for minions: {1}'.format(
+                    jid, ', '.join(sorted(pending))))
+                return
+
+            if now - last_check >= check_interval:
+                still_running = running_minions(pending)
+                for minion in pending - still_running:
+                    logger.warning('Minion {0} did not return for job {1}'.format(minion, jid))
+                pending = pending & still_running
+                last_check = time.time()
+                continue
+
+            wait = check_interval - (now - last_check)
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+
+            ret = self.event.get_event(wait=wait, tag=tag, full=True)
+
+            if ret is None:
+                continue
+
+            data = ret.get('data') or {}
+            minion = data.get('id')
+
+            if minion not in pending:
+                continue
+
+            pending.discard(minion)
+            last_check = time.time()
+
+            host_ret = {'ret': data.get('return')}
+            if 'retcode' in data:
+                host_ret['retcode'] = data['retcode']
+
+            yield {minion: host_ret}
+
+    def wait_for_runner(self, jid, timeout=0):
+        """
+        Wait for a runner job to finish.
+        :return: the return of the runner function
+        """
+        tag = self.runner_ret_tag.format(jid)
+        deadline = time.time() + timeout if timeout else None
+
+        while deadline is None or time.time() < deadline:
+            wait = 60 if deadline is None else min(60, max(deadline - time.time(), 0))
+
+            ret = self.event.get_event(wait=wait, tag=tag, full=True)
+
+            if ret is not None:
+                return (ret.get('data') or {}).get('return')
+
+        raise StackdioSaltClientException('Timed out waiting on runner job {0}'.format(jid))
+
+
+class MinionReadinessListener(MasterEventListener):
+    """
+    Watches the master event bus for minions starting up, so callers can react the moment
+    a minion connects instead of polling all of them on an interval.  salt/auth events are
+    ignored on purpose - they fire before the minion is connected and able to answer.
+    Use it as a context manager, and enter it *before* pinging so no events are missed.
+    """
+
+    start_tag_regex = re.compile(r'^salt/minion/(?P<id>[^/]+)/start$')
+
+    def get_minion_id(self, tag, data):
+        """
+        Get the id of the minion that's ready from an event, or None if the event
+        doesn't mean a minion is ready.
+        """
+        match = self.start_tag_regex.match(tag)
+        if match:
+            return data.get('id', match.group('id'))
+
+        return None
+
+    def wait(self, minion_ids, timeout):
+        """
+        Wait up to timeout seconds for any of the given minions to start.
+        Returns as soon as one does, after collecting any others that are already queued up.
+        :return: the set of minion ids that became ready
+        """
+        minion_ids = set(minion_ids)
+
+        if self.event is None:
+            time.sleep(timeout)
+            return set()
+
+        ready = set()
+        deadline = time.time() + timeout
+
+        while True:
+            # Once something is ready, only drain whatever is already waiting
+            wait = 0 if ready else max(deadline - time.time(), 0)
+
+            ret = self.event.get_event(wait=wait, full=True)
+
+            if ret is None:
+                if ready or time.time() >= deadline:
+                    return ready
+                continue
+
+            minion_id = self.get_minion_id(ret.get('tag', ''), ret.get('data') or {})
+
+            if minion_id in minion_ids:
+                logger.debug('Minion {0} is ready'.format(minion_id))
+                ready.add(minion_id)
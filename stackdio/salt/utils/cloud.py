@@ -30,10 +30,9 @@ import salt.utils.cloud
 import six
 from msgpack.exceptions import ExtraData
 
-from stackdio.salt.utils.logging import setup_logfile_logger
+from stackdio.salt.utils.logging import RunLogContext
 
 logger = logging.getLogger(__name__)
-root_logger = logging.getLogger()
 
 
 SALT_CLOUD_CACHE_DIR = os.path.join(salt.syspaths.CACHE_DIR, 'cloud')
@@ -91,6 +90,10 @@ def catch_salt_cloud_map_failures(retry_times):
 
 class StackdioSaltCloudMap(salt.cloud.Map):
 
+    # A pre-fetched provider query (in the same format as map_providers_parallel returns)
+    # to use instead of querying every provider again
+    provider_query = None
+
     def interpolated_map(self, query='list_nodes', cached=False):
         """
         Override this to use the in-memory map instead of on disk.
@@ -173,7 +176,10 @@ class StackdioSaltCloudMap(salt.cloud.Map):
 
         matches = {}
         handled_drivers = {}
-        mapped_providers = self.map_providers_parallel(query, cached=cached)
+        if self.provider_query is not None:
+            mapped_providers = self.provider_query
+        else:
+            mapped_providers = self.map_providers_parallel(query, cached=cached)
         for alias, drivers in mapped_providers.items():
             for driver, vms in drivers.items():
                 if driver not in handled_drivers:
@@ -234,49 +240,74 @@ class StackdioSaltCloudMap(salt.cloud.Map):
 
 class StackdioSaltCloudClient(salt.cloud.CloudClient):
 
-    def launch_map(self, cloud_map, **kwargs):
+    def log_to_file(self, **kwargs):
         """
-        Runs a map from an already in-memory representation rather than an file on disk.
+        Get a context manager that sends all logging from the current run to the configured
+        salt-cloud log file while it's active.
         """
         opts = self._opts_defaults(**kwargs)
 
-        handler = setup_logfile_logger(
+        return RunLogContext(
             opts['log_file'],
             opts['log_level_logfile'],
             log_format=opts['log_fmt_logfile'],
             date_format=opts['log_datefmt_logfile'],
         )
 
-        try:
-            mapper = StackdioSaltCloudMap(opts)
-            mapper.rendered_map = cloud_map
+    def restrict_to_provider(self, provider):
+        """
+        Only talk to the given provider (cloud account) from now on, so queries and
+        launches don't touch any other accounts.
+        """
+        self.opts['providers'] = {provider: self.opts['providers'][provider]}
 
-            @catch_salt_cloud_map_failures(retry_times=5)
-            def do_launch():
-                # Do the launch
-                dmap = mapper.map_data()
-                return mapper.run_map(dmap)
+    def launch_map(self, cloud_map, manage_logging=True, **kwargs):
+        """
+        Runs a map from an already in-memory representation rather than an file on disk.
+        Pass manage_logging=False if the caller already set up the log file.
+        """
+        if not manage_logging:
+            return self._launch_map(cloud_map, **kwargs)
+
+        with self.log_to_file(**kwargs):
+            return self._launch_map(cloud_map, **kwargs)
+
+    def _launch_map(self, cloud_map, **kwargs):
+        mapper = StackdioSaltCloudMap(self._opts_defaults(**kwargs))
+        mapper.rendered_map = cloud_map
 
-            # This should catch our failures and retry
-            return salt.utils.cloud.simple_types_filter(do_launch())
+        @catch_salt_cloud_map_failures(retry_times=5)
+        def do_launch():
+            # Do the launch
+            dmap = mapper.map_data()
+            return mapper.run_map(dmap)
 
-        finally:
-            # Cancel the logging, but make sure it still gets cancelled if an exception is thrown
-            root_logger.removeHandler(handler)
+        # This should catch our failures and retry
+        return salt.utils.cloud.simple_types_filter(do_launch())
 
-    def destroy_map(self, cloud_map, hosts, **kwargs):
+    def destroy_map(self, cloud_map, hosts, provider_query=None, **kwargs):
         """
-        Destroy the named VMs
+        Destroy the named VMs.  Pass in provider_query to use an existing query
+        to figure out which VMs are running.
         """
         kwarg = kwargs.copy()
         kwarg['destroy'] = True
         mapper = StackdioSaltCloudMap(self._opts_defaults(**kwarg))
         mapper.rendered_map = cloud_map
+        mapper.provider_query = provider_query
+
+        @catch_salt_cloud_map_failures(retry_times=5)
+        def do_destroy():
+            try:
+                return self._do_destroy(mapper, hosts)
+            except Exception:
+                # Some VMs may already be gone, so query the providers again on a retry
+                mapper.provider_query = None
+                raise
 
         # This should catch our failures and retry
-        return self._do_destroy(mapper, hosts)
+        return do_destroy()
 
-    @catch_salt_cloud_map_failures(retry_times=5)
     def _do_destroy(self, mapper, hosts):
         """
         Here's where the destroying actually happens
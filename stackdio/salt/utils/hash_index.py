@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017,  Digital Reasoning
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+An index of file hashes for the stackdio fileserver.
+
+Hashes are keyed on what the file is rather than where it's served from -
+(device, inode, size, mtime_ns) - so a file that shows up in several saltenvs is only
+hashed once, and any change to it gets a new key.  The index is kept in memory, backed by
+a single append-only file in the master cachedir that all the master worker processes share.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import io
+import logging
+import os
+import threading
+
+import salt.utils
+import six
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_mtime_ns(stat_result):
+    """
+    The mtime of a stat result as integer nanoseconds (st_mtime_ns is python 3 only)
+    """
+    mtime_ns = getattr(stat_result, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat_result.st_mtime * 10 ** 9)
+    return mtime_ns
+
+
+def get_file_key(stat_result):
+    return (
+        stat_result.st_dev,
+        stat_result.st_ino,
+        stat_result.st_size,
+        get_mtime_ns(stat_result),
+    )
+
+
+class FileHashIndex(object):
+    """
+    Each line of the index file is `hash_type hsum dev inode size mtime_ns path`.  The path
+    is only kept so compact() can throw out entries for files that have changed or are gone.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+
+        # (hash_type, dev, inode, size, mtime_ns) -> (hsum, path)
+        self._hashes = {}
+
+        # How far into which index file we've read
+        self._index_id = None
+        self._offset = 0
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return float(hits) / total if total else 0.0
+
+    def get_hash(self, path, hash_type):
+        """
+        Get the hash of a file, only hashing it if no process has seen this version of it yet
+        """
+        key = (hash_type,) + get_file_key(os.stat(path))
+
+        with self._lock:
+            if key in self._hashes:
+                self.stats['hits'] += 1
+                return self._hashes[key][0]
+
+            # Another process may have hashed it already
+            self._read_index()
+
+            if key in self._hashes:
+                self.stats['disk_hits'] += 1
+                return self._hashes[key][0]
+
+        hsum = salt.utils.get_hash(path, hash_type)
+
+        # Don't record the hash if the file changed while we were hashing it
+        changed = (hash_type,) + get_file_key(os.stat(path)) != key
+
+        if isinstance(path, six.binary_type):
+            path = path.decode('utf-8')
+
+        with self._lock:
+            self.stats['misses'] += 1
+
+            if not changed:
+                self._hashes[key] = (hsum, path)
+                self._append(key, hsum, path)
+
+        return hsum
+
+    def compact(self):
+        """
+        Rewrite the index file with one line per file that still exists and hasn't changed.
+        Lines another process appends while this runs are lost, which just means that file
+        gets hashed again.
+        """
+        with self._lock:
+            self._read_index()
+
+            current = {}
+            for key, (hsum, path) in self._hashes.items():
+                try:
+                    file_key = get_file_key(os.stat(path))
+                except OSError:
+                    continue
+
+                if (key[0],) + file_key == key:
+                    current[key] = (hsum, path)
+
+            tmp_path = '{0}.{1}.tmp'.format(self.index_path, os.getpid())
+
+            try:
+                self._make_index_dir()
+                with io.open(tmp_path, 'wb') as f:
+                    for key, (hsum, path) in current.items():
+                        line = self._format_line(key, hsum, path)
+                        if line is not None:
+                            f.write(line)
+                    index_stat = os.fstat(f.fileno())
+
+                os.rename(tmp_path, self.index_path)
+            except (IOError, OSError):
+                logger.warning('Unable to compact the file hash index at '
+                               '{0}'.format(self.index_path), exc_info=True)
+                return
+
+            self._hashes = current
+            self._index_id = (index_stat.st_dev, index_stat.st_ino)
+            self._offset = index_stat.st_size
+
+    def _make_index_dir(self):
+        index_dir = os.path.dirname(self.index_path)
+        if not os.path.isdir(index_dir):
+            try:
+                os.makedirs(index_dir)
+            except OSError:
+                # Another process may have created it concurrently
+                if not os.path.isdir(index_dir):
+                    raise
+
+    def _read_index(self):
+        """
+        Pick up whatever has been added to the index file since we last looked.  Must be
+        called with the lock held.
+        """
+        try:
+            with io.open(self.index_path, 'rb') as f:
+                index_stat = os.fstat(f.fileno())
+                index_id = (index_stat.st_dev, index_stat.st_ino)
+
+                if index_id != self._index_id:
+                    # The file has been compacted (or it's our first look), start from the top
+                    self._index_id = index_id
+                    self._offset = 0
+
+                if index_stat.st_size <= self._offset:
+                    return
+
+                f.seek(self._offset)
+                data = f.read()
+        except (IOError, OSError):
+            # No files have been hashed yet
+            return
+
+        # Leave any partially written line for next time
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+
+        for line in data[:end].decode('utf-8').splitlines():
+            parts = line.split(' ', 6)
+            try:
+                hash_type, hsum, path = parts[0], parts[1], parts[6]
+                key = (hash_type,) + tuple(int(part) for part in parts[2:6])
+            except (IndexError, ValueError):
+                logger.warning('Skipped invalid file hash index entry in {0}: '
+                               '{1}'.format(self.index_path, line))
+                continue
+
+            self._hashes[key] = (hsum, path)
+
+    def _format_line(self, key, hsum, path):
+        if '\n' in path:
+            # Can't be stored in the file, it will just stay in memory
+            return None
+
+        hash_type, dev, inode, size, mtime_ns = key
+        return '{0} {1} {2} {3} {4} {5} {6}\n'.format(
+            hash_type, hsum, dev, inode, size, mtime_ns, path
+        ).encode('utf-8')
+
+    def _append(self, key, hsum, path):
+        line = self._format_line(key, hsum, path)
+
+        if line is None:
+            return
+
+        try:
+            self._make_index_dir()
+            # Appends this small are atomic, so processes don't need to coordinate
+            with io.open(self.index_path, 'ab') as f:
+                f.write(line)
+        except (IOError, OSError):
+            logger.warning('Unable to write to the file hash index at '
+                           '{0}'.format(self.index_path), exc_info=True)
@@ -19,6 +19,9 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 
 import logging
+import threading
+import uuid
+from functools import wraps
 from logging.handlers import WatchedFileHandler
 
 from salt.log.setup import LOG_LEVELS
@@ -27,10 +30,127 @@ from salt.log.setup import LOG_LEVELS
 logger = logging.getLogger(__name__)
 root_logger = logging.getLogger()
 
+# Which run the current thread is logging for.  Under eventlet / gevent this is patched
+# to be per-greenlet, so it works with any of the celery pool types.
+_run_context = threading.local()
 
-def setup_logfile_logger(log_path, log_level=None, log_format=None, date_format=None):
+_install_lock = threading.Lock()
+_run_log_handler = None
+
+
+def get_current_run_id():
+    return getattr(_run_context, 'run_id', None)
+
+
+def set_current_run_id(run_id):
+    """
+    Set the run id for the current thread.
+    :return: the previous run id, so it can be restored
+    """
+    previous = get_current_run_id()
+    _run_context.run_id = run_id
+    return previous
+
+
+def inherit_run_context(func):
+    """
+    Wrap func so that it logs to the current run when it's called from another thread
+    (e.g. from a ThreadPool).
+    """
+    run_id = get_current_run_id()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = set_current_run_id(run_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            set_current_run_id(previous)
+
+    return wrapper
+
+
+class RunIdFilter(logging.Filter):
+    """
+    Tags each record with the id of the run it was logged from, so it's also
+    available as %(run_id)s in log formats.
+    """
+
+    def filter(self, record):
+        record.run_id = get_current_run_id()
+        return True
+
+
+class OutsideRunFilter(logging.Filter):
+    """
+    Only lets through records that weren't logged from inside a run.  Runs have their
+    own log files, so we keep their (very chatty) output out of the worker logs.
+    """
+
+    def filter(self, record):
+        return get_current_run_id() is None
+
+
+class RunLogHandler(logging.Handler):
+    """
+    A single handler on the root logger that sends each record to the log file
+    for the run it was logged from.  Records logged outside of a run are ignored.
+    """
+
+    def __init__(self):
+        # logging.Handler is an old-style class on python 2
+        logging.Handler.__init__(self)
+        self.addFilter(RunIdFilter())
+        self._run_handlers = {}
+        self._run_lock = threading.Lock()
+
+    def add_run(self, run_id, handler):
+        with self._run_lock:
+            self._run_handlers[run_id] = handler
+
+    def remove_run(self, run_id):
+        with self._run_lock:
+            return self._run_handlers.pop(run_id, None)
+
+    def handle(self, record):
+        # Don't take our own lock here - each file handler has its own, so runs don't
+        # have to wait on each other.
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        handler = self._run_handlers.get(record.run_id)
+
+        if handler is not None and record.levelno >= handler.level:
+            handler.handle(record)
+
+
+def get_run_log_handler():
+    """
+    Get the shared run log handler, installing it on the root logger if it isn't there yet.
+    """
+    global _run_log_handler
+
+    with _install_lock:
+        if _run_log_handler is None:
+            _run_log_handler = RunLogHandler()
+            root_logger.addHandler(_run_log_handler)
+
+        # Keep run output out of the console / worker logs.  Do this every time, since
+        # celery may have set up its handlers after we were installed.
+        for handler in root_logger.handlers:
+            if isinstance(handler, logging.StreamHandler) and not any(
+                isinstance(f, OutsideRunFilter) for f in handler.filters
+            ):
+                handler.addFilter(OutsideRunFilter())
+
+    return _run_log_handler
+
+
+def create_logfile_handler(log_path, log_level=None, log_format=None, date_format=None):
     """
-    Set up logging to a file.
+    Create a handler for logging to a file.
     """
     # Create the handler
     handler = WatchedFileHandler(log_path, mode='a', encoding='utf-8', delay=0)
@@ -49,6 +169,42 @@ def setup_logfile_logger(log_path, log_level=None, log_format=None, date_format=
     formatter = logging.Formatter(log_format, datefmt=date_format)
 
     handler.setFormatter(formatter)
-    root_logger.addHandler(handler)
 
     return handler
+
+
+class RunLogContext(object):
+    """
+    Context manager that sends everything logged from the current thread (and anything
+    wrapped with inherit_run_context) to a log file while it's active.  Other threads and
+    greenlets keep logging wherever they were before, so several runs can safely share
+    a worker process.
+    """
+
+    def __init__(self, log_path, log_level=None, log_format=None, date_format=None):
+        self.log_path = log_path
+        self.log_level = log_level
+        self.log_format = log_format
+        self.date_format = date_format
+
+        self.run_id = None
+        self._file_handler = None
+        self._previous_run_id = None
+
+    def __enter__(self):
+        self.run_id = uuid.uuid4().hex
+        self._file_handler = create_logfile_handler(self.log_path, self.log_level,
+                                                    self.log_format, self.date_format)
+
+        get_run_log_handler().add_run(self.run_id, self._file_handler)
+        self._previous_run_id = set_current_run_id(self.run_id)
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        set_current_run_id(self._previous_run_id)
+        get_run_log_handler().remove_run(self.run_id)
+        self._file_handler.close()
+
+        self._file_handler = None
+        self._previous_run_id = None
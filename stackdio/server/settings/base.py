@@ -104,6 +104,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'stackdio.core.middleware.CacheScopeMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -352,6 +353,9 @@ LOGGING = {
 REST_FRAMEWORK = {
     'PAGE_SIZE': 50,
 
+    # Pagination - pass count=false to skip the COUNT(*) on large tables
+    'DEFAULT_PAGINATION_CLASS': 'stackdio.core.pagination.StackdioPageNumberPagination',
+
     # Filtering
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework.filters.DjangoFilterBackend',
@@ -406,33 +410,42 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_ACCEPT_CONTENT = ['json']
 
+# Salt-bound stack tasks spend nearly all their time waiting on salt.  With `salt_async_jobs`
+# turned on they only wait on the salt event bus, so they can be sent to their own queue
+# and served by a high-concurrency worker (e.g. `-P threads -c 32 -Q salt`) instead of
+# each one tying up a whole prefork worker process.
+SALT_TASK_QUEUE = STACKDIO_CONFIG.get('salt_task_queue', 'stacks')
+
 # Configure queues
 CELERY_ROUTES = {
     'environments.finish_environment': {'queue': 'environments'},
     'environments.highstate': {'queue': 'environments'},
     'environments.orchestrate': {'queue': 'environments'},
+    'environments.refresh_host_inventory': {'queue': 'short'},
     'environments.propagate_ssh': {'queue': 'environments'},
     'environments.single_sls': {'queue': 'environments'},
     'environments.sync_all': {'queue': 'environments'},
     'notifications.generate_notifications': {'queue': 'short'},
+    'notifications.relay_events': {'queue': 'short'},
     'notifications.resend_failed_notifications': {'queue': 'short'},
     'notifications.send_notification': {'queue': 'short'},
+    'notifications.send_notification_batch': {'queue': 'short'},
     'notifications.send_bulk_notifications': {'queue': 'short'},
     'stacks.destroy_hosts': {'queue': 'stacks'},
     'stacks.destroy_stack': {'queue': 'stacks'},
     'stacks.execute_action': {'queue': 'short'},
     'stacks.finish_stack': {'queue': 'stacks'},
-    'stacks.global_orchestrate': {'queue': 'stacks'},
-    'stacks.highstate': {'queue': 'stacks'},
+    'stacks.global_orchestrate': {'queue': SALT_TASK_QUEUE},
+    'stacks.highstate': {'queue': SALT_TASK_QUEUE},
     'stacks.launch_hosts': {'queue': 'stacks'},
-    'stacks.orchestrate': {'queue': 'stacks'},
-    'stacks.ping': {'queue': 'stacks'},
-    'stacks.propagate_ssh': {'queue': 'stacks'},
+    'stacks.orchestrate': {'queue': SALT_TASK_QUEUE},
+    'stacks.ping': {'queue': SALT_TASK_QUEUE},
+    'stacks.propagate_ssh': {'queue': SALT_TASK_QUEUE},
     'stacks.register_dns': {'queue': 'stacks'},
     'stacks.register_volume_delete': {'queue': 'stacks'},
     'stacks.run_command': {'queue': 'short'},
-    'stacks.single_sls': {'queue': 'stacks'},
-    'stacks.sync_all': {'queue': 'stacks'},
+    'stacks.single_sls': {'queue': SALT_TASK_QUEUE},
+    'stacks.sync_all': {'queue': SALT_TASK_QUEUE},
     'stacks.tag_infrastructure': {'queue': 'stacks'},
     'stacks.unregister_dns': {'queue': 'stacks'},
     'stacks.update_host_info': {'queue': 'short'},
@@ -445,9 +458,19 @@ CELERYBEAT_SCHEDULE = {
         'schedule': crontab(minute='*/5'),  # Execute every 5 minutes
         'args': (),
     },
+    'refresh-environment-host-inventory': {
+        'task': 'environments.refresh_host_inventory',
+        'schedule': crontab(minute='*/5'),  # Execute every 5 minutes
+        'args': (),
+    },
+    'relay-events': {
+        'task': 'notifications.relay_events',
+        'schedule': crontab(minute='*'),  # Execute every minute, in case a relay was missed
+        'args': (),
+    },
     'resend-failed-notifications': {
         'task': 'notifications.resend_failed_notifications',
-        'schedule': crontab(minute='*/10'),  # Execute every 10 minutes
+        'schedule': crontab(minute='*'),  # Execute every minute, only due ones get resent
         'args': (),
     }
 }
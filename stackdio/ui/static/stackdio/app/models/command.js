@@ -79,6 +79,33 @@ define([
 
     Command.constructor = Command;
 
+    // The output for a single host, only fetched once it's opened
+    function HostOutput(raw) {
+        this.host = raw.host;
+        this.size = raw.size;
+        this.outputUrl = raw.output_url;
+        this.output = ko.observable('');
+        this.loaded = false;
+    }
+
+    HostOutput.prototype.load = function () {
+        var self = this;
+        if (!this.loaded) {
+            this.loaded = true;
+            $.ajax({
+                method: 'GET',
+                url: this.outputUrl,
+                dataType: 'text'
+            }).done(function (output) {
+                self.output(output);
+            }).fail(function () {
+                self.loaded = false;
+            });
+        }
+        // Let the collapse toggle go through
+        return true;
+    };
+
     function processTime(time) {
         if (time.length) {
             return moment(time);
@@ -97,7 +124,9 @@ define([
         this.status(raw.status);
         this.hostTarget(raw.host_target);
         this.command(raw.command);
-        this.stdout(raw.std_out);
+        this.stdout(raw.std_out.map(function (output) {
+            return new HostOutput(output);
+        }));
         this.stderr(raw.std_err);
 
         switch (raw.status) {
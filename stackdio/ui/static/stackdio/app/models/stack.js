@@ -91,6 +91,10 @@ define([
         this.formulaVersions = ko.observableArray([]);
         this.latestLogs = ko.observableArray([]);
         this.historicalLogs = ko.observableArray([]);
+        this.slowestStates = ko.observableArray([]);
+        this.slowestStages = ko.observableArray([]);
+        this.slowestHosts = ko.observableArray([]);
+        this.timingRuns = ko.observableArray([]);
 
         if (needReload) {
             this.waiting = this.reload();
@@ -570,6 +574,22 @@ define([
         });
     };
 
+    Stack.prototype.loadTimingSummary = function () {
+        var self = this;
+        if (!this.raw.hasOwnProperty('timings')) {
+            this.raw.timings = this.raw.url + 'timings/';
+        }
+        return $.ajax({
+            method: 'GET',
+            url: this.raw.timings + 'summary/'
+        }).done(function (summary) {
+            self.timingRuns(summary.runs);
+            self.slowestStates(summary.slowest_states);
+            self.slowestStages(summary.slowest_stages);
+            self.slowestHosts(summary.slowest_hosts);
+        });
+    };
+
     Stack.prototype.runCommand = function (hostTarget, command) {
         var self = this;
         return $.ajax({
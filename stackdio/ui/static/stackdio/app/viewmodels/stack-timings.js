@@ -0,0 +1,57 @@
+/*!
+  * Copyright 2017,  Digital Reasoning
+  *
+  * Licensed under the Apache License, Version 2.0 (the "License");
+  * you may not use this file except in compliance with the License.
+  * You may obtain a copy of the License at
+  *
+  *     http://www.apache.org/licenses/LICENSE-2.0
+  *
+  * Unless required by applicable law or agreed to in writing, software
+  * distributed under the License is distributed on an "AS IS" BASIS,
+  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  * See the License for the specific language governing permissions and
+  * limitations under the License.
+  *
+*/
+
+define([
+    'jquery',
+    'knockout',
+    'models/stack'
+], function($, ko, Stack) {
+    'use strict';
+    return function () {
+        var self = this;
+
+        self.breadcrumbs = [
+            {
+                active: false,
+                title: 'Stacks',
+                href: '/stacks/'
+            },
+            {
+                active: false,
+                title: window.stackdio.stackTitle,
+                href: '/stacks/' + window.stackdio.stackId + '/'
+            },
+            {
+                active: true,
+                title: 'Timings'
+            }
+        ];
+
+        self.stack = new Stack(window.stackdio.stackId);
+
+        // Durations come back in milliseconds
+        self.seconds = function (duration) {
+            return (duration / 1000).toFixed(1) + 's';
+        };
+
+        self.reload = function () {
+            self.stack.loadTimingSummary();
+        };
+
+        self.reload();
+    }
+});
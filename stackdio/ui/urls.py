@@ -183,6 +183,10 @@ urlpatterns = (
                stacks.StackObjectPermissionsView.as_view(),
                name='stack-object-permissions'),
 
+    cached_url(r'^stacks/(?P<pk>[0-9]+)/timings/$',
+               stacks.StackTimingsView.as_view(),
+               name='stack-timings'),
+
     cached_url(r'^stacks/(?P<pk>[0-9]+)/logs/$',
                stacks.StackLogsView.as_view(),
                name='stack-logs'),
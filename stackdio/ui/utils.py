@@ -18,6 +18,7 @@
 from __future__ import unicode_literals
 
 from django.db.models import Model
+from stackdio.core.permissions import get_permission_resolver
 
 
 def get_object_list(user, model_cls, pk_field='id'):
@@ -25,12 +26,18 @@ def get_object_list(user, model_cls, pk_field='id'):
 
     model_name = model_cls._meta.model_name
 
+    objects = list(model_cls.objects.all())
+
+    # Grab all the permissions at once rather than 3 lookups per object
+    resolver = get_permission_resolver(user)
+    resolver.prefetch(objects)
+
     object_list = []
-    for obj in model_cls.objects.all():
-        if user.has_perm('view_%s' % model_name, obj):
+    for obj in objects:
+        if resolver.has_perm('view_%s' % model_name, obj):
             object_list.append({
                 'id': getattr(obj, pk_field),
-                'can_delete': user.has_perm('delete_%s' % model_name, obj),
-                'can_update': user.has_perm('update_%s' % model_name, obj),
+                'can_delete': resolver.has_perm('delete_%s' % model_name, obj),
+                'can_update': resolver.has_perm('update_%s' % model_name, obj),
             })
     return object_list
@@ -23,6 +23,7 @@ from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404, resolve_url
 from django.views.generic import TemplateView
 from stackdio.api.cloud.models import CloudAccount
+from stackdio.core.permissions import get_permission_resolver
 
 logger = logging.getLogger(__name__)
 
@@ -110,14 +111,16 @@ class ObjectDetailView(PageView):
 
         perm_str = '{}.{{}}_{}'.format(app_label, model_name)
 
-        if not self.request.user.has_perm(perm_str.format('view'), obj):
+        resolver = get_permission_resolver(self.request.user)
+
+        if not resolver.has_perm(perm_str.format('view'), obj):
             # Let the request through if it's allowed via user agent
             if not self.request.META.get('ALLOWED_FROM_USER_AGENT', False):
                 raise Http404()
         context[self.model_short_name] = obj
-        context['has_admin'] = self.request.user.has_perm(perm_str.format('admin'), obj)
-        context['has_delete'] = self.request.user.has_perm(perm_str.format('delete'), obj)
-        context['has_update'] = self.request.user.has_perm(perm_str.format('update'), obj)
+        context['has_admin'] = resolver.has_perm(perm_str.format('admin'), obj)
+        context['has_delete'] = resolver.has_perm(perm_str.format('delete'), obj)
+        context['has_update'] = resolver.has_perm(perm_str.format('update'), obj)
         context['page_id'] = self.page_id
         return context
 
@@ -166,6 +166,12 @@ class StackFormulaVersionsView(StackDetailView):
     page_id = 'formula-versions'
 
 
+class StackTimingsView(StackDetailView):
+    template_name = 'stacks/stack-timings.html'
+    viewmodel = 'viewmodels/stack-timings'
+    page_id = 'timings'
+
+
 class StackLogsView(StackDetailView):
     template_name = 'stacks/stack-logs.html'
     viewmodel = 'viewmodels/stack-logs'